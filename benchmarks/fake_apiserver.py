@@ -0,0 +1,472 @@
+"""
+A local stand-in for the Kubernetes API server, seeded with synthetic objects
+
+It implements the parts of the core/v1 API the k8s commands use: paginated lists,
+watches, pod create/read/patch/delete, delete collection and a pod exec websocket that
+answers without running anything. Every response can be delayed to mimic a remote
+cluster, and requests and bytes are counted so benchmarks can report them.
+
+Usage:
+    python -m benchmarks.fake_apiserver --namespaces 20 --pods 200 --nodes 100 --latency 0.02
+
+"""
+################################################### Python Import ##################################
+
+import base64
+import copy
+import hashlib
+import json
+import struct
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import click
+
+################################################### Project Import #################################
+
+from benchmarks.k8s_decode import synthetic_pod
+
+################################################### Main Declaration ###############################
+
+# Events kept for watches resuming from a resourceVersion, older ones answer 410 Gone
+EVENT_HISTORY = 20000
+
+# Seconds before a created pod is scheduled and running
+SCHEDULING_DELAY = 0.2
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def matches_labels(obj: Dict[str, Any], selector: Optional[str]) -> bool:
+    """
+    Evaluate an equality based label selector, e.g. "app=web,tier"
+    """
+    labels = obj["metadata"].get("labels") or {}
+    for term in filter(None, (selector or "").split(",")):
+        if "!=" in term:
+            key, value = term.split("!=", 1)
+            if labels.get(key) == value:
+                return False
+        elif "=" in term:
+            key, value = term.replace("==", "=").split("=", 1)
+            if labels.get(key) != value:
+                return False
+        elif term not in labels:
+            return False
+    return True
+
+
+def matches_fields(obj: Dict[str, Any], selector: Optional[str]) -> bool:
+    """
+    Evaluate a field selector, e.g. "metadata.name=web-1,status.phase!=Failed"
+    """
+    for term in filter(None, (selector or "").split(",")):
+        negate = "!=" in term
+        path, value = term.split("!=" if negate else "=", 1)
+        current: Any = obj
+        for part in path.lstrip("=").split("."):
+            current = (current or {}).get(part)
+        if (str(current) == value.lstrip("=")) == negate:
+            return False
+    return True
+
+
+class Store:
+    """
+    The objects of the fake cluster and their change events
+    """
+
+    def __init__(self):
+        self.changed = threading.Condition()
+        self.resource_version = 1000
+        self.oldest_version = self.resource_version
+        self.namespaces: Dict[str, Dict[str, Any]] = {}
+        self.nodes: Dict[str, Dict[str, Any]] = {}
+        self.pods: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.events: List[Tuple[int, str, Dict[str, Any]]] = []
+
+    def seed(self, namespaces: int, pods: int, nodes: int):
+        """
+        Create namespaces, nodes and pods spread over the nodes
+
+        Args:
+            namespaces (int): Number of namespaces, the first one is "default"
+            pods (int): Number of pods per namespace
+            nodes (int): Number of nodes
+        """
+        with self.changed:
+            for index in range(nodes):
+                name = f"node-{index}"
+                self.nodes[name] = {
+                    "metadata": {"name": name, "resourceVersion": "1",
+                                 "labels": {"kubernetes.io/hostname": name, "topology.kubernetes.io/zone": f"zone-{index % 3}"}},
+                    "spec": {},
+                    "status": {"conditions": [{"type": "Ready", "status": "True"}]},
+                }
+            for index in range(namespaces):
+                namespace = "default" if index == 0 else f"namespace-{index}"
+                self.namespaces[namespace] = {"metadata": {"name": namespace, "resourceVersion": "1"}}
+                for number in range(pods):
+                    pod = synthetic_pod(number)
+                    pod["metadata"].update(namespace=namespace, uid=str(uuid.uuid4()), resourceVersion="1")
+                    pod["spec"]["nodeName"] = f"node-{number % max(nodes, 1)}"
+                    self.pods[(namespace, pod["metadata"]["name"])] = pod
+
+    def record(self, kind: str, obj: Dict[str, Any]):
+        """
+        Bump the resourceVersion of a changed pod and notify the watches, lock held
+        """
+        self.resource_version += 1
+        obj["metadata"]["resourceVersion"] = str(self.resource_version)
+        self.events.append((self.resource_version, kind, copy.deepcopy(obj)))
+        if len(self.events) > EVENT_HISTORY:
+            dropped = self.events[:EVENT_HISTORY // 5]
+            del self.events[:EVENT_HISTORY // 5]
+            self.oldest_version = dropped[-1][0]
+        self.changed.notify_all()
+
+    def schedule(self, namespace: str, name: str):
+        """
+        Start a created pod on its pinned node, or on the first one
+        """
+        with self.changed:
+            pod = self.pods.get((namespace, name))
+            if pod is None:
+                return
+            try:
+                terms = pod["spec"]["affinity"]["nodeAffinity"]["requiredDuringSchedulingIgnoredDuringExecution"]
+                node = terms["nodeSelectorTerms"][0]["matchFields"][0]["values"][0]
+            except (KeyError, IndexError, TypeError):
+                node = pod["spec"].get("nodeName") or "node-0"
+            pod["spec"]["nodeName"] = node
+            pod["status"] = {
+                "phase": "Running",
+                "podIP": f"10.1.{len(self.pods) // 250 % 250}.{len(self.pods) % 250}",
+                "startTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "conditions": [{"type": "PodScheduled", "status": "True"}, {"type": "Ready", "status": "True"}],
+                "containerStatuses": [{
+                    "name": container["name"], "image": container.get("image", ""), "imageID": "",
+                    "containerID": f"containerd://{uuid.uuid4().hex}", "ready": True, "restartCount": 0,
+                    "state": {"running": {}},
+                } for container in pod["spec"]["containers"]],
+            }
+            self.record("MODIFIED", pod)
+
+
+class Counters:
+    """
+    Requests and bytes handled since the last reset
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def reset(self) -> Dict[str, int]:
+        """
+        Return the counters and start over
+        """
+        with self.lock:
+            snapshot = {"requests": self.requests, "bytes_in": self.bytes_in, "bytes_out": self.bytes_out}
+            self.requests = self.bytes_in = self.bytes_out = 0
+            return snapshot
+
+    def add(self, requests: int = 0, bytes_in: int = 0, bytes_out: int = 0):
+        """
+        Count a request or transferred bytes
+        """
+        with self.lock:
+            self.requests += requests
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    Serves the core/v1 endpoints used by notoil from the store of the server
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    server: "FakeApiServer"
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def send(self, data: bytes):
+        self.wfile.write(data)
+        self.server.counters.add(bytes_out=len(data))
+
+    def send_json(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        for key, value in {"Content-Type": "application/json", "Content-Length": str(len(data)), **(headers or {})}.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.send(data)
+
+    def send_status(self, status: int, reason: str, message: str = ""):
+        self.send_json(status, {"kind": "Status", "apiVersion": "v1", "status": "Failure", "code": status,
+                                "reason": reason, "message": message})
+
+    def send_chunk(self, data: bytes):
+        self.send(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def handle_request(self, method: str):
+        counters, store = self.server.counters, self.server.store
+        counters.add(requests=1)
+        body = None
+        if self.headers.get("Content-Length"):
+            raw = self.rfile.read(int(self.headers["Content-Length"]))
+            counters.add(bytes_in=len(raw))
+            body = json.loads(raw or b"null")
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        parts = url.path.strip("/").split("/")[2:] if url.path.startswith("/api/v1/") else None
+
+        if parts == ["namespaces"] and method == "GET":
+            return self.list_or_watch("namespace", None, query, lambda: store.namespaces.values())
+        if parts == ["nodes"] and method == "GET":
+            return self.list_or_watch("node", None, query, lambda: store.nodes.values())
+        if parts == ["pods"] and method == "GET":
+            return self.list_or_watch("pod", None, query, lambda: [store.pods[key] for key in sorted(store.pods)])
+        if not parts or len(parts) < 3 or parts[0] != "namespaces" or parts[2] != "pods":
+            return self.send_status(404, "NotFound", f"{method} {url.path} is not served")
+
+        namespace = parts[1]
+        if len(parts) == 3:
+            if method == "GET":
+                return self.list_or_watch("pod", namespace, query, lambda: [
+                    store.pods[key] for key in sorted(store.pods) if key[0] == namespace])
+            if method == "POST":
+                return self.create_pod(namespace, body)
+            if method == "DELETE":
+                return self.delete_collection(namespace, query)
+        if len(parts) == 5 and parts[4] == "exec":
+            return self.exec_websocket(namespace, parts[3], parse_qs(url.query))
+        if len(parts) == 4:
+            return self.pod(method, namespace, parts[3], body)
+        return self.send_status(404, "NotFound")
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        self.handle_request("GET")
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        self.handle_request("POST")
+
+    def do_PATCH(self):  # pylint: disable=invalid-name
+        self.handle_request("PATCH")
+
+    def do_DELETE(self):  # pylint: disable=invalid-name
+        self.handle_request("DELETE")
+
+    def list_or_watch(self, kind: str, namespace: Optional[str], query: Dict[str, str], objects):
+        if query.get("watch", "").lower() in ("true", "1"):
+            return self.watch(kind, namespace, query)
+
+        store = self.server.store
+        with store.changed:
+            items = [copy.deepcopy(obj) for obj in objects()
+                     if matches_labels(obj, query.get("labelSelector")) and matches_fields(obj, query.get("fieldSelector"))]
+            resource_version = str(store.resource_version)
+
+        start, limit = int(query.get("continue") or 0), int(query.get("limit") or 0) or len(items)
+        metadata = {"resourceVersion": resource_version}
+        if start + limit < len(items):
+            metadata["continue"] = str(start + limit)
+        self.send_json(200, {"kind": "List", "apiVersion": "v1", "metadata": metadata, "items": items[start:start + limit]})
+
+    def watch(self, kind: str, namespace: Optional[str], query: Dict[str, str]):
+        store = self.server.store
+        version = int(query.get("resourceVersion") or store.resource_version)
+        deadline = time.monotonic() + float(query.get("timeoutSeconds") or 1800)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            if version < store.oldest_version:
+                self.send_chunk(json.dumps({"type": "ERROR", "object": {
+                    "kind": "Status", "code": 410, "reason": "Expired", "message": "too old resource version"}}).encode() + b"\n")
+            while kind == "pod" and version >= store.oldest_version and time.monotonic() < deadline:
+                with store.changed:
+                    if store.resource_version <= version:
+                        store.changed.wait(min(1.0, max(0.0, deadline - time.monotonic())))
+                    events = [event for event in store.events if event[0] > version]
+                    version = store.resource_version
+                for _, event_kind, obj in events:
+                    if namespace and obj["metadata"]["namespace"] != namespace:
+                        continue
+                    if matches_labels(obj, query.get("labelSelector")) and matches_fields(obj, query.get("fieldSelector")):
+                        self.send_chunk(json.dumps({"type": event_kind, "object": obj}).encode() + b"\n")
+            self.send(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        self.close_connection = True
+
+    def create_pod(self, namespace: str, body: Dict[str, Any]):
+        store = self.server.store
+        metadata = body.setdefault("metadata", {})
+        metadata.setdefault("name", metadata.get("generateName", "pod-") + uuid.uuid4().hex[:5])
+        metadata.update(namespace=namespace, uid=str(uuid.uuid4()))
+        body["status"] = {"phase": "Pending"}
+        with store.changed:
+            if (namespace, metadata["name"]) in store.pods:
+                return self.send_status(409, "AlreadyExists", f"pods \"{metadata['name']}\" already exists")
+            store.pods[(namespace, metadata["name"])] = body
+            store.record("ADDED", body)
+            created = copy.deepcopy(body)
+        threading.Timer(SCHEDULING_DELAY, store.schedule, args=(namespace, metadata["name"])).start()
+        return self.send_json(201, created)
+
+    def delete_collection(self, namespace: str, query: Dict[str, str]):
+        store = self.server.store
+        with store.changed:
+            keys = [key for key, obj in store.pods.items() if key[0] == namespace
+                    and matches_labels(obj, query.get("labelSelector")) and matches_fields(obj, query.get("fieldSelector"))]
+            deleted = [store.pods.pop(key) for key in keys]
+            for obj in deleted:
+                store.record("DELETED", obj)
+        return self.send_json(200, {"kind": "PodList", "apiVersion": "v1", "metadata": {}, "items": deleted})
+
+    def pod(self, method: str, namespace: str, name: str, body: Optional[Dict[str, Any]]):
+        store = self.server.store
+        with store.changed:
+            obj = store.pods.get((namespace, name))
+            if obj is None:
+                return self.send_status(404, "NotFound", f"pods \"{name}\" not found")
+            if method == "PATCH":
+                merge(obj, body or {})
+                store.record("MODIFIED", obj)
+            elif method == "DELETE":
+                del store.pods[(namespace, name)]
+                store.record("DELETED", obj)
+            obj = copy.deepcopy(obj)
+        return self.send_json(200, obj)
+
+    def exec_websocket(self, namespace: str, name: str, query: Dict[str, List[str]]):
+        if (namespace, name) not in self.server.store.pods:
+            return self.send_status(404, "NotFound", f"pods \"{name}\" not found")
+
+        offered = [protocol.strip() for protocol in self.headers.get("Sec-WebSocket-Protocol", "").split(",")]
+        protocol = "v5.channel.k8s.io" if "v5.channel.k8s.io" in offered else "v4.channel.k8s.io"
+        accept = base64.b64encode(hashlib.sha1((self.headers["Sec-WebSocket-Key"] + WEBSOCKET_GUID).encode()).digest())
+        self.send_response(101)
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept.decode())
+        self.send_header("Sec-WebSocket-Protocol", protocol)
+        self.end_headers()
+
+        # Nothing is run, the command is answered with a line of output and success
+        output = f"{' '.join(query.get('command', []))[:64]}\n".encode()
+        for frame in (bytes([1]) + output, bytes([3]) + json.dumps({"metadata": {}, "status": "Success"}).encode()):
+            self.send(bytes([0x82, len(frame)]) + frame if len(frame) < 126 else
+                      bytes([0x82, 126]) + struct.pack(">H", len(frame)) + frame)
+        self.send(b"\x88\x02\x03\xe8")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+def merge(target: Dict[str, Any], patch: Dict[str, Any]):
+    """
+    Apply a JSON merge patch
+    """
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        elif isinstance(value, dict) and isinstance(target.get(key), dict):
+            merge(target[key], value)
+        else:
+            target[key] = value
+
+
+class FakeApiServer(ThreadingHTTPServer):
+    """
+    The fake API server, serving from a background thread once started
+
+    Args:
+        namespaces (int, optional): Number of seeded namespaces. Defaults to 10
+        pods (int, optional): Number of seeded pods per namespace. Defaults to 100
+        nodes (int, optional): Number of seeded nodes. Defaults to 50
+        latency (float, optional): Seconds added to every response. Defaults to 0
+        port (int, optional): The port, 0 picks a free one. Defaults to 0
+    """
+
+    daemon_threads = True
+
+    def __init__(self, namespaces: int = 10, pods: int = 100, nodes: int = 50, latency: float = 0.0, port: int = 0):
+        super().__init__(("127.0.0.1", port), Handler)
+        self.latency = latency
+        self.counters = Counters()
+        self.store = Store()
+        self.store.seed(namespaces, pods, nodes)
+
+    @property
+    def url(self) -> str:
+        """
+        The URL of the server
+        """
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def kubeconfig(self, context: str = "fake") -> str:
+        """
+        Return a kubeconfig pointing to the server
+
+        Args:
+            context (str, optional): The context name. Defaults to "fake"
+
+        Returns:
+            str: The kubeconfig document
+        """
+        return (
+            "apiVersion: v1\nkind: Config\n"
+            f"clusters:\n- name: fake\n  cluster: {{server: \"{self.url}\"}}\n"
+            f"contexts:\n- name: {context}\n  context: {{cluster: fake, user: fake}}\n"
+            f"current-context: {context}\n"
+            "users:\n- name: fake\n  user: {token: fake}\n"
+        )
+
+    def start(self) -> "FakeApiServer":
+        """
+        Serve from a daemon thread
+        """
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+@click.command()
+@click.option("--namespaces", type=click.INT, default=10, show_default=True, help="Number of namespaces")
+@click.option("--pods", type=click.INT, default=100, show_default=True, help="Number of pods per namespace")
+@click.option("--nodes", type=click.INT, default=50, show_default=True, help="Number of nodes")
+@click.option("--latency", type=click.FLOAT, default=0.0, show_default=True, help="Seconds added to every response")
+@click.option("--port", type=click.INT, default=8001, show_default=True, help="Port to listen on")
+@click.option("--kubeconfig", type=click.Path(dir_okay=False), default=None, help="Write a kubeconfig for the server")
+def main(namespaces: int, pods: int, nodes: int, latency: float, port: int, kubeconfig: Optional[str]):
+    """
+    Serve a fake API server until interrupted
+    """
+    server = FakeApiServer(namespaces, pods, nodes, latency, port)
+    if kubeconfig:
+        with open(kubeconfig, "w", encoding="utf-8") as file:
+            file.write(server.kubeconfig())
+    click.echo(f"Serving {len(server.store.pods)} pods on {len(server.store.nodes)} nodes at {server.url}", err=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
@@ -0,0 +1,136 @@
+"""
+Benchmark of decoding pod listings with the generated kubernetes models vs the raw
+JSON fast path in `notoil.commands.k8s.api`
+
+Usage:
+    python -m benchmarks.k8s_decode --pods 5000
+
+"""
+################################################### Python Import ##################################
+
+import json
+import time
+import tracemalloc
+
+import click
+
+from kubernetes import client
+
+################################################### Project Import #################################
+
+from notoil.commands.k8s.api import Pod
+
+################################################### Main Declaration ###############################
+
+
+class RawResponse:
+    """
+    Stand-in for the REST response handed to `ApiClient.deserialize`
+    """
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+
+def synthetic_pod(index: int) -> dict:
+    """
+    Build a pod resembling a typical deployment replica
+
+    Args:
+        index (int): Index of the pod, used to make names unique
+
+    Returns:
+        dict: The pod as returned by the API server
+    """
+    containers = [{
+        "name": f"container-{number}",
+        "image": f"registry.example.com/team/app-{number}:1.2.{index % 50}",
+        "env": [{"name": f"ENV_{env}", "value": f"value-{env}"} for env in range(15)],
+        "ports": [{"containerPort": 8080 + number, "protocol": "TCP"}],
+        "resources": {"limits": {"cpu": "500m", "memory": "512Mi"}, "requests": {"cpu": "100m", "memory": "128Mi"}},
+        "volumeMounts": [{"name": f"volume-{volume}", "mountPath": f"/mnt/{volume}"} for volume in range(4)],
+    } for number in range(2)]
+
+    return {
+        "metadata": {
+            "name": f"app-{index}",
+            "namespace": "default",
+            "uid": f"00000000-0000-0000-0000-{index:012d}",
+            "resourceVersion": str(100000 + index),
+            "creationTimestamp": "2025-01-01T00:00:00Z",
+            "labels": {"app": "app", "pod-template-hash": "5d8f7c9b4", "team": "sre"},
+            "annotations": {f"example.com/annotation-{number}": "x" * 40 for number in range(5)},
+            "ownerReferences": [{"apiVersion": "apps/v1", "kind": "ReplicaSet", "name": "app-5d8f7c9b4",
+                                 "uid": "11111111-1111-1111-1111-111111111111", "controller": True}],
+        },
+        "spec": {
+            "nodeName": f"node-{index % 200}",
+            "containers": containers,
+            "volumes": [{"name": f"volume-{volume}", "emptyDir": {}} for volume in range(4)],
+            "tolerations": [{"key": "node.kubernetes.io/not-ready", "operator": "Exists", "effect": "NoExecute"}],
+        },
+        "status": {
+            "phase": "Running",
+            "podIP": f"10.0.{index // 250 % 250}.{index % 250}",
+            "startTime": "2025-01-01T00:00:05Z",
+            "conditions": [{"type": kind, "status": "True", "lastTransitionTime": "2025-01-01T00:00:10Z"}
+                           for kind in ("Initialized", "Ready", "ContainersReady", "PodScheduled")],
+            "containerStatuses": [{
+                "name": f"container-{number}",
+                "containerID": f"containerd://{index:064x}",
+                "image": f"registry.example.com/team/app-{number}:1.2.{index % 50}",
+                "imageID": "registry.example.com/team/app@sha256:" + "0" * 64,
+                "ready": True,
+                "restartCount": 0,
+                "started": True,
+                "state": {"running": {"startedAt": "2025-01-01T00:00:08Z"}},
+            } for number in range(2)],
+        },
+    }
+
+
+def measure(decode, data: bytes) -> tuple:
+    """
+    Measure the wall time and peak traced memory of a decode function
+
+    Tracing allocations slows decoding down considerably, so time and memory are
+    measured in separate runs.
+
+    Returns:
+        tuple: Seconds elapsed and peak memory in bytes
+    """
+    start = time.perf_counter()
+    decode(data)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    decode(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+@click.command()
+@click.option("--pods", type=click.INT, default=5000, help="Number of pods in the listing")
+def main(pods: int):
+    """
+    Compare model deserialization with the raw JSON fast path
+    """
+    data = json.dumps({"kind": "PodList", "apiVersion": "v1", "metadata": {},
+                       "items": [synthetic_pod(index) for index in range(pods)]}).encode()
+
+    api_client = client.ApiClient()
+    decoders = {
+        "models (V1PodList)": lambda raw: api_client.deserialize(RawResponse(raw), "V1PodList"),
+        "raw json (Pod)": lambda raw: [Pod.from_json(item) for item in json.loads(raw)["items"]],
+    }
+
+    click.echo(f"{pods} pods, {len(data) / 1024 / 1024:.1f} MiB of JSON")
+    click.echo(f"{'decoder':<20} {'time':>10} {'peak memory':>14}")
+    for name, decode in decoders.items():
+        elapsed, peak = measure(decode, data)
+        click.echo(f"{name:<20} {elapsed * 1000:>8.0f}ms {peak / 1024 / 1024:>11.1f}MiB")
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
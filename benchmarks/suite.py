@@ -0,0 +1,272 @@
+"""
+End-to-end benchmark of the notoil commands
+
+The k8s commands run against a local fake API server (see `benchmarks.fake_apiserver`)
+seeded with thousands of pods, the ip-network and TOTP commands against generated bulk
+inputs. Every command runs in its own process, and its wall time, peak RSS, API
+requests and bytes transferred are recorded. Results can be saved and compared to a
+previous run, failing when a command got slower or chattier.
+
+Usage:
+    python -m benchmarks.suite --namespaces 20 --pods 250 --nodes 100 --latency 0.005
+    python -m benchmarks.suite -f json > baseline.json
+    python -m benchmarks.suite --baseline baseline.json --tolerance 0.25
+
+"""
+################################################### Python Import ##################################
+
+import base64
+import ipaddress
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import click
+
+################################################### Project Import #################################
+
+from benchmarks.fake_apiserver import FakeApiServer
+
+################################################### Main Declaration ###############################
+
+# The child reports its own peak RSS: after fork the rusage of a child starts from the
+# high-water mark of the parent, which holds the whole fake cluster in memory
+CLI = """
+import atexit, os, resource, sys
+
+def report_peak_rss():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    if os.path.exists("/proc/self/status"):
+        with open("/proc/self/status", encoding="utf-8") as status:
+            peak = next((int(line.split()[1]) / 1024 for line in status if line.startswith("VmHWM:")), peak)
+    with open(os.environ["NOTOIL_BENCH_RSS"], "w", encoding="utf-8") as file:
+        file.write(str(peak))
+
+atexit.register(report_peak_rss)
+from notoil.__main__ import cli
+cli(sys.argv[1:], prog_name="notoil")
+"""
+
+
+class Result(NamedTuple):
+    """Measurements of a benchmarked command"""
+
+    name: str
+    seconds: float
+    peak_rss_mb: float
+    requests: Optional[int] = None
+    bytes_in: Optional[int] = None
+    bytes_out: Optional[int] = None
+    error: Optional[str] = None
+
+
+def run_command(name: str, args: List[str], env: Dict[str, str], server: Optional[FakeApiServer] = None) -> Result:
+    """
+    Run notoil in a child process and measure it
+
+    Args:
+        name (str): The name of the benchmark
+        args (list): The notoil arguments
+        env (dict): The environment of the process
+        server (FakeApiServer, optional): The API server whose counters are reported
+
+    Returns:
+        Result: The measurements
+    """
+    if server is not None:
+        server.counters.reset()
+
+    with tempfile.TemporaryFile() as stderr, tempfile.NamedTemporaryFile("r", suffix=".rss") as rss:
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, "-c", CLI, *args], env={**env, "NOTOIL_BENCH_RSS": rss.name},
+                                 stdout=subprocess.DEVNULL, stderr=stderr, check=False)
+        elapsed = time.perf_counter() - start
+
+        error = None
+        if process.returncode:
+            stderr.seek(0)
+            lines = stderr.read().decode(errors="replace").strip().splitlines()
+            error = lines[-1] if lines else f"exited with {process.returncode}"
+        peak = float(rss.read() or 0)
+
+    counters = server.counters.reset() if server is not None else {}
+    return Result(name, elapsed, peak, error=error, **counters)
+
+
+def k8s_workloads() -> List[Tuple[str, List[str]]]:
+    """
+    Return the k8s benchmarks, in the order they run as they change the cluster
+    """
+    return [
+        ("k8s mp -A (cold cache)", ["k8s", "mp", "app-1", "-A"]),
+        # A TTL outliving the whole suite, so the warm run never calls the API server
+        ("k8s mp -A (warm cache)", ["k8s", "mp", "app-1", "-A", "--cache-ttl", "3600"]),
+        ("k8s mp -A (stale cache)", ["k8s", "mp", "app-1", "-A", "--cache-ttl", "0"]),
+        ("k8s cnp --per node", ["k8s", "cnp", "--per", "node", "-n", "default"]),
+        ("k8s lnp", ["k8s", "lnp", "-n", "default", "--no-cache"]),
+        ("k8s re -l -x", ["k8s", "re", "-l", "app=app", "-n", "default", "-x", "true", "-f", "jsonl"]),
+        ("k8s dnp -A --wait", ["k8s", "dnp", "-A", "--wait"]),
+    ]
+
+
+def write_local_inputs(directory: str, networks: int, ips: int, secrets: int) -> Dict[str, str]:
+    """
+    Generate the inputs of the ip-network and TOTP benchmarks
+
+    Args:
+        directory (str): Where to write the files
+        networks (int): Number of networks
+        ips (int): Number of IP addresses to match
+        secrets (int): Number of TOTP secrets
+
+    Returns:
+        dict: The path of every file
+    """
+    rand = random.Random(0)
+    paths = {name: os.path.join(directory, name) for name in ("networks.txt", "ips.txt", "secrets.txt")}
+
+    with open(paths["networks.txt"], "w", encoding="utf-8") as file:
+        for index in range(networks):
+            if index % 4 == 3:
+                network = ipaddress.IPv6Network((rand.getrandbits(128), rand.randint(32, 64)), strict=False)
+            else:
+                network = ipaddress.IPv4Network((rand.getrandbits(32), rand.randint(8, 28)), strict=False)
+            file.write(f"{network} team-{index % 20} env-{index % 3}\n")
+
+    with open(paths["ips.txt"], "w", encoding="utf-8") as file:
+        for index in range(ips):
+            address = rand.getrandbits(128) if index % 4 == 3 else rand.getrandbits(32)
+            file.write(f"{ipaddress.ip_address(address)}\n")
+
+    with open(paths["secrets.txt"], "w", encoding="utf-8") as file:
+        for index in range(secrets):
+            file.write(f"account-{index} {base64.b32encode(rand.randbytes(20)).decode()}\n")
+
+    return paths
+
+
+def local_workloads(paths: Dict[str, str]) -> List[Tuple[str, List[str]]]:
+    """
+    Return the benchmarks of the commands that do not talk to a cluster
+    """
+    return [
+        ("ip-network match", ["ip-network", "match", paths["networks.txt"], paths["ips.txt"], "-f", "csv"]),
+        ("ip-network audit", ["ip-network", "audit", paths["networks.txt"], "-f", "json"]),
+        ("get-totp --file", ["get-totp", "--file", paths["secrets.txt"]]),
+    ]
+
+
+def regressions(results: List[Result], baseline: List[Dict[str, Any]], tolerance: float) -> List[str]:
+    """
+    Compare results to a previous run
+
+    Args:
+        results (list): The current results
+        baseline (list): The results of the previous run, as saved with `-f json`
+        tolerance (float): Allowed relative increase of time, memory, requests and bytes
+
+    Returns:
+        list: A description of every regression
+    """
+    previous = {entry["name"]: entry for entry in baseline}
+    found = []
+    for result in results:
+        before = previous.get(result.name)
+        if before is None:
+            continue
+        if result.error and not before.get("error"):
+            found.append(f"{result.name}: failed ({result.error})")
+            continue
+        for field in ("seconds", "peak_rss_mb", "requests", "bytes_out"):
+            old, new = before.get(field), getattr(result, field)
+            if old and new is not None and new > old * (1 + tolerance):
+                found.append(f"{result.name}: {field} {old:g} -> {new:g} (+{(new / old - 1) * 100:.0f}%)")
+    return found
+
+
+def format_results(results: List[Result]) -> List[str]:
+    """
+    Lay out the results as a table
+    """
+    def size(value: Optional[int]) -> str:
+        return "-" if value is None else f"{value / 1024 / 1024:.1f}MiB"
+
+    lines = [f"{'benchmark':<26} {'time':>9} {'peak rss':>10} {'requests':>9} {'download':>10} {'upload':>10}"]
+    for result in results:
+        lines.append(f"{result.name:<26} {result.seconds:>8.2f}s {result.peak_rss_mb:>8.1f}MB "
+                     f"{'-' if result.requests is None else result.requests:>9} {size(result.bytes_out):>10} "
+                     f"{size(result.bytes_in):>10}" + (f"  ERROR {result.error}" if result.error else ""))
+    return lines
+
+
+@click.command()
+@click.option("--namespaces", type=click.IntRange(min=1), default=20, show_default=True,
+              help="Namespaces of the fake cluster")
+@click.option("--pods", type=click.IntRange(min=1), default=250, show_default=True, help="Pods per namespace")
+@click.option("--nodes", type=click.IntRange(min=1), default=100, show_default=True, help="Nodes of the fake cluster")
+@click.option("--latency", type=click.FloatRange(min=0), default=0.005, show_default=True,
+              help="Seconds added to every API response")
+@click.option("--networks", type=click.IntRange(min=1), default=20000, show_default=True,
+              help="Networks of the ip-network benchmarks")
+@click.option("--ips", type=click.IntRange(min=1), default=200000, show_default=True,
+              help="IP addresses of the ip-network match benchmark")
+@click.option("--secrets", type=click.IntRange(min=1), default=5000, show_default=True,
+              help="Secrets of the TOTP benchmark")
+@click.option("--suite", type=click.Choice(["all", "k8s", "local"]), default="all", show_default=True,
+              help="Benchmarks to run")
+@click.option("--format", "-f", "output_format", type=click.Choice(["table", "json"]), default="table",
+              show_default=True, help="Output format, json can be used as --baseline later")
+@click.option("--baseline", type=click.File("r"), default=None, help="Results of a previous run to compare with")
+@click.option("--tolerance", type=click.FloatRange(min=0), default=0.25, show_default=True,
+              help="Relative increase tolerated before a result is a regression")
+def main(namespaces: int, pods: int, nodes: int, latency: float, networks: int, ips: int, secrets: int, suite: str,
+         output_format: str, baseline, tolerance: float):
+    """
+    Run the benchmarks and report them, exiting with 1 on regressions against a baseline
+    """
+    results: List[Result] = []
+    with tempfile.TemporaryDirectory(prefix="notoil-bench-") as directory:
+        env = {**os.environ, "XDG_CACHE_HOME": os.path.join(directory, "cache"),
+               "KUBECONFIG": os.path.join(directory, "kubeconfig"), "PYTHONPATH": os.getcwd()}
+
+        if suite in ("all", "k8s"):
+            server = FakeApiServer(namespaces, pods, nodes, latency).start()
+            with open(env["KUBECONFIG"], "w", encoding="utf-8") as file:
+                file.write(server.kubeconfig())
+            click.echo(f"Fake cluster: {len(server.store.pods)} pods, {nodes} nodes, {namespaces} namespaces, "
+                       f"{latency * 1000:g}ms latency", err=True)
+            try:
+                for name, args in k8s_workloads():
+                    results.append(run_command(name, args, env, server))
+                    click.echo(format_results(results[-1:])[-1], err=True)
+            finally:
+                server.shutdown()
+                server.server_close()
+
+        if suite in ("all", "local"):
+            paths = write_local_inputs(directory, networks, ips, secrets)
+            for name, args in local_workloads(paths):
+                results.append(run_command(name, args, env))
+                click.echo(format_results(results[-1:])[-1], err=True)
+
+    if output_format == "json":
+        click.echo(json.dumps([result._asdict() for result in results], indent=2))
+    else:
+        for line in format_results(results):
+            click.echo(line)
+
+    if baseline is not None:
+        found = regressions(results, json.load(baseline), tolerance)
+        for line in found:
+            click.echo(f"Regression: {line}", err=True)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
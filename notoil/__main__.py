@@ -2,26 +2,67 @@
 """
 Main entry point for the notoil CLI application.
 
-This module sets up the Click command group and registers subcommands.
+This module sets up the Click command group and registers subcommands. Subcommands
+are loaded lazily so that e.g. `notoil get-totp` never pays for importing the
+kubernetes client.
 """
 
 import click
 
 ################################################### Project Import #################################
 
-from notoil.commands.network import ip_network
-from notoil.commands.totp import get_totp
-
-from notoil.commands.k8s.main import kubernetes_main
+from notoil.utils import timings
+from notoil.utils.groups import LazyGroup
 
 ################################################### Main Declaration ###############################
 
-@click.group()
-def cli():
+def start_tracing(_ctx: click.Context, param: click.Parameter, value):
+    """
+    Start recording while the options are parsed, so loading the subcommand is timed too
+    """
+    if value:
+        timings.enable()
+        if param.name == "profile_path":
+            timings.start_profile()
+    return value
+
+
+@click.group(
+    cls=LazyGroup,
+    lazy_subcommands={
+        "ip-network": "notoil.commands.network:ip_network",
+        "get-totp": "notoil.commands.totp:get_totp",
+        "k8s": "notoil.commands.k8s.main:kubernetes_main",
+    },
+)
+@click.option("--trace-timings", is_flag=True, default=False, callback=start_tracing,
+              help="Report on stderr the time spent importing, loading the config, in every API request, "
+                   "waiting for pods and running commands")
+@click.option("--timings-format", type=click.Choice(["table", "json"]), default="table", show_default=True,
+              help="Format of the --trace-timings report, json also lists every span")
+@click.option("--profile", "profile_path", type=click.Path(dir_okay=False, writable=True), default=None,
+              callback=start_tracing,
+              help="Write a cProfile dump of every thread to this file, implies --trace-timings")
+@click.pass_context
+def cli(ctx: click.Context, trace_timings: bool = False, timings_format: str = "table",
+        profile_path: str = None):
     """
     Main Click command group for the notoil CLI.
+
+    Args:
+        ctx (click.Context): The context, closed once the subcommand is done
+        trace_timings (bool, optional): Report the timing of every phase on stderr. Defaults to False
+        timings_format (str, optional): "table" or "json". Defaults to "table"
+        profile_path (str, optional): Where to write the cProfile dump. Defaults to None
     """
+    if not trace_timings and profile_path is None:
+        return
+
+    def report():
+        if profile_path is not None:
+            timings.dump_profile(profile_path)
+            click.echo(f"Profile written to {profile_path}", err=True)
+        click.echo(timings.report(timings_format), err=True)
 
-cli.add_command(ip_network)
-cli.add_command(get_totp)
-cli.add_command(kubernetes_main)
+    # Runs when the subcommand returns, exits or fails
+    ctx.call_on_close(report)
@@ -0,0 +1,759 @@
+"""
+This module contains the list/read layer used by the k8s commands
+
+Responses are requested with `_preload_content=False` and decoded straight from JSON
+into small named tuples holding only the fields the commands use. Building the
+generated `V1Pod` models costs more than the HTTP request itself on large listings.
+"""
+################################################### Python Import ##################################
+
+from __future__ import annotations
+
+import json
+import math
+import time
+from contextlib import closing
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+################################################### Project Import #################################
+
+from notoil.utils.concurrency import interleave
+from notoil.utils.imports import LazyModule
+from notoil.utils.timings import record, span
+
+################################################### Main Declaration ###############################
+
+client = LazyModule("kubernetes.client")
+
+config = LazyModule("kubernetes.config")
+
+PAGE_SIZE = 500
+
+CONNECT_TIMEOUT = 10
+
+WATCH_TIMEOUT = 300
+
+RECONNECT_DELAY = 1
+
+MAX_RECONNECT_DELAY = 30
+
+READY_TIMEOUT = 120
+
+# Waiting reasons a container does not recover from without a change to the pod
+FATAL_WAITING_REASONS = frozenset({
+    "ImagePullBackOff",
+    "ErrImageNeverPull",
+    "InvalidImageName",
+    "CrashLoopBackOff",
+    "CreateContainerConfigError",
+    "CreateContainerError",
+})
+
+
+class ResourceExpired(Exception):
+    """Raised when a watch is started from a resourceVersion the API server no longer has"""
+
+
+class PodNotReady(Exception):
+    """Raised when a pod fails, is deleted or times out before its containers are ready"""
+
+    def __init__(self, name: str, reason: str):
+        super().__init__(f"Pod {name} did not become ready: {reason}")
+        self.name = name
+        self.reason = reason
+
+
+class ContainerStatus(NamedTuple):
+    """Fields of a container status used by the k8s commands"""
+
+    name: str
+    container_id: Optional[str]
+    ready: bool
+    restart_count: int
+
+    @classmethod
+    def from_json(cls, status: Dict[str, Any]) -> "ContainerStatus":
+        return cls(
+            name=status["name"],
+            container_id=status.get("containerID"),
+            ready=status.get("ready", False),
+            restart_count=status.get("restartCount", 0),
+        )
+
+
+class Pod(NamedTuple):
+    """Fields of a pod used by the k8s commands"""
+
+    name: str
+    namespace: str
+    uid: str
+    resource_version: str
+    labels: Dict[str, str]
+    node_name: Optional[str]
+    pod_ip: Optional[str]
+    phase: Optional[str]
+    start_time: Optional[str]
+    container_statuses: Tuple[ContainerStatus, ...]
+
+    @classmethod
+    def from_json(cls, pod: Dict[str, Any]) -> "Pod":
+        metadata, status = pod["metadata"], pod.get("status", {})
+        return cls(
+            name=metadata["name"],
+            namespace=metadata.get("namespace", ""),
+            uid=metadata.get("uid", ""),
+            resource_version=metadata.get("resourceVersion", ""),
+            labels=metadata.get("labels", {}),
+            node_name=pod.get("spec", {}).get("nodeName"),
+            pod_ip=status.get("podIP"),
+            phase=status.get("phase"),
+            start_time=status.get("startTime"),
+            container_statuses=tuple(ContainerStatus.from_json(item) for item in status.get("containerStatuses", ())),
+        )
+
+    @classmethod
+    def from_row(cls, row: List[Any]) -> "Pod":
+        """
+        Rebuild a pod from its JSON array form, i.e. ``json.loads(json.dumps(pod))``
+
+        Args:
+            row (list): The pod fields in declaration order
+
+        Returns:
+            Pod: The pod
+        """
+        return cls(*row[:-1], tuple(ContainerStatus(*status) for status in row[-1]))
+
+
+class Node(NamedTuple):
+    """Fields of a node used by the k8s commands"""
+
+    name: str
+    labels: Dict[str, str]
+    ready: bool
+    unschedulable: bool
+
+    @classmethod
+    def from_json(cls, node: Dict[str, Any]) -> "Node":
+        conditions = (node.get("status") or {}).get("conditions") or ()
+        return cls(
+            name=node["metadata"]["name"],
+            labels=node["metadata"].get("labels") or {},
+            ready=any(item.get("type") == "Ready" and item.get("status") == "True" for item in conditions),
+            unschedulable=bool((node.get("spec") or {}).get("unschedulable")),
+        )
+
+
+def load_config():
+    """
+    Load the kubeconfig, or the in-cluster configuration, as the default of every API
+    """
+    with span("config", "load"):
+        config.load_config()
+
+
+def decode(response) -> Dict[str, Any]:
+    """
+    Decode the body of a response requested with `_preload_content=False`
+
+    Args:
+        response (urllib3.HTTPResponse): The raw response
+
+    Returns:
+        dict: The decoded JSON body
+    """
+    start = time.perf_counter()
+    try:
+        data = response.data
+        body = json.loads(data)
+    finally:
+        response.release_conn()
+    record("decode", "read and parse JSON", start, received=len(data))
+    return body
+
+
+def iter_pages(list_func: Callable, page_size: int = PAGE_SIZE, **kwargs) -> Iterator[Dict[str, Any]]:
+    """
+    Call a list function page by page
+
+    Args:
+        list_func (Callable): A list method of the API, e.g. `CoreV1Api.list_namespaced_pod`
+        page_size (int, optional): Number of items per request. Defaults to 500
+        **kwargs: Extra arguments of the list method, e.g. the namespace or selectors
+
+    Yields:
+        dict: Every decoded page, ``page["metadata"]["resourceVersion"]`` is the version
+            of the consistent snapshot the pages belong to
+    """
+    _continue = None
+    while True:
+        page = decode(list_func(limit=page_size, _continue=_continue, _preload_content=False, **kwargs))
+        yield page
+
+        _continue = page["metadata"].get("continue")
+        if not _continue:
+            return
+
+
+def _set_read_timeout(response, timeout: Optional[float]):
+    """
+    Change the read timeout of the connection carrying a streamed response
+    """
+    sock = getattr(getattr(response, "connection", None), "sock", None)
+    if sock is not None:
+        sock.settimeout(timeout)
+
+
+def iter_events(list_func: Callable, resource_version: str, idle_timeout: Optional[float] = None,
+                timeout_seconds: Optional[int] = None, request_timeout: Optional[float] = None,
+                **kwargs) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Watch a list function from a resourceVersion
+
+    Args:
+        list_func (Callable): A list method of the API, e.g. `CoreV1Api.list_namespaced_pod`
+        resource_version (str): The version to start watching from
+        idle_timeout (float, optional): Stop once no event arrived for this many seconds.
+            The API server sends the backlog of events immediately, so a short idle
+            timeout is a cheap way to catch up with the current state
+        timeout_seconds (int, optional): Server side duration of the watch
+        request_timeout (float, optional): Seconds to wait for the response and its first
+            line, the idle timeout then only applies between lines. Defaults to the idle timeout
+        **kwargs: Extra arguments of the list method, e.g. the namespace or selectors
+
+    Yields:
+        tuple: The event type (ADDED, MODIFIED, DELETED or BOOKMARK) and the object
+
+    Raises:
+        ResourceExpired: If the resourceVersion is too old to watch from
+    """
+    # Imported here to keep the kubernetes package out of the import path of this module
+    from kubernetes.watch.watch import iter_resp_lines  # pylint: disable=import-outside-toplevel
+    from urllib3.exceptions import MaxRetryError, ReadTimeoutError  # pylint: disable=import-outside-toplevel
+
+    try:
+        response = list_func(
+            watch=True,
+            resource_version=resource_version,
+            allow_watch_bookmarks=True,
+            timeout_seconds=timeout_seconds,
+            _preload_content=False,
+            _request_timeout=(CONNECT_TIMEOUT, request_timeout or idle_timeout),
+            **kwargs,
+        )
+    except MaxRetryError as exc:
+        if idle_timeout is None or not isinstance(exc.reason, ReadTimeoutError):
+            raise
+        return
+
+    waiting = request_timeout is not None
+    try:
+        for line in iter_resp_lines(response):
+            if waiting:
+                waiting = False
+                _set_read_timeout(response, idle_timeout)
+            if not line:
+                continue
+
+            event = json.loads(line)
+            if event["type"] == "ERROR":
+                if event["object"].get("code") == 410:
+                    raise ResourceExpired(event["object"].get("message", "resource version expired"))
+                raise client.ApiException(status=event["object"].get("code"), reason=event["object"].get("message"))
+
+            yield event["type"], event["object"]
+    except ReadTimeoutError:
+        if idle_timeout is None:
+            raise
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def iter_namespaces(api: client.CoreV1Api, page_size: int = PAGE_SIZE) -> Iterator[str]:
+    """
+    List namespace names page by page
+
+    Args:
+        api (client.CoreV1Api): The API to query
+        page_size (int, optional): Number of namespaces per request. Defaults to 500
+
+    Yields:
+        str: The name of every namespace of the cluster
+    """
+    for page in iter_pages(api.list_namespace, page_size):
+        for namespace in page["items"]:
+            yield namespace["metadata"]["name"]
+
+
+def iter_nodes(api: client.CoreV1Api, label_selector: Optional[str] = None, page_size: int = PAGE_SIZE) -> Iterator[Node]:
+    """
+    List nodes page by page
+
+    Args:
+        api (client.CoreV1Api): The API to query
+        label_selector (str, optional): Label selector evaluated by the API server
+        page_size (int, optional): Number of nodes per request. Defaults to 500
+
+    Yields:
+        Node: Every matching node of the cluster
+    """
+    for page in iter_pages(api.list_node, page_size, label_selector=label_selector):
+        for node in page["items"]:
+            yield Node.from_json(node)
+
+
+def iter_pods(api: client.CoreV1Api, namespace: str, label_selector: Optional[str] = None,
+              field_selector: Optional[str] = None, page_size: int = PAGE_SIZE) -> Iterator[Pod]:
+    """
+    List the pods of a namespace page by page
+
+    Only one page is held in memory at a time, and the selectors are evaluated by the
+    API server so non matching pods are never transferred.
+
+    Args:
+        api (client.CoreV1Api): The API to query
+        namespace (str): The namespace to list
+        label_selector (str, optional): Label selector evaluated by the API server
+        field_selector (str, optional): Field selector evaluated by the API server
+        page_size (int, optional): Number of pods per request. Defaults to 500
+
+    Yields:
+        Pod: Every matching pod of the namespace
+    """
+    pages = iter_pages(api.list_namespaced_pod, page_size, namespace=namespace,
+                       label_selector=label_selector, field_selector=field_selector)
+    for page in pages:
+        for pod in page["items"]:
+            yield Pod.from_json(pod)
+
+
+def iter_pods_all_namespaces(api: client.CoreV1Api, label_selector: Optional[str] = None,
+                             field_selector: Optional[str] = None, workers: int = 8) -> Iterator[Pod]:
+    """
+    List the pods of every namespace, querying the namespaces concurrently
+
+    Pods are yielded as soon as any namespace returns a page, memory stays bounded by
+    the number of workers times the page size.
+
+    Args:
+        api (client.CoreV1Api): The API to query
+        label_selector (str, optional): Label selector evaluated by the API server
+        field_selector (str, optional): Field selector evaluated by the API server
+        workers (int, optional): Number of namespaces listed concurrently. Defaults to 8
+
+    Yields:
+        Pod: Every matching pod of the cluster
+    """
+    namespaces = list(iter_namespaces(api))
+
+    yield from interleave(
+        lambda namespace: iter_pods(api, namespace, label_selector, field_selector),
+        namespaces,
+        workers=workers,
+    )
+
+
+def read_pod(api: client.CoreV1Api, name: str, namespace: str) -> Pod:
+    """
+    Read a single pod
+
+    Args:
+        api (client.CoreV1Api): The API to query
+        name (str): The name of the pod
+        namespace (str): The namespace of the pod
+
+    Returns:
+        Pod: The pod
+
+    Raises:
+        client.ApiException: If the pod does not exist
+    """
+    return Pod.from_json(decode(api.read_namespaced_pod(name=name, namespace=namespace, _preload_content=False)))
+
+
+def _resync(list_func: Callable, known: Dict[Tuple[str, str], Pod], initial: bool,
+            **kwargs) -> Iterator[Tuple[str, Pod]]:
+    """
+    List pods and report how they differ from the known ones
+
+    Args:
+        list_func (Callable): The list method of the API
+        known (dict): The known pods by namespace and name, updated in place
+        initial (bool): Report every pod as LISTED instead of diffing
+
+    Yields:
+        tuple: The event type and the pod
+
+    Returns:
+        str: The resourceVersion of the listing
+    """
+    resource_version, seen = "", set()
+    for page in iter_pages(list_func, **kwargs):
+        resource_version = page["metadata"].get("resourceVersion", "")
+        for obj in page["items"]:
+            pod = Pod.from_json(obj)
+            key = (pod.namespace, pod.name)
+            seen.add(key)
+
+            previous = known.get(key)
+            known[key] = pod
+            if initial:
+                yield "LISTED", pod
+            elif previous is None:
+                yield "ADDED", pod
+            elif previous.resource_version != pod.resource_version:
+                yield "MODIFIED", pod
+
+    for key in [key for key in known if key not in seen]:
+        yield "DELETED", known.pop(key)
+
+    return resource_version
+
+
+def watch_pods(api: client.CoreV1Api, namespace: Optional[str] = None, label_selector: Optional[str] = None,
+               field_selector: Optional[str] = None) -> Iterator[Tuple[str, Pod]]:
+    """
+    List pods once, then follow their changes with a watch
+
+    The watch is resumed from the last seen resourceVersion (bookmarks included) after
+    the server closes it or the connection drops, so nothing is listed again unless the
+    API server no longer has that version. In that case the pods are listed again and
+    only the differences with the known pods are reported.
+
+    Args:
+        api (client.CoreV1Api): The API to query
+        namespace (str, optional): The namespace to watch, every namespace if None
+        label_selector (str, optional): Label selector evaluated by the API server
+        field_selector (str, optional): Field selector evaluated by the API server
+
+    Yields:
+        tuple: The event type and the pod. The initial pods are reported as LISTED,
+            changes as ADDED, MODIFIED or DELETED
+    """
+    # Imported here to keep the kubernetes package out of the import path of this module
+    from urllib3.exceptions import HTTPError  # pylint: disable=import-outside-toplevel
+
+    if namespace is None:
+        list_func, kwargs = api.list_pod_for_all_namespaces, {}
+    else:
+        list_func, kwargs = api.list_namespaced_pod, {"namespace": namespace}
+    kwargs.update(label_selector=label_selector, field_selector=field_selector)
+
+    known: Dict[Tuple[str, str], Pod] = {}
+    resource_version = yield from _resync(list_func, known, initial=True, **kwargs)
+    delay = RECONNECT_DELAY
+
+    while True:
+        try:
+            events = iter_events(list_func, resource_version, idle_timeout=WATCH_TIMEOUT + CONNECT_TIMEOUT,
+                                 timeout_seconds=WATCH_TIMEOUT, **kwargs)
+            for kind, obj in events:
+                resource_version = obj["metadata"]["resourceVersion"]
+                delay = RECONNECT_DELAY
+                if kind == "BOOKMARK":
+                    continue
+
+                pod = Pod.from_json(obj)
+                if kind == "DELETED":
+                    known.pop((pod.namespace, pod.name), None)
+                else:
+                    known[(pod.namespace, pod.name)] = pod
+                yield kind, pod
+        except ResourceExpired:
+            resource_version = yield from _resync(list_func, known, initial=False, **kwargs)
+        except (HTTPError, client.ApiException) as exc:
+            if isinstance(exc, client.ApiException) and exc.status != 429 and exc.status < 500:
+                raise
+            time.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+
+def pod_readiness(pod: Dict[str, Any]) -> Tuple[bool, Optional[str], str]:
+    """
+    Evaluate how far a pod is from having all of its containers ready
+
+    Args:
+        pod (dict): The raw pod
+
+    Returns:
+        tuple: Whether every container is ready, the reason the pod will not become
+            ready on its own if any, and a short description of its current state
+    """
+    status = pod.get("status") or {}
+    phase = status.get("phase") or "Pending"
+    statuses = status.get("containerStatuses") or []
+
+    if phase in ("Succeeded", "Failed"):
+        return False, f"pod {phase.lower()}", phase
+
+    for condition in status.get("conditions") or ():
+        if condition.get("type") == "PodScheduled" and condition.get("reason") == "Unschedulable":
+            return False, f"Unschedulable: {condition.get('message', '')}".rstrip(": "), phase
+
+    waiting = []
+    for container in statuses:
+        state = (container.get("state") or {}).get("waiting") or {}
+        reason = state.get("reason")
+        if reason in FATAL_WAITING_REASONS:
+            return False, f"container {container['name']} {reason}: {state.get('message', '')}".rstrip(": "), phase
+        if reason:
+            waiting.append(reason)
+
+    ready = sum(1 for container in statuses if container.get("ready"))
+    if phase == "Running" and statuses and ready == len(statuses):
+        return True, None, "Ready"
+
+    progress = phase if not statuses else f"{phase}, {ready}/{len(statuses)} containers ready"
+    if waiting:
+        progress += f" ({', '.join(sorted(set(waiting)))})"
+    elif not (pod.get("spec") or {}).get("nodeName"):
+        progress += " (not scheduled)"
+    return False, None, progress
+
+
+def wait_for_pod(api: client.CoreV1Api, name: str, namespace: str, timeout: float = READY_TIMEOUT,
+                 on_progress: Optional[Callable[[str], None]] = None) -> Pod:
+    """
+    Wait until every container of a pod is ready
+
+    The pod is read once and then followed with a watch on its name, so the wait ends
+    as soon as the API server reports the change instead of after a fixed delay.
+
+    Args:
+        api (client.CoreV1Api): The API to query
+        name (str): The name of the pod
+        namespace (str): The namespace of the pod
+        timeout (float, optional): Seconds to wait before giving up. Defaults to 120
+        on_progress (Callable, optional): Called with a description of the pod state
+            every time it changes
+
+    Returns:
+        Pod: The ready pod
+
+    Raises:
+        PodNotReady: If the pod fails, can not be scheduled, can not pull its image,
+            is deleted or is not ready before the timeout
+    """
+    deadline, start = time.monotonic() + timeout, time.perf_counter()
+    reported, scheduled, progress = None, False, ""
+
+    def settle(obj: Dict[str, Any]) -> Optional[Pod]:
+        nonlocal reported, scheduled, progress
+        ready, failure, progress = pod_readiness(obj)
+        if on_progress is not None and progress != reported:
+            on_progress(progress)
+            reported = progress
+        if not scheduled and (obj.get("spec") or {}).get("nodeName"):
+            scheduled = True
+            record("pod", "scheduling", start, name)
+
+        if ready:
+            record("pod", "readiness", start, name)
+            return Pod.from_json(obj)
+        if failure:
+            record("pod", "not ready", start, name)
+            raise PodNotReady(name, failure)
+        return None
+
+    pod = decode(api.read_namespaced_pod(name=name, namespace=namespace, _preload_content=False))
+    while True:
+        settled = settle(pod)
+        if settled is not None:
+            return settled
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            record("pod", "not ready", start, name)
+            raise PodNotReady(name, f"timed out after {timeout:g}s ({progress})")
+
+        # The same watch is followed until the pod settles, it is only reopened when the
+        # API server ends it
+        try:
+            events = iter_events(api.list_namespaced_pod, pod["metadata"]["resourceVersion"], idle_timeout=remaining,
+                                 timeout_seconds=math.ceil(remaining), namespace=namespace,
+                                 field_selector=f"metadata.name={name}")
+            with closing(events):
+                for kind, obj in events:
+                    if kind == "DELETED":
+                        raise PodNotReady(name, "deleted while waiting")
+                    if kind == "BOOKMARK":
+                        pod["metadata"]["resourceVersion"] = obj["metadata"]["resourceVersion"]
+                        continue
+                    pod = obj
+                    settled = settle(pod)
+                    if settled is not None:
+                        return settled
+        except ResourceExpired:
+            pod = decode(api.read_namespaced_pod(name=name, namespace=namespace, _preload_content=False))
+
+
+def wait_for_pods(api: client.CoreV1Api, names: Iterable[str], namespace: str, label_selector: str,
+                  timeout: float = READY_TIMEOUT) -> Iterator[Tuple[str, Optional[Pod], Optional[str]]]:
+    """
+    Wait until many pods sharing a label are ready, with a single watch
+
+    Args:
+        api (client.CoreV1Api): The API to query
+        names (Iterable): The names of the pods
+        namespace (str): The namespace of the pods
+        label_selector (str): Label selector matching the pods
+        timeout (float, optional): Seconds to wait before giving up. Defaults to 120
+
+    Yields:
+        tuple: The name of every pod as soon as it settles, the pod if it was seen, and
+            None if it is ready or the reason it will not become ready otherwise
+    """
+    pending, states, scheduled = set(names), {}, set()
+    deadline, start = time.monotonic() + timeout, time.perf_counter()
+    resource_version = None
+
+    def settle(obj: Dict[str, Any]) -> Iterator[Tuple[str, Optional[Pod], Optional[str]]]:
+        name = obj["metadata"]["name"]
+        if name not in pending:
+            return
+        ready, failure, states[name] = pod_readiness(obj)
+        if name not in scheduled and (obj.get("spec") or {}).get("nodeName"):
+            scheduled.add(name)
+            record("pod", "scheduling", start, name)
+        if ready or failure:
+            pending.discard(name)
+            record("pod", "readiness" if ready else "not ready", start, name)
+            yield name, Pod.from_json(obj), failure
+
+    while pending:
+        if resource_version is None:
+            for page in iter_pages(api.list_namespaced_pod, namespace=namespace, label_selector=label_selector):
+                resource_version = page["metadata"].get("resourceVersion", "")
+                for obj in page["items"]:
+                    yield from settle(obj)
+            continue
+
+        left = deadline - time.monotonic()
+        if left <= 0:
+            for name in sorted(pending):
+                yield name, None, f"timed out after {timeout:g}s ({states.get(name, 'not found')})"
+            return
+
+        try:
+            events = iter_events(api.list_namespaced_pod, resource_version, idle_timeout=left,
+                                 timeout_seconds=math.ceil(left), namespace=namespace, label_selector=label_selector)
+            with closing(events):
+                for kind, obj in events:
+                    resource_version = obj["metadata"]["resourceVersion"]
+                    if kind == "DELETED" and obj["metadata"]["name"] in pending:
+                        pending.discard(obj["metadata"]["name"])
+                        yield obj["metadata"]["name"], Pod.from_json(obj), "deleted while waiting"
+                    elif kind in ("ADDED", "MODIFIED"):
+                        yield from settle(obj)
+
+                    if not pending or time.monotonic() > deadline:
+                        break
+        except ResourceExpired:
+            resource_version = None
+
+
+def delete_pod(api: client.CoreV1Api, name: str, namespace: str) -> Optional[Pod]:
+    """
+    Delete a single pod
+
+    Args:
+        api (client.CoreV1Api): The API to use
+        name (str): The name of the pod
+        namespace (str): The namespace of the pod
+
+    Returns:
+        Pod: The pod being deleted, None if it did not exist
+    """
+    try:
+        return Pod.from_json(decode(api.delete_namespaced_pod(name=name, namespace=namespace, _preload_content=False)))
+    except client.ApiException as exc:
+        if exc.status != 404:
+            raise
+        return None
+
+
+def delete_pods(api: client.CoreV1Api, namespace: str, label_selector: str) -> List[Pod]:
+    """
+    Delete every pod of a namespace matching a label selector with a single request
+
+    Args:
+        api (client.CoreV1Api): The API to use
+        namespace (str): The namespace of the pods
+        label_selector (str): Label selector of the pods to delete
+
+    Returns:
+        list: The pods being deleted
+    """
+    response = api.delete_collection_namespaced_pod(namespace, label_selector=label_selector, _preload_content=False)
+    return [Pod.from_json(pod) for pod in decode(response).get("items") or ()]
+
+
+def wait_for_deletion(api: client.CoreV1Api, pods: Iterable[Pod], namespace: Optional[str] = None,
+                      label_selector: Optional[str] = None, timeout: float = READY_TIMEOUT,
+                      on_progress: Optional[Callable[[int], None]] = None):
+    """
+    Wait until pods are gone from the API server
+
+    The pods are listed once to drop the ones already gone, then their DELETED events
+    are followed with a single watch. A pod recreated with the same name has another
+    uid and is not waited for.
+
+    Args:
+        api (client.CoreV1Api): The API to query
+        pods (Iterable): The pods being deleted
+        namespace (str, optional): The namespace of the pods, every namespace if None
+        label_selector (str, optional): Label selector matching all of the pods
+        timeout (float, optional): Seconds to wait before giving up. Defaults to 120
+        on_progress (Callable, optional): Called with the number of remaining pods every
+            time it changes
+
+    Raises:
+        TimeoutError: If pods remain after the timeout
+    """
+    if namespace is None:
+        list_func, kwargs = api.list_pod_for_all_namespaces, {}
+    else:
+        list_func, kwargs = api.list_namespaced_pod, {"namespace": namespace}
+    kwargs["label_selector"] = label_selector
+
+    remaining = {(pod.namespace, pod.name): pod.uid for pod in pods}
+    deadline = time.monotonic() + timeout
+    resource_version, reported = None, None
+
+    while True:
+        if resource_version is None:
+            present = {}
+            for page in iter_pages(list_func, **kwargs):
+                resource_version = page["metadata"].get("resourceVersion", "")
+                for obj in page["items"]:
+                    present[(obj["metadata"].get("namespace", ""), obj["metadata"]["name"])] = obj["metadata"].get("uid")
+            remaining = {key: uid for key, uid in remaining.items() if present.get(key) == uid}
+
+        if on_progress is not None and len(remaining) != reported:
+            on_progress(len(remaining))
+            reported = len(remaining)
+        if not remaining:
+            return
+
+        left = deadline - time.monotonic()
+        if left <= 0:
+            raise TimeoutError(f"{len(remaining)} pods still terminating after {timeout:g}s")
+
+        try:
+            events = iter_events(list_func, resource_version, idle_timeout=left, timeout_seconds=math.ceil(left), **kwargs)
+            with closing(events):
+                for kind, obj in events:
+                    resource_version = obj["metadata"]["resourceVersion"]
+                    key = (obj["metadata"].get("namespace", ""), obj["metadata"].get("name"))
+                    if kind != "DELETED" or remaining.get(key) != obj["metadata"].get("uid"):
+                        continue
+
+                    del remaining[key]
+                    if not remaining or time.monotonic() > deadline:
+                        break
+                    if on_progress is not None:
+                        on_progress(len(remaining))
+                        reported = len(remaining)
+        except ResourceExpired:
+            resource_version = None
@@ -0,0 +1,461 @@
+"""
+This module contains the on-disk cache of pod and namespace listings
+
+Entries are keyed by kubeconfig context, namespace and selectors and live under
+``$XDG_CACHE_HOME/notoil/k8s``. Within the TTL an entry is served without touching the
+API server. Once stale, a single-item list tells the current resourceVersion; if it
+moved the entry is revalidated by watching from its own one, which only transfers the
+objects that changed since. The entry is re-listed when the watch does not reach the
+current version (a bookmark or an event at or past it) or the API server no longer has
+the old one. Cold listings are written to the entry row by row as they stream in.
+
+Every entry has a plain text completion index next to it, holding one
+``<name>\t<container>...`` line per object. Shell completion reads only those files and
+never waits on the cluster, so this module must not import the kubernetes package.
+"""
+################################################### Python Import ##################################
+
+import glob
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+from contextlib import closing
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+from urllib.parse import quote
+
+import click
+from click.shell_completion import CompletionItem
+
+################################################### Project Import #################################
+
+from notoil.utils.concurrency import interleave
+
+from .api import Pod, ResourceExpired, decode, iter_events, iter_pages
+
+################################################### Main Declaration ###############################
+
+DEFAULT_TTL = 15
+
+# The API server sends the backlog of a watch at once, a short pause after its first
+# event means nothing else is coming
+REVALIDATE_IDLE_TIMEOUT = 0.25
+
+# Bounds the wait for the watch response and its first event, then for the whole watch
+REVALIDATE_TIMEOUT = 3
+
+CACHE_FORMAT = 2
+
+CURRENT_CONTEXT = re.compile(r"^current-context:[ \t]*[\"']?([^\"'\n]*)[\"']?[ \t]*$", re.MULTILINE)
+
+
+def cache_options(func: Callable) -> Callable:
+    """
+    Decorator adding the `--cache-ttl` and `--no-cache` options to a command
+    """
+    func = click.option("--no-cache", is_flag=True, default=False,
+                        help="Always list from the API server and leave the cache untouched")(func)
+    func = click.option("--cache-ttl", type=click.INT, default=DEFAULT_TTL, show_default=True,
+                        help="Seconds a cached listing is used without revalidating it")(func)
+    return func
+
+
+def current_context() -> str:
+    """
+    Find the current kubeconfig context without loading the kubernetes client
+
+    Returns:
+        str: The current context name, "in-cluster" or "default" if there is none
+    """
+    paths = os.environ.get("KUBECONFIG") or os.path.join("~", ".kube", "config")
+    for path in paths.split(os.pathsep):
+        try:
+            with open(os.path.expanduser(path), "r", encoding="utf-8") as file:
+                match = CURRENT_CONTEXT.search(file.read())
+        except OSError:
+            continue
+
+        if match and match.group(1):
+            return match.group(1)
+
+    return "in-cluster" if os.environ.get("KUBERNETES_SERVICE_HOST") else "default"
+
+
+def cache_dir(context: str) -> str:
+    """
+    Return the cache directory of a context
+
+    Args:
+        context (str): The kubeconfig context
+
+    Returns:
+        str: The directory path
+    """
+    root = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(root, "notoil", "k8s", quote(context, safe=""))
+
+
+def entry_path(context: str, kind: str, namespace: str = "", label_selector: Optional[str] = None,
+               field_selector: Optional[str] = None) -> str:
+    """
+    Return the path of a cache entry
+
+    Args:
+        context (str): The kubeconfig context
+        kind (str): The cached resource, "pods" or "namespaces"
+        namespace (str, optional): The namespace of the listing
+        label_selector (str, optional): The label selector of the listing
+        field_selector (str, optional): The field selector of the listing
+
+    Returns:
+        str: The file path
+    """
+    selectors = hashlib.sha1(f"{label_selector or ''}\0{field_selector or ''}".encode()).hexdigest()[:12]
+    return os.path.join(cache_dir(context), f"{kind}-{quote(namespace, safe='')}-{selectors}.json")
+
+
+def load_entry(path: str) -> Optional[Dict[str, Any]]:
+    """
+    Load a cache entry
+
+    Args:
+        path (str): Path of the entry
+
+    Returns:
+        dict: The entry, None if it is missing, unreadable or of another format
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            entry = json.load(file)
+    except (OSError, ValueError):
+        return None
+
+    return entry if entry.get("format") == CACHE_FORMAT else None
+
+
+def completion_path(path: str) -> str:
+    """
+    Return the path of the completion index of a cache entry
+    """
+    return f"{path[:-len('.json')]}.names"
+
+
+class EntryWriter:
+    """
+    Write a cache entry and its completion index row by row into temporary files, which
+    replace the entry at once on `commit`
+
+    The rows come first in the document, so the resourceVersion, only known once the
+    listing is complete, can be written last.
+
+    Args:
+        path (str): Path of the entry
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.rows, self.committed = 0, False
+        self.entry = tempfile.NamedTemporaryFile("w", dir=os.path.dirname(path), delete=False, encoding="utf-8")
+        self.names = tempfile.NamedTemporaryFile("w", dir=os.path.dirname(path), delete=False, encoding="utf-8")
+        self.entry.write(f'{{"format":{CACHE_FORMAT},"rows":[')
+
+    def add(self, row: Any, names: str):
+        """
+        Append an object, serialized as a JSON array, and its ``<name>\t<container>...`` line
+        """
+        separator = "," if self.rows else ""
+        self.entry.write(separator + json.dumps(row, separators=(",", ":")))
+        self.names.write(("\n" if self.rows else "") + names)
+        self.rows += 1
+
+    def commit(self, resource_version: str):
+        """
+        Finish the files and atomically replace the entry and its completion index
+
+        Args:
+            resource_version (str): The resourceVersion the rows are current at
+        """
+        self.entry.write(f'],"resource_version":{json.dumps(resource_version)},"fetched_at":{time.time()}}}')
+        self.entry.close()
+        self.names.close()
+        os.replace(self.entry.name, self.path)
+        os.replace(self.names.name, completion_path(self.path))
+        self.committed = True
+
+    def discard(self):
+        """
+        Remove the temporary files of an entry that was not committed
+        """
+        if self.committed:
+            return
+        for file in (self.entry, self.names):
+            file.close()
+            try:
+                os.unlink(file.name)
+            except OSError:
+                pass
+
+
+def store_entry(path: str, resource_version: str, rows: Iterable[Any], names: Iterable[str]):
+    """
+    Atomically write a cache entry and its completion index
+
+    Args:
+        path (str): Path of the entry
+        resource_version (str): The resourceVersion the rows are current at
+        rows (Iterable): The cached objects, serialized as JSON arrays
+        names (Iterable[str]): Completion index lines, ``<name>\t<container>...``
+    """
+    writer = EntryWriter(path)
+    try:
+        for row, line in zip(rows, names):
+            writer.add(row, line)
+        writer.commit(resource_version)
+    finally:
+        writer.discard()
+
+
+def caught_up(resource_version: str, target: str) -> bool:
+    """
+    Whether a resourceVersion is at or past another one
+
+    ResourceVersions are opaque, only the etcd revisions every API server uses in practice
+    are compared, others are never considered caught up.
+    """
+    return resource_version.isdigit() and target.isdigit() and int(resource_version) >= int(target)
+
+
+def read_names(path: str) -> List[List[str]]:
+    """
+    Read the completion index of a cache entry
+
+    Args:
+        path (str): Path of the entry
+
+    Returns:
+        list: The split ``<name>\t<container>...`` lines, empty if there is no index
+    """
+    try:
+        with open(completion_path(path), "r", encoding="utf-8") as file:
+            return [line.split("\t") for line in file.read().splitlines()]
+    except OSError:
+        return []
+
+
+def invalidate(namespace: str, context: Optional[str] = None):
+    """
+    Drop every cached pod listing of a namespace, e.g. after creating or deleting pods
+
+    Args:
+        namespace (str): The namespace
+        context (str, optional): The kubeconfig context. Defaults to the current one
+    """
+    pattern = os.path.join(cache_dir(context or current_context()), f"pods-{quote(namespace, safe='')}-*.json")
+    for path in glob.glob(pattern):
+        for stale in (path, completion_path(path)):
+            try:
+                os.unlink(stale)
+            except OSError:
+                pass
+
+
+def cached_listing(path: str, list_func: Callable, from_json: Callable, from_row: Callable,
+                   key: Callable, names: Callable, ttl: int, **kwargs) -> Iterator[Any]:
+    """
+    List objects through the cache
+
+    Args:
+        path (str): Path of the cache entry
+        list_func (Callable): The list method of the API
+        from_json (Callable): Builds an object from its API representation
+        from_row (Callable): Builds an object from its cached JSON array
+        key (Callable): Returns the name of an object
+        names (Callable): Returns the completion index line of an object
+        ttl (int): Seconds the entry is used without revalidating it
+        **kwargs: Extra arguments of the list method
+
+    Yields:
+        The listed objects, streamed page by page when the cache is cold
+    """
+    entry = load_entry(path)
+
+    if entry and time.time() - entry["fetched_at"] < ttl:
+        yield from (from_row(row) for row in entry["rows"])
+        return
+
+    if entry:
+        try:
+            objects = {key(item): item for item in map(from_row, entry["rows"])}
+            resource_version = entry["resource_version"]
+            # A single-item list tells the current version, an unchanged one needs no watch
+            current = decode(list_func(limit=1, _preload_content=False, **kwargs))["metadata"].get("resourceVersion", "")
+
+            fresh = current == resource_version
+            if not fresh:
+                events = iter_events(list_func, resource_version, idle_timeout=REVALIDATE_IDLE_TIMEOUT,
+                                     timeout_seconds=REVALIDATE_TIMEOUT, request_timeout=REVALIDATE_TIMEOUT, **kwargs)
+                with closing(events):
+                    for kind, obj in events:
+                        resource_version = obj["metadata"]["resourceVersion"]
+                        if kind == "DELETED":
+                            objects.pop(obj["metadata"]["name"], None)
+                        elif kind in ("ADDED", "MODIFIED"):
+                            item = from_json(obj)
+                            objects[key(item)] = item
+                        # The version is global, events of other objects advance it too,
+                        # so a bookmark is often the only proof the watch caught up
+                        if kind == "BOOKMARK" or caught_up(resource_version, current):
+                            fresh = True
+                            break
+
+            # A watch that went quiet before reaching the current version may have missed
+            # events, the entry is then re-listed instead of being served as fresh
+            if fresh:
+                store_entry(path, resource_version, objects.values(), map(names, objects.values()))
+                yield from objects.values()
+                return
+        except ResourceExpired:
+            pass
+
+    # Rows go to disk as they stream in, so a cold listing is never held in memory
+    writer, resource_version = EntryWriter(path), ""
+    try:
+        for page in iter_pages(list_func, **kwargs):
+            resource_version = page["metadata"].get("resourceVersion", "")
+            for obj in page["items"]:
+                item = from_json(obj)
+                writer.add(item, names(item))
+                yield item
+        writer.commit(resource_version)
+    finally:
+        writer.discard()
+
+
+def cached_namespaces(api, ttl: int = DEFAULT_TTL, context: Optional[str] = None) -> Iterator[str]:
+    """
+    List namespace names through the cache
+
+    Args:
+        api (client.CoreV1Api): The API to query
+        ttl (int, optional): Seconds the entry is used without revalidating it
+        context (str, optional): The kubeconfig context. Defaults to the current one
+
+    Yields:
+        str: The name of every namespace
+    """
+    return cached_listing(
+        entry_path(context or current_context(), "namespaces"),
+        api.list_namespace,
+        from_json=lambda obj: obj["metadata"]["name"],
+        from_row=str,
+        key=str,
+        names=str,
+        ttl=ttl,
+    )
+
+
+def cached_pods(api, namespace: str, label_selector: Optional[str] = None, field_selector: Optional[str] = None,
+                ttl: int = DEFAULT_TTL, context: Optional[str] = None) -> Iterator[Pod]:
+    """
+    List the pods of a namespace through the cache
+
+    Args:
+        api (client.CoreV1Api): The API to query
+        namespace (str): The namespace to list
+        label_selector (str, optional): Label selector evaluated by the API server
+        field_selector (str, optional): Field selector evaluated by the API server
+        ttl (int, optional): Seconds the entry is used without revalidating it
+        context (str, optional): The kubeconfig context. Defaults to the current one
+
+    Yields:
+        Pod: Every matching pod of the namespace
+    """
+    return cached_listing(
+        entry_path(context or current_context(), "pods", namespace, label_selector, field_selector),
+        api.list_namespaced_pod,
+        from_json=Pod.from_json,
+        from_row=Pod.from_row,
+        key=lambda pod: pod.name,
+        names=lambda pod: "\t".join([pod.name, *(status.name for status in pod.container_statuses)]),
+        ttl=ttl,
+        namespace=namespace,
+        label_selector=label_selector,
+        field_selector=field_selector,
+    )
+
+
+def cached_pods_all_namespaces(api, label_selector: Optional[str] = None, field_selector: Optional[str] = None,
+                               ttl: int = DEFAULT_TTL, workers: int = 8, context: Optional[str] = None) -> Iterator[Pod]:
+    """
+    List the pods of every namespace through the cache, querying the namespaces concurrently
+
+    Args:
+        api (client.CoreV1Api): The API to query
+        label_selector (str, optional): Label selector evaluated by the API server
+        field_selector (str, optional): Field selector evaluated by the API server
+        ttl (int, optional): Seconds the entries are used without revalidating them
+        workers (int, optional): Number of namespaces listed concurrently. Defaults to 8
+        context (str, optional): The kubeconfig context. Defaults to the current one
+
+    Yields:
+        Pod: Every matching pod of the cluster
+    """
+    context = context or current_context()
+    namespaces = list(cached_namespaces(api, ttl, context))
+
+    yield from interleave(
+        lambda namespace: cached_pods(api, namespace, label_selector, field_selector, ttl, context),
+        namespaces,
+        workers=workers,
+    )
+
+
+def _cached_names(kind: str, namespace: str = "") -> List[List[str]]:
+    """
+    Read the completion indexes of every cached listing of a namespace, regardless of
+    their age or selectors
+    """
+    pattern = os.path.join(cache_dir(current_context()), f"{kind}-{quote(namespace, safe='')}-*.json")
+    return [line for path in glob.glob(pattern) for line in read_names(path)]
+
+
+def complete_namespaces(ctx: click.Context, param: click.Parameter, incomplete: str) -> List[CompletionItem]:
+    """
+    Shell completion of namespace names from the cache
+    """
+    try:
+        names = {line[0] for line in _cached_names("namespaces")}
+        return [CompletionItem(name) for name in sorted(names) if name.startswith(incomplete)]
+    except Exception:  # pylint: disable=broad-except
+        return []
+
+
+def complete_pods(ctx: click.Context, param: click.Parameter, incomplete: str) -> List[CompletionItem]:
+    """
+    Shell completion of pod names from the cache
+    """
+    try:
+        names = {line[0] for line in _cached_names("pods", ctx.params.get("namespace") or "default")}
+        return [CompletionItem(name) for name in sorted(names) if name.startswith(incomplete)]
+    except Exception:  # pylint: disable=broad-except
+        return []
+
+
+def complete_containers(ctx: click.Context, param: click.Parameter, incomplete: str) -> List[CompletionItem]:
+    """
+    Shell completion of the container names of the selected pod from the cache
+    """
+    try:
+        # Click leaves the positional in ctx.args while completing a trailing option
+        pod_name = ctx.params.get("pod") or next(iter(ctx.args), None)
+        names = {
+            container
+            for line in _cached_names("pods", ctx.params.get("namespace") or "default") if line[0] == pod_name
+            for container in line[1:]
+        }
+        return [CompletionItem(name) for name in sorted(names) if name.startswith(incomplete)]
+    except Exception:  # pylint: disable=broad-except
+        return []
@@ -0,0 +1,340 @@
+"""
+This module contains the packet capture command
+
+tcpdump runs on the node through its pooled node-shell and writes pcap to its stdout,
+which is streamed over the exec websocket straight into local files. Packets are never
+stored on the node, and locally only the record being received is held in memory, so
+captures can run for as long as needed during high-traffic incidents. Rotation by size
+or time, and the ring of kept files, are handled locally on record boundaries.
+
+tcpdump is stopped as soon as the input of the exec session is closed, so interrupting
+the capture never leaves it running on the node.
+"""
+################################################### Python Import ##################################
+
+from __future__ import annotations
+
+import os
+import shlex
+import struct
+import threading
+import time
+from typing import BinaryIO, Optional
+
+import click
+
+################################################### Project Import #################################
+
+from notoil.utils.imports import LazyModule
+
+from .api import READY_TIMEOUT, load_config, read_pod
+from .cache import complete_namespaces, complete_pods
+from .execute import exec_command
+from .pod import wait_until_ready
+from .pool import DEFAULT_IDLE_TTL, NAMESPACE, acquire_node_shell, node_shell_in_use
+from .throttle import throttled_api
+
+################################################### Main Declaration ###############################
+
+client = LazyModule("kubernetes.client")
+
+GLOBAL_HEADER_SIZE = 24
+
+RECORD_HEADER_SIZE = 16
+
+# Magic numbers of pcap with microsecond and nanosecond timestamps, as written
+PCAP_MAGICS = {b"\xd4\xc3\xb2\xa1": "<", b"\xa1\xb2\xc3\xd4": ">", b"\x4d\x3c\xb2\xa1": "<", b"\xa1\xb2\x3c\x4d": ">"}
+
+DEFAULT_SNAPLEN = 262144
+
+RUNC_ROOT = "/run/containerd/runc/k8s.io"
+
+
+class PcapWriter:
+    """
+    File-like sink splitting a pcap stream into rotated files
+
+    Chunks may end anywhere, records are reassembled so every file starts with the
+    global header and holds whole packets. Only the partial record being received is
+    buffered.
+
+    Args:
+        path (str): The output file, rotated files are numbered before the extension
+        rotate_size (int, optional): Bytes after which a new file is started
+        rotate_seconds (float, optional): Seconds after which a new file is started
+        files (int, optional): Number of rotated files kept, the oldest are deleted. 0 keeps them all
+    """
+
+    def __init__(self, path: str, rotate_size: Optional[int] = None, rotate_seconds: Optional[float] = None,
+                 files: int = 0):
+        self.path = path
+        self.rotate_size = rotate_size
+        self.rotate_seconds = rotate_seconds
+        self.files = files
+        self.rotating = bool(rotate_size or rotate_seconds)
+
+        self.buffer = bytearray()
+        self.header: Optional[bytes] = None
+        self.record = None
+        self.file: Optional[BinaryIO] = None
+        self.index = -1
+        self.size = 0
+        self.opened = 0.0
+        self.packets = 0
+        self.bytes = 0
+        # Rotation on time also runs from `rotate_idle`, in another thread
+        self.lock = threading.Lock()
+
+    def file_path(self, index: int) -> str:
+        """
+        Return the path of a rotated file, e.g. capture-00003.pcap
+        """
+        if not self.rotating:
+            return self.path
+        root, ext = os.path.splitext(self.path)
+        return f"{root}-{index:05d}{ext or '.pcap'}"
+
+    def _open_next(self):
+        if self.file is not None:
+            self.file.close()
+        self.index += 1
+        self.file = open(self.file_path(self.index), "wb")  # pylint: disable=consider-using-with
+        self.file.write(self.header)
+        self.size = len(self.header)
+        self.opened = time.monotonic()
+
+        if self.files and self.index >= self.files:
+            try:
+                os.unlink(self.file_path(self.index - self.files))
+            except OSError:
+                pass
+
+    def _due(self, length: int) -> bool:
+        if self.rotate_size and self.size > len(self.header) and self.size + length > self.rotate_size:
+            return True
+        return bool(self.rotate_seconds and time.monotonic() - self.opened >= self.rotate_seconds)
+
+    def write(self, data: bytes) -> int:
+        """
+        Consume a chunk of the pcap stream
+
+        Raises:
+            ValueError: If the stream is not pcap
+        """
+        with self.lock:
+            return self._write(data)
+
+    def _write(self, data: bytes) -> int:
+        self.buffer += data
+        if self.header is None:
+            if len(self.buffer) < GLOBAL_HEADER_SIZE:
+                return len(data)
+            order = PCAP_MAGICS.get(bytes(self.buffer[:4]))
+            if order is None:
+                raise ValueError(f"Not a pcap stream: {bytes(self.buffer[:64])!r}")
+            self.header = bytes(self.buffer[:GLOBAL_HEADER_SIZE])
+            self.record = struct.Struct(f"{order}IIII")
+            del self.buffer[:GLOBAL_HEADER_SIZE]
+            self._open_next()
+
+        offset = 0
+        while len(self.buffer) - offset >= RECORD_HEADER_SIZE:
+            length = RECORD_HEADER_SIZE + self.record.unpack_from(self.buffer, offset)[2]
+            if len(self.buffer) - offset < length:
+                break
+            if self._due(length):
+                self._open_next()
+            self.file.write(self.buffer[offset:offset + length])
+            self.size += length
+            self.packets += 1
+            self.bytes += length
+            offset += length
+        del self.buffer[:offset]
+        return len(data)
+
+    def rotate_idle(self, stop: threading.Event, interval: float = 1.0):
+        """
+        Rotate on time while no packet arrives, until `stop` is set
+
+        `write` only checks the rotation when a packet arrives, a quiet capture would
+        otherwise never start a new file nor prune the oldest ones.
+
+        Args:
+            stop (threading.Event): Set once the capture ended
+            interval (float, optional): Seconds between checks. Defaults to 1
+        """
+        while not stop.wait(interval):
+            with self.lock:
+                if self.file is not None and self._due(0):
+                    self._open_next()
+
+    def flush(self):
+        """
+        Flush the current file, so packets are readable while the capture runs
+        """
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+
+    def close(self):
+        """
+        Close the current file
+        """
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def pod_interface_script(container_id: str) -> str:
+    """
+    Build a shell snippet finding the host side interface of a pod, stored in $IFACE
+
+    The veth peer of the pod's eth0 is resolved from the network namespace of its
+    container, so the container image needs no tools.
+
+    Args:
+        container_id (str): The ID of a running container of the pod, without runtime prefix
+
+    Returns:
+        str: The shell snippet, run on the node
+    """
+    return (
+        f"PID=$(runc --root {RUNC_ROOT} state {shlex.quote(container_id)} "
+        "| sed -n 's/.*\"pid\": *\\([0-9]*\\).*/\\1/p'); "
+        "INDEX=$(nsenter -t \"$PID\" -n -- ip -o link show eth0 | sed -n 's/.*@if\\([0-9]*\\).*/\\1/p'); "
+        "IFACE=$(ip -o link | sed -n \"s/^$INDEX: \\([^:@]*\\).*/\\1/p\"); "
+        "[ -n \"$IFACE\" ] || { echo \"interface of the pod not found\" >&2; exit 1; }; "
+    )
+
+
+def tcpdump_command(interface: Optional[str], bpf_filter: Optional[str], snaplen: int = DEFAULT_SNAPLEN,
+                    count: Optional[int] = None, duration: Optional[int] = None) -> str:
+    """
+    Build the tcpdump command writing packets to stdout as soon as they are captured
+
+    tcpdump runs in the background of a shell which kills it once its input is closed,
+    as nothing else would stop it on the node after the exec session went away. The
+    input is kept on fd 3, background jobs of a script read /dev/null.
+
+    Args:
+        interface (str, optional): The interface, None to use $IFACE
+        bpf_filter (str, optional): A BPF filter expression
+        snaplen (int, optional): Bytes captured per packet. Defaults to 262144
+        count (int, optional): Stop after this many packets
+        duration (int, optional): Stop after this many seconds
+
+    Returns:
+        str: The command, run on the node
+    """
+    command = ["tcpdump", "-U", "-w", "-", "-s", str(snaplen)]
+    if count:
+        command += ["-c", str(count)]
+    line = " ".join(shlex.quote(part) for part in command)
+    line += f" -i {shlex.quote(interface)}" if interface else ' -i "$IFACE"'
+    if bpf_filter:
+        line += f" {shlex.quote(bpf_filter)}"
+    if duration:
+        line = f"timeout {duration} {line}"
+    return f"exec 3<&0; {line} & PID=$!; {{ cat <&3; kill $PID; }} >/dev/null 2>&1 & wait $PID"
+
+
+@click.command(name="capture", help="Capture packets on a node or pod into local pcap files")
+@click.argument("node", type=click.STRING, required=False, default=None)
+@click.option("--pod", "-p", type=click.STRING, default=None, shell_complete=complete_pods,
+              help="Capture on the interface of this pod, on its node")
+@click.option("--namespace", "-n", type=click.STRING, default="default", shell_complete=complete_namespaces,
+              help="Namespace of the pod")
+@click.option("--output", "-w", type=click.Path(dir_okay=False, allow_dash=True), required=True,
+              help="The pcap file, - for stdout")
+@click.option("--interface", "-i", type=click.STRING, default=None, help="Interface on the node. Defaults to any")
+@click.option("--filter", "-f", "bpf_filter", type=click.STRING, default=None, help="BPF filter expression")
+@click.option("--snaplen", "-s", type=click.IntRange(min=1), default=DEFAULT_SNAPLEN, show_default=True,
+              help="Bytes captured per packet")
+@click.option("--count", "-c", type=click.IntRange(min=1), default=None, help="Stop after this many packets")
+@click.option("--duration", "-d", type=click.IntRange(min=1), default=None, help="Stop after this many seconds")
+@click.option("--rotate-size", type=click.FloatRange(min=0, min_open=True), default=None,
+              help="Start a new file after this many megabytes")
+@click.option("--rotate-seconds", type=click.FloatRange(min=0, min_open=True), default=None,
+              help="Start a new file after this many seconds")
+@click.option("--files", type=click.IntRange(min=0), default=0, show_default=True,
+              help="Rotated files kept, the oldest are deleted. 0 keeps every file")
+@click.option("--idle-ttl", type=click.INT, default=DEFAULT_IDLE_TTL, show_default=True,
+              help="Seconds a new pooled node-shell may stay unused before `gc` deletes it")
+@click.option("--timeout", type=click.FLOAT, default=READY_TIMEOUT, show_default=True,
+              help="Seconds to wait for the node-shell to be ready")
+def capture(node: Optional[str], pod: Optional[str], namespace: str, output: str, interface: Optional[str],
+            bpf_filter: Optional[str], snaplen: int = DEFAULT_SNAPLEN, count: Optional[int] = None,
+            duration: Optional[int] = None, rotate_size: Optional[float] = None, rotate_seconds: Optional[float] = None,
+            files: int = 0, idle_ttl: int = DEFAULT_IDLE_TTL, timeout: float = READY_TIMEOUT):
+    """
+    Capture packets on a node or pod into local pcap files
+
+    Args:
+        node (str, optional): The node to capture on, required without `pod`
+        pod (str, optional): Capture on the interface of this pod, on its node
+        namespace (str): The namespace of the pod
+        output (str): The pcap file, "-" for stdout
+        interface (str, optional): The interface on the node. Defaults to any
+        bpf_filter (str, optional): BPF filter expression
+        snaplen (int, optional): Bytes captured per packet. Defaults to 262144
+        count (int, optional): Stop after this many packets
+        duration (int, optional): Stop after this many seconds
+        rotate_size (float, optional): Start a new file after this many megabytes
+        rotate_seconds (float, optional): Start a new file after this many seconds
+        files (int, optional): Rotated files kept, the oldest are deleted. Defaults to 0, all
+        idle_ttl (int, optional): Seconds a new pooled node-shell may stay unused before `gc` deletes it
+        timeout (float, optional): Seconds to wait for the node-shell to be ready. Defaults to 120
+    """
+    if bool(node) == bool(pod):
+        raise click.UsageError("Pass either a NODE or --pod")
+    if pod and interface:
+        raise click.UsageError("--interface can not be combined with --pod")
+    if output == "-" and (rotate_size or rotate_seconds):
+        raise click.UsageError("Rotation needs an output file")
+    if files and not (rotate_size or rotate_seconds):
+        raise click.UsageError("--files needs --rotate-size or --rotate-seconds")
+
+    load_config()
+    api = throttled_api()
+
+    script = ""
+    if pod:
+        try:
+            target = read_pod(api, pod, namespace)
+        except client.ApiException as exc:
+            raise click.ClickException(f"Pod {pod} in namespace {namespace}: {exc.reason}") from exc
+        running = [cnt for cnt in target.container_statuses if cnt.container_id]
+        if not target.node_name or not running:
+            raise click.ClickException(f"Pod {pod} in namespace {namespace} is not running")
+        node = target.node_name
+        script = pod_interface_script(running[0].container_id.split("://", 1)[-1])
+    script += tcpdump_command(None if pod else interface or "any", bpf_filter, snaplen, count, duration)
+
+    shell_pod, created = acquire_node_shell(api, node, idle_ttl=idle_ttl, timeout=timeout)
+    click.echo(f"{'Created' if created else 'Reusing'} node-shell {shell_pod} on node {node}", err=True)
+    wait_until_ready(api, shell_pod, NAMESPACE, timeout)
+
+    stdout = click.get_binary_stream("stdout")
+    writer = PcapWriter(output, int(rotate_size * 1e6) if rotate_size else None, rotate_seconds, files)
+    stop = threading.Event()
+    if rotate_seconds:
+        threading.Thread(target=writer.rotate_idle, args=(stop, min(1.0, rotate_seconds)), daemon=True).start()
+    try:
+        with node_shell_in_use(api, shell_pod):
+            code = exec_command(api, shell_pod, NAMESPACE, ["bash", "-c", script],
+                                stdout=stdout if output == "-" else writer, stdin=True)
+    except ValueError as exc:
+        raise click.ClickException(str(exc)) from exc
+    except client.ApiException as exc:
+        raise click.ClickException(f"Exec in node-shell {shell_pod}: {exc.reason}") from exc
+    except KeyboardInterrupt:
+        code = 0
+    finally:
+        stop.set()
+        writer.close()
+
+    if output != "-":
+        click.echo(f"Wrote {writer.packets} packets ({writer.bytes} bytes) to {writer.index + 1} file(s)", err=True)
+    if code not in (0, 124):
+        raise click.ClickException(f"tcpdump exited with {code}")
@@ -0,0 +1,129 @@
+"""
+This module contains the fan-out of the k8s commands over several kubeconfig contexts
+
+Every context is loaded once into its own ApiClient, so each cluster keeps its own
+connection pool and credentials. Clusters are queried concurrently and their results
+are streamed as soon as any of them answers, so a slow or unreachable cluster does not
+hold back the others.
+"""
+################################################### Python Import ##################################
+
+from __future__ import annotations
+
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+import click
+
+################################################### Project Import #################################
+
+from notoil.utils.concurrency import interleave
+from notoil.utils.imports import LazyModule
+from notoil.utils.timings import span
+
+from .throttle import throttled_api
+
+################################################### Main Declaration ###############################
+
+client = LazyModule("kubernetes.client")
+
+config = LazyModule("kubernetes.config")
+
+DEFAULT_CONTEXT_WORKERS = 16
+
+
+def context_options(func: Callable) -> Callable:
+    """
+    Decorator adding the `--contexts` and `--all-contexts` options to a command
+    """
+    func = click.option("--all-contexts", is_flag=True, default=False,
+                        help="Run against every context of the kubeconfig")(func)
+    func = click.option("--contexts", type=click.STRING, default=None,
+                        help="Comma separated kubeconfig contexts to run against concurrently")(func)
+    return func
+
+
+def resolve_contexts(contexts: Optional[str], all_contexts: bool) -> Optional[List[str]]:
+    """
+    Turn the `--contexts` and `--all-contexts` options into a list of context names
+
+    Args:
+        contexts (str, optional): Comma separated context names
+        all_contexts (bool): Use every context of the kubeconfig
+
+    Returns:
+        list: The context names, None when the command runs against the current context only
+
+    Raises:
+        click.UsageError: If both options are given or a context does not exist
+    """
+    if contexts and all_contexts:
+        raise click.UsageError("--contexts can not be combined with --all-contexts")
+    if not contexts and not all_contexts:
+        return None
+
+    try:
+        known = [context["name"] for context in config.list_kube_config_contexts()[0]]
+    except config.ConfigException as exc:
+        raise click.UsageError(str(exc)) from exc
+
+    if all_contexts:
+        return known
+
+    names = list(dict.fromkeys(name.strip() for name in contexts.split(",") if name.strip()))
+    missing = [name for name in names if name not in known]
+    if missing:
+        raise click.UsageError(f"Unknown context(s): {', '.join(missing)}")
+    return names
+
+
+def api_for_context(context: str) -> client.CoreV1Api:
+    """
+    Build an API bound to a kubeconfig context, without touching the default configuration
+
+    Args:
+        context (str): The context name
+
+    Returns:
+        client.CoreV1Api: The throttled API, backed by a connection pool of its own
+    """
+    configuration = client.Configuration()
+    with span("config", "load context", context):
+        config.load_kube_config(context=context, client_configuration=configuration)
+    return throttled_api(configuration)
+
+
+def across_contexts(func: Callable[[str, client.CoreV1Api], Iterable[Any]], contexts: List[str],
+                    workers: int = DEFAULT_CONTEXT_WORKERS) -> Iterator[Tuple[str, Any]]:
+    """
+    Run a function against every context concurrently and merge the results
+
+    A failing context is reported on stderr without stopping the others.
+
+    Args:
+        func (Callable): Called with the context name and its API, returns the results of the context
+        contexts (list): The context names
+        workers (int, optional): Number of contexts queried concurrently. Defaults to 16
+
+    Yields:
+        tuple: The context name and every result, as soon as any context returns it
+
+    Raises:
+        click.ClickException: Once every context is done, if any of them failed
+    """
+    # Imported here to keep the kubernetes package out of the import path of this module
+    from urllib3.exceptions import HTTPError  # pylint: disable=import-outside-toplevel
+
+    failed = []
+
+    def run(context: str) -> Iterator[Tuple[str, Any]]:
+        try:
+            for item in func(context, api_for_context(context)):
+                yield context, item
+        except (client.ApiException, config.ConfigException, HTTPError, OSError, TimeoutError) as exc:
+            failed.append(context)
+            click.echo(f"{context}: {getattr(exc, 'reason', None) or exc}", err=True)
+
+    yield from interleave(run, contexts, workers=workers)
+
+    if failed:
+        raise click.ClickException(f"Failed on {len(failed)} of {len(contexts)} contexts: {', '.join(sorted(failed))}")
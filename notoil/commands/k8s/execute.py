@@ -0,0 +1,338 @@
+"""
+This module contains the exec engine used by the k8s commands
+
+Commands run over the exec websocket of the API server with the configuration that is
+already loaded, so no kubectl process is spawned and the kubeconfig and its auth
+plugins are not evaluated again for every exec.
+"""
+################################################### Python Import ##################################
+
+from __future__ import annotations
+
+import functools
+import json
+import os
+import select
+import signal
+import time
+from contextlib import contextmanager, nullcontext
+from typing import BinaryIO, Iterator, List, Optional
+
+import click
+
+################################################### Project Import #################################
+
+from notoil.utils.imports import LazyModule
+from notoil.utils.timings import record, span
+
+from .throttle import throttle
+
+################################################### Main Declaration ###############################
+
+client = LazyModule("kubernetes.client")
+
+STDIN_CHANNEL = 0
+
+STDOUT_CHANNEL = 1
+
+STDERR_CHANNEL = 2
+
+ERROR_CHANNEL = 3
+
+RESIZE_CHANNEL = 4
+
+CLOSE_CHANNEL = 255
+
+# v5 adds closing stdin, servers without it pick v4
+PROTOCOLS = "v5.channel.k8s.io, v4.channel.k8s.io"
+
+POLL_INTERVAL = 0.25
+
+READ_SIZE = 4096
+
+
+def _open_websocket(configuration, _method: str, url: str, **kwargs):
+    """
+    Replacement of `ApiClient.request` opening the exec websocket
+
+    Unlike `kubernetes.stream.stream`, the output is not also captured in memory, so
+    long running sessions keep a bounded footprint.
+    """
+    # Imported here to keep the kubernetes package out of the import path of this module
+    from kubernetes.stream.ws_client import WSClient, get_websocket_url  # pylint: disable=import-outside-toplevel
+    from websocket import WebSocketException  # pylint: disable=import-outside-toplevel
+
+    headers = {**(kwargs.get("headers") or {}), "sec-websocket-protocol": PROTOCOLS}
+    try:
+        return WSClient(configuration, get_websocket_url(url, kwargs.get("query_params")), headers,
+                        capture_all=False, binary=True)
+    except (WebSocketException, OSError) as exc:
+        error = client.ApiException(status=getattr(exc, "status_code", 0), reason=str(exc))
+        error.headers = getattr(exc, "resp_headers", None)
+        raise error from exc
+
+
+def open_exec(api: client.CoreV1Api, name: str, namespace: str, command: List[str], container: Optional[str] = None,
+              stdin: bool = False, tty: bool = False):
+    """
+    Open an exec session in a container
+
+    The websocket is carried by a dedicated ApiClient sharing the configuration of `api`,
+    so the session reuses its credentials and throttling without swapping the request
+    method of a client other threads may be using.
+
+    Args:
+        api (client.CoreV1Api): The API whose configuration is used
+        name (str): The name of the pod
+        namespace (str): The namespace of the pod
+        command (list): The command and its arguments
+        container (str, optional): The container, required for pods with several containers
+        stdin (bool, optional): Attach the standard input. Defaults to False
+        tty (bool, optional): Allocate a TTY, stderr is then merged into stdout. Defaults to False
+
+    Returns:
+        WSClient: The open session, channels are read and written as bytes
+    """
+    api_client = client.ApiClient(api.api_client.configuration)
+    api_client.request = throttle(functools.partial(_open_websocket, api_client.configuration),
+                                  api_client.configuration.host)
+
+    kwargs = {"container": container} if container else {}
+    return client.CoreV1Api(api_client).connect_get_namespaced_pod_exec(
+        name, namespace, command=command, stdin=stdin, stdout=True, stderr=not tty, tty=tty,
+        _preload_content=False, **kwargs,
+    )
+
+
+def exit_code(session) -> int:
+    """
+    Read the exit code of a closed exec session
+
+    Args:
+        session (WSClient): The closed session
+
+    Returns:
+        int: The exit code of the command
+
+    Raises:
+        client.ApiException: If the command could not be run
+    """
+    raw = session.read_channel(ERROR_CHANNEL)
+    if not raw:
+        raise client.ApiException(status=0, reason="exec session closed without an exit status")
+
+    status = json.loads(raw)
+    if status.get("status") == "Success":
+        return 0
+    for cause in (status.get("details") or {}).get("causes") or ():
+        if cause.get("reason") == "ExitCode":
+            return int(cause["message"])
+    raise client.ApiException(status=0, reason=status.get("message", "exec failed"))
+
+
+def close_stdin(session) -> bool:
+    """
+    Signal the end of the input to the command of a session
+
+    Args:
+        session (WSClient): The session
+
+    Returns:
+        bool: Whether the server supports closing the input, only v5 of the protocol does
+    """
+    from websocket import ABNF  # pylint: disable=import-outside-toplevel
+
+    if (session.sock.getheaders() or {}).get("sec-websocket-protocol") != "v5.channel.k8s.io":
+        return False
+
+    # `write_channel` only encodes channel numbers below 128
+    session.sock.send(bytes([CLOSE_CHANNEL, STDIN_CHANNEL]), opcode=ABNF.OPCODE_BINARY)
+    return True
+
+
+def _buffered(session) -> bool:
+    """
+    Whether a session already holds received bytes its socket will not report as readable
+
+    Args:
+        session (WSClient): The session
+
+    Returns:
+        bool: Whether the SSL layer or the websocket frame buffer hold unread bytes
+    """
+    pending = getattr(session.sock.sock, "pending", None)
+    frame_buffer = getattr(session.sock, "frame_buffer", None)
+    return bool(pending and pending()) or any(getattr(frame_buffer, "recv_buffer", ()))
+
+
+def _update(session, timeout: Optional[float] = 0):
+    """
+    Read at most one frame of a session into its channels, like `WSClient.update`
+
+    `WSClient.update` polls the socket before reading, but the SSL layer decrypts whole
+    records and may already hold the next frames, leaving nothing to poll. Those are
+    read at once instead of waiting for more bytes from the server.
+
+    Args:
+        session (WSClient): The session
+        timeout (float, optional): Seconds to wait for a frame, None waits forever. Defaults to 0
+    """
+    if not _buffered(session):
+        session.update(timeout=timeout)
+        return
+
+    from websocket import ABNF  # pylint: disable=import-outside-toplevel
+
+    # pylint: disable=protected-access
+    op_code, frame = session.sock.recv_data_frame(True)
+    if op_code == ABNF.OPCODE_CLOSE:
+        session._connected = False
+    elif op_code in (ABNF.OPCODE_BINARY, ABNF.OPCODE_TEXT) and len(frame.data) > 1:
+        channel, data = frame.data[0], frame.data[1:]
+        session._channels[channel] = session._channels.get(channel, b"") + data
+
+
+def _forward_output(session, stdout: BinaryIO, stderr: BinaryIO) -> int:
+    """
+    Write the output received by a session to the local streams
+
+    Args:
+        session (WSClient): The session
+        stdout (BinaryIO): Destination of the stdout channel
+        stderr (BinaryIO): Destination of the stderr channel
+
+    Returns:
+        int: The number of bytes written
+    """
+    written = 0
+    for channel, stream in ((STDOUT_CHANNEL, stdout), (STDERR_CHANNEL, stderr)):
+        data = session.read_channel(channel)
+        if data:
+            stream.write(data)
+            stream.flush()
+            written += len(data)
+    return written
+
+
+def exec_command(api: client.CoreV1Api, name: str, namespace: str, command: List[str], container: Optional[str] = None,
+                 stdout: Optional[BinaryIO] = None, stderr: Optional[BinaryIO] = None, stdin: bool = False) -> int:
+    """
+    Run a command in a container without writing to its input and stream its output
+
+    Args:
+        api (client.CoreV1Api): The API whose configuration is used
+        name (str): The name of the pod
+        namespace (str): The namespace of the pod
+        command (list): The command and its arguments
+        container (str, optional): The container, required for pods with several containers
+        stdout (BinaryIO, optional): Destination of the output. Defaults to the standard output
+        stderr (BinaryIO, optional): Destination of the errors. Defaults to the standard error
+        stdin (bool, optional): Attach an input that is never written, and closed when the
+            wait is interrupted, e.g. for commands stopping on its end. Defaults to False
+
+    Returns:
+        int: The exit code of the command
+    """
+    stdout = stdout or click.get_binary_stream("stdout")
+    stderr = stderr or click.get_binary_stream("stderr")
+
+    start = time.perf_counter()
+    session = open_exec(api, name, namespace, command, container, stdin=stdin)
+    received = 0
+    try:
+        while session.is_open():
+            _update(session, timeout=None)
+            received += _forward_output(session, stdout, stderr)
+        received += _forward_output(session, stdout, stderr)
+        return exit_code(session)
+    except KeyboardInterrupt:
+        # Closing the websocket also ends the input on servers without v5 of the protocol
+        if stdin and session.is_open():
+            close_stdin(session)
+        raise
+    finally:
+        session.close()
+        record("exec", "command", start, f"{namespace}/{name}", received=received)
+
+
+@contextmanager
+def raw_terminal(fd: int) -> Iterator[None]:
+    """
+    Put a terminal in raw mode, so keys like Ctrl-C reach the remote TTY
+
+    Args:
+        fd (int): The file descriptor of the terminal
+    """
+    # Imported here as they only exist on POSIX systems
+    import termios  # pylint: disable=import-outside-toplevel
+    import tty  # pylint: disable=import-outside-toplevel
+
+    previous = termios.tcgetattr(fd)
+    tty.setraw(fd)
+    try:
+        yield
+    finally:
+        termios.tcsetattr(fd, termios.TCSADRAIN, previous)
+
+
+def exec_interactive(api: client.CoreV1Api, name: str, namespace: str, command: List[str],
+                     container: Optional[str] = None) -> int:
+    """
+    Run a command in a container attached to the local terminal
+
+    A TTY is allocated when the standard input and output are terminals, the remote TTY
+    then follows the size of the local one. Otherwise the standard input is streamed to
+    the command, like `kubectl exec -i`.
+
+    Args:
+        api (client.CoreV1Api): The API whose configuration is used
+        name (str): The name of the pod
+        namespace (str): The namespace of the pod
+        command (list): The command and its arguments
+        container (str, optional): The container, required for pods with several containers
+
+    Returns:
+        int: The exit code of the command
+    """
+    stdin = click.get_binary_stream("stdin")
+    stdout = click.get_binary_stream("stdout")
+    stderr = click.get_binary_stream("stderr")
+    tty = stdin.isatty() and stdout.isatty()
+    fd = stdin.fileno()
+
+    with span("exec", "open session", f"{namespace}/{name}"):
+        session = open_exec(api, name, namespace, command, container, stdin=True, tty=tty)
+    resized = [tty]
+    previous_handler = None
+    if tty and hasattr(signal, "SIGWINCH"):
+        previous_handler = signal.signal(signal.SIGWINCH, lambda *_: resized.__setitem__(0, True))
+
+    try:
+        with raw_terminal(fd) if tty else nullcontext():
+            reading = True
+            while session.is_open():
+                if resized[0]:
+                    resized[0] = False
+                    size = os.get_terminal_size(stdout.fileno())
+                    session.write_channel(RESIZE_CHANNEL, json.dumps({"Width": size.columns, "Height": size.lines}).encode())
+
+                readable, _, _ = select.select([session.sock.sock] + ([fd] if reading else []), [], [], POLL_INTERVAL)
+                if fd in readable:
+                    data = os.read(fd, READ_SIZE)
+                    if data:
+                        session.write_stdin(data)
+                    else:
+                        reading = False
+                        close_stdin(session)
+                if session.sock.sock in readable:
+                    _update(session)
+                    while session.is_open() and _buffered(session):
+                        _update(session)
+                    _forward_output(session, stdout, stderr)
+
+        _forward_output(session, stdout, stderr)
+        return exit_code(session)
+    finally:
+        if previous_handler is not None:
+            signal.signal(signal.SIGWINCH, previous_handler)
+        session.close()
@@ -0,0 +1,288 @@
+"""
+This module contains the multiplexed log streaming command
+
+A single watch finds the matching pods while every container instance is followed by
+a thread feeding one bounded queue. A slow terminal therefore blocks the readers, which
+stop reading their sockets, instead of buffering logs in memory. Streams dropped by the
+API server are resumed where they stopped, restarted containers and new pods are
+attached as they appear.
+"""
+################################################### Python Import ##################################
+
+from __future__ import annotations
+
+import calendar
+import itertools
+import math
+import threading
+import time
+from queue import Full, Queue
+from typing import Dict, Optional, Set, Tuple
+
+import click
+
+################################################### Project Import #################################
+
+from notoil.utils.imports import LazyModule
+
+from .api import (CONNECT_TIMEOUT, RECONNECT_DELAY, ContainerStatus, Pod, decode, iter_pods, iter_pods_all_namespaces,
+                  load_config, watch_pods)
+from .cache import complete_namespaces, complete_pods
+from .throttle import throttled_api
+
+################################################### Main Declaration ###############################
+
+client = LazyModule("kubernetes.client")
+
+BUFFER_LINES = 1024
+
+DEFAULT_MAX_STREAMS = 50
+
+COLORS = ("cyan", "green", "yellow", "magenta", "blue", "red")
+
+
+def timestamp_key(stamp: str) -> Tuple[str, str]:
+    """
+    Make RFC3339 timestamps with a variable number of fraction digits comparable
+
+    Args:
+        stamp (str): A timestamp like 2025-01-01T00:00:00.5Z
+
+    Returns:
+        tuple: The seconds and the fraction padded to nanoseconds
+    """
+    seconds, _, fraction = stamp.rstrip("Z").partition(".")
+    return seconds, fraction.ljust(9, "0")
+
+
+def seconds_since(stamp: str) -> int:
+    """
+    Return the `since_seconds` value covering a timestamp, with a margin for clock skew
+
+    Args:
+        stamp (str): An RFC3339 timestamp
+
+    Returns:
+        int: Whole seconds elapsed since the timestamp, plus a margin
+    """
+    elapsed = time.time() - calendar.timegm(time.strptime(stamp[:19], "%Y-%m-%dT%H:%M:%S"))
+    return max(1, math.ceil(elapsed) + 2)
+
+
+def container_running(api: client.CoreV1Api, pod: Pod, container: ContainerStatus) -> bool:
+    """
+    Check whether a container instance is still running
+
+    Args:
+        api (client.CoreV1Api): The API to query
+        pod (Pod): The pod of the container
+        container (ContainerStatus): The container instance
+
+    Returns:
+        bool: False once the pod is gone or the container stopped or restarted
+    """
+    try:
+        obj = decode(api.read_namespaced_pod(name=pod.name, namespace=pod.namespace, _preload_content=False))
+    except client.ApiException as exc:
+        if exc.status != 404:
+            raise
+        return False
+
+    for status in (obj.get("status") or {}).get("containerStatuses") or ():
+        if status["name"] == container.name:
+            return status.get("containerID") == container.container_id and "running" in (status.get("state") or {})
+    return False
+
+
+def follow_container(api: client.CoreV1Api, pod: Pod, container: ContainerStatus, prefix: str, lines: Queue,
+                     stop: threading.Event, follow: bool = True, tail_lines: Optional[int] = None,
+                     since_seconds: Optional[int] = None, timestamps: bool = False):
+    """
+    Stream the log of a container instance to a queue
+
+    Timestamps are always requested, so a dropped stream is resumed from its last line
+    without repeating it: the lines replayed up to the last one already forwarded are
+    skipped. The stream ends once the container instance stops running.
+
+    Args:
+        api (client.CoreV1Api): The API to query
+        pod (Pod): The pod of the container
+        container (ContainerStatus): The container instance
+        prefix (str): The prefix of the lines of this container
+        lines (Queue): The bounded queue receiving (prefix, line) tuples
+        stop (threading.Event): Set to stop streaming
+        follow (bool, optional): Keep streaming new lines. Defaults to True
+        tail_lines (int, optional): Start with this many of the last lines
+        since_seconds (int, optional): Start with the lines of the last seconds
+        timestamps (bool, optional): Keep the timestamps in the output. Defaults to False
+    """
+    # Imported here to keep the kubernetes package out of the import path of this module
+    from kubernetes.watch.watch import iter_resp_lines  # pylint: disable=import-outside-toplevel
+    from urllib3.exceptions import HTTPError  # pylint: disable=import-outside-toplevel
+
+    # The lines already forwarded with the latest timestamp, several lines may share one
+    last, last_key, last_lines = None, None, []
+    while not stop.is_set():
+        window = {"tail_lines": tail_lines, "since_seconds": since_seconds} if last is None \
+            else {"since_seconds": seconds_since(last)}
+        replayed = last_key
+        try:
+            response = api.read_namespaced_pod_log(
+                name=pod.name, namespace=pod.namespace, container=container.name, follow=follow, timestamps=True,
+                _preload_content=False, _request_timeout=(CONNECT_TIMEOUT, None), **window,
+            )
+            try:
+                for line in iter_resp_lines(response):
+                    stamp, _, text = line.partition(" ")
+                    key = timestamp_key(stamp)
+                    if replayed is not None:
+                        if key < replayed or (key == replayed and line in last_lines):
+                            continue
+                        replayed = None
+                    if key != last_key:
+                        last, last_key, last_lines = stamp, key, []
+                    last_lines.append(line)
+
+                    item = (prefix, line if timestamps else text)
+                    while True:
+                        if stop.is_set():
+                            return
+                        try:
+                            lines.put(item, timeout=0.1)
+                            break
+                        except Full:
+                            continue
+            finally:
+                response.close()
+                response.release_conn()
+        except client.ApiException as exc:
+            if exc.status == 404:
+                return
+        except HTTPError:
+            pass
+
+        if not follow or stop.is_set() or not container_running(api, pod, container):
+            return
+        stop.wait(RECONNECT_DELAY)
+
+
+@click.command(name="logs", help="Follow the logs of every pod matching a name (substring)")
+@click.argument("name", type=click.STRING, default="", shell_complete=complete_pods)
+@click.option("--namespace", "-n", type=click.STRING, default="default", shell_complete=complete_namespaces,
+              help="Namespace of the pods")
+@click.option("--all-namespaces", "-A", is_flag=True, default=False, help="Match the pods of every namespace")
+@click.option("--selector", "-l", type=click.STRING, default=None, help="Label selector evaluated by the API server")
+@click.option("--container", "-c", type=click.STRING, default=None, help="Only follow this container, all by default")
+@click.option("--follow/--no-follow", "-f", default=True, show_default=True,
+              help="Keep streaming and attach to restarted containers and new pods")
+@click.option("--tail", type=click.INT, default=None, help="Lines of the existing logs to show per container")
+@click.option("--since", type=click.INT, default=None, help="Seconds of existing logs to show per container")
+@click.option("--timestamps", is_flag=True, default=False, help="Prefix every line with its timestamp")
+@click.option("--max-streams", type=click.IntRange(min=1), default=DEFAULT_MAX_STREAMS, show_default=True,
+              help="Maximum number of containers streamed concurrently")
+def logs(name: str = "", namespace: str = "default", all_namespaces: bool = False, selector: Optional[str] = None,
+         container: Optional[str] = None, follow: bool = True, tail: Optional[int] = None, since: Optional[int] = None,
+         timestamps: bool = False, max_streams: int = DEFAULT_MAX_STREAMS):
+    """
+    Follow the logs of every pod matching a name (substring) as one prefixed stream
+
+    Args:
+        name (str, optional): Substring of the pod names, every pod if empty
+        namespace (str, optional): Namespace of the pods. Defaults to "default"
+        all_namespaces (bool, optional): Match the pods of every namespace. Defaults to False
+        selector (str, optional): Label selector evaluated by the API server
+        container (str, optional): Only follow this container, all by default
+        follow (bool, optional): Keep streaming and attach to new containers. Defaults to True
+        tail (int, optional): Lines of the existing logs to show per container
+        since (int, optional): Seconds of existing logs to show per container
+        timestamps (bool, optional): Prefix every line with its timestamp. Defaults to False
+        max_streams (int, optional): Maximum number of containers streamed concurrently. Defaults to 50
+    """
+    load_config()
+    # Every stream holds a connection, size the pool so they are reused instead of discarded
+    configuration = client.Configuration.get_default_copy()
+    configuration.connection_pool_maxsize = max_streams + 2
+    api = throttled_api(configuration)
+
+    lines: Queue = Queue(maxsize=BUFFER_LINES)
+    stop, slots = threading.Event(), threading.Semaphore(max_streams)
+    streams: Dict[Tuple[str, str, str], Optional[str]] = {}
+    capped: Set[Tuple[str, str, str]] = set()
+    threads, colors = [], itertools.cycle(COLORS)
+
+    def stream(pod: Pod, status: ContainerStatus, prefix: str, window: Dict[str, Optional[int]]):
+        try:
+            follow_container(api, pod, status, prefix, lines, stop, follow, timestamps=timestamps, **window)
+        finally:
+            slots.release()
+
+    def attach(pod: Pod, existing: bool):
+        color = next(colors)
+        for status in pod.container_statuses:
+            key = (pod.namespace, pod.name, status.name)
+            if (container and status.name != container) or not status.container_id:
+                continue
+            if streams.get(key) == status.container_id:
+                continue
+
+            if not follow:
+                slots.acquire()
+            elif not slots.acquire(blocking=False):
+                # Followed streams only end with their container, a queued one could wait forever
+                if key not in capped:
+                    capped.add(key)
+                    click.echo(f"Not following {'/'.join(key)}: --max-streams {max_streams} reached, "
+                               "retrying on its next change", err=True)
+                continue
+
+            # Only containers already running when the command started are limited to --tail/--since
+            started = existing or key in capped
+            window = {"tail_lines": tail, "since_seconds": since} if started and key not in streams else {}
+            capped.discard(key)
+            streams[key] = status.container_id
+            prefix = click.style(f"[{pod.namespace + '/' if all_namespaces else ''}{pod.name}/{status.name}]", fg=color)
+            thread = threading.Thread(target=stream, daemon=True, args=(pod, status, prefix, window))
+            thread.start()
+            threads.append(thread)
+
+    def discover():
+        try:
+            events = watch_pods(api, None if all_namespaces else namespace, label_selector=selector)
+            for event, pod in events:
+                if name not in pod.name:
+                    continue
+                if event == "DELETED":
+                    for key in [key for key in streams if key[:2] == (pod.namespace, pod.name)]:
+                        del streams[key]
+                    capped.difference_update([key for key in capped if key[:2] == (pod.namespace, pod.name)])
+                    continue
+
+                attach(pod, event == "LISTED")
+            lines.put((None, None))
+        except Exception as exc:  # pylint: disable=broad-except
+            lines.put((None, exc))
+
+    def dump():
+        try:
+            pods = iter_pods_all_namespaces(api, label_selector=selector) if all_namespaces \
+                else iter_pods(api, namespace, label_selector=selector)
+            for pod in pods:
+                if name in pod.name:
+                    attach(pod, True)
+            for thread in threads:
+                thread.join()
+            lines.put((None, None))
+        except Exception as exc:  # pylint: disable=broad-except
+            lines.put((None, exc))
+
+    threading.Thread(target=discover if follow else dump, daemon=True).start()
+    try:
+        while True:
+            prefix, line = lines.get()
+            if prefix is None:
+                if line is not None:
+                    raise line
+                return
+            click.echo(f"{prefix} {line}")
+    finally:
+        stop.set()
@@ -4,13 +4,38 @@ import click
 
 ################################################### Project Import #################################
 
-from .pod import root_execute, create_network_pod, list_network_pod, delete_network_pod, match_pod
+from notoil.utils.groups import LazyGroup
+
+from .throttle import configure
 
 
 ################################################### Main Declaration ###############################
 
-@click.group(name="k8s", help="Kubernetes commands")
-def kubernetes_main():
+@click.group(
+    name="k8s",
+    help="Kubernetes commands",
+    cls=LazyGroup,
+    lazy_subcommands={
+        "re": "notoil.commands.k8s.pod:root_execute",
+        "cnp": "notoil.commands.k8s.pod:create_network_pod",
+        "lnp": "notoil.commands.k8s.pod:list_network_pod",
+        "dnp": "notoil.commands.k8s.pod:delete_network_pod",
+        "mp": "notoil.commands.k8s.pod:match_pod",
+        "gc": "notoil.commands.k8s.pool:gc_node_shells",
+        "netmatrix": "notoil.commands.k8s.netmatrix:netmatrix",
+        "logs": "notoil.commands.k8s.logs:logs",
+        "capture": "notoil.commands.k8s.capture:capture",
+    },
+)
+@click.option("--qps", type=click.FloatRange(min=0), default=50, show_default=True,
+              help="Requests per second sent to an API server, 0 for no limit")
+@click.option("--burst", type=click.IntRange(min=1), default=100, show_default=True,
+              help="Requests sent at once before --qps applies")
+@click.option("--max-inflight", type=click.IntRange(min=1), default=64, show_default=True,
+              help="Maximum number of concurrent API requests")
+@click.option("--max-retries", type=click.IntRange(min=0), default=6, show_default=True,
+              help="Retries of a request throttled by the API server (429)")
+def kubernetes_main(qps: float = 50, burst: int = 100, max_inflight: int = 64, max_retries: int = 6):
     """
     Kubernetes command group for managing Kubernetes resources and operations.
     
@@ -21,10 +46,11 @@ def kubernetes_main():
         notoil k8s pod list          # List pods
         notoil k8s pod exec          # Execute commands in pods
         notoil k8s pod ssh           # SSH into pods
-    """
 
-kubernetes_main.add_command(root_execute)
-kubernetes_main.add_command(create_network_pod)
-kubernetes_main.add_command(list_network_pod)
-kubernetes_main.add_command(delete_network_pod)
-kubernetes_main.add_command(match_pod)
+    Args:
+        qps (float, optional): Requests per second sent to an API server. Defaults to 50
+        burst (int, optional): Requests sent at once before `qps` applies. Defaults to 100
+        max_inflight (int, optional): Maximum number of concurrent API requests. Defaults to 64
+        max_retries (int, optional): Retries of a throttled request. Defaults to 6
+    """
+    configure(qps, burst, max_inflight, max_retries)
@@ -0,0 +1,341 @@
+"""
+This module contains the node-to-node network matrix command
+
+The network pods of every node (see `notoil k8s cnp --per node`) probe each other with
+ping and optionally iperf3 over the exec API. Probes run concurrently up to a cap, every
+latency is measured before any throughput, and throughput probes never share a node, so
+measurements do not disturb each other.
+"""
+################################################### Python Import ##################################
+
+from __future__ import annotations
+
+import io
+import json
+import re
+import threading
+from concurrent.futures import Future, wait
+from itertools import permutations
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import click
+
+################################################### Project Import #################################
+
+from notoil.utils.concurrency import interleave
+from notoil.utils.imports import LazyModule
+
+from .api import Pod, iter_pods, load_config
+from .cache import complete_namespaces
+from .execute import exec_command
+from .throttle import throttled_api
+
+################################################### Main Declaration ###############################
+
+client = LazyModule("kubernetes.client")
+
+IPERF_PORT = 5201
+
+IPERF_PID_FILE = f"/tmp/notoil-iperf3-{IPERF_PORT}.pid"
+
+# Seconds a stopped iperf3 server is given to exit
+STOP_TIMEOUT = 5
+
+LOSS_PATTERN = re.compile(r"([\d.]+)% packet loss")
+
+RTT_PATTERN = re.compile(r"= [\d.]+/([\d.]+)/")
+
+
+class Probe(NamedTuple):
+    """Measurements from the network pod of a node to the one of another node"""
+
+    source: str
+    target: str
+    latency_ms: Optional[float] = None
+    loss_percent: Optional[float] = None
+    throughput_mbps: Optional[float] = None
+    error: Optional[str] = None
+    throughput_error: Optional[str] = None
+
+
+def parse_ping(output: str) -> Tuple[Optional[float], float]:
+    """
+    Parse the summary of `ping -q`, iputils and busybox flavours
+
+    Args:
+        output (str): The output of ping
+
+    Returns:
+        tuple: The average round trip time in milliseconds, None if no reply came back,
+            and the packet loss in percent
+    """
+    loss = LOSS_PATTERN.search(output)
+    rtt = RTT_PATTERN.search(output)
+    if loss is None:
+        raise ValueError(output.strip().splitlines()[-1] if output.strip() else "no ping output")
+    return (float(rtt.group(1)) if rtt else None), float(loss.group(1))
+
+
+def parse_iperf(output: str) -> float:
+    """
+    Parse the JSON report of an iperf3 client
+
+    Args:
+        output (str): The output of `iperf3 -J`
+
+    Returns:
+        float: The received throughput in Mbit/s
+    """
+    report = json.loads(output)
+    if report.get("error"):
+        raise ValueError(report["error"])
+    return report["end"]["sum_received"]["bits_per_second"] / 1e6
+
+
+def run(api: client.CoreV1Api, pod: Pod, command: List[str]) -> str:
+    """
+    Run a command in a network pod and return its output
+
+    Args:
+        api (client.CoreV1Api): The API to use
+        pod (Pod): The network pod
+        command (list): The command and its arguments
+
+    Returns:
+        str: The output of the command
+
+    Raises:
+        ValueError: If the command failed
+    """
+    stdout, stderr = io.BytesIO(), io.BytesIO()
+    code = exec_command(api, pod.name, pod.namespace, command, stdout=stdout, stderr=stderr)
+    if code != 0 and not stdout.getvalue():
+        raise ValueError(stderr.getvalue().decode(errors="replace").strip() or f"{command[0]} exited with {code}")
+    return stdout.getvalue().decode(errors="replace")
+
+
+def measure_latency(api: client.CoreV1Api, source: Pod, target: Pod, count: int) -> Tuple[Optional[float], float]:
+    """
+    Ping the network pod of a node from another one
+
+    Returns:
+        tuple: The average round trip time in milliseconds and the packet loss in percent
+    """
+    return parse_ping(run(api, source, ["ping", "-q", "-c", str(count), "-i", "0.2", "-W", "1", target.pod_ip]))
+
+
+def measure_throughput(api: client.CoreV1Api, source: Pod, target: Pod, duration: int) -> float:
+    """
+    Measure the TCP throughput from the network pod of a node to another one
+
+    A one-off iperf3 server is started in the target pod while the client retries until
+    the server listens. When the client fails, the error of a server that failed first is
+    reported instead, and a server still waiting for it is stopped.
+
+    Returns:
+        float: The received throughput in Mbit/s
+
+    Raises:
+        ValueError: If the server or the client failed
+    """
+    server: Future = Future()
+
+    def serve():
+        try:
+            server.set_result(run(api, target, ["timeout", str(duration + 30), "iperf3", "-s", "-1",
+                                                "-p", str(IPERF_PORT), "-I", IPERF_PID_FILE]))
+        except Exception as exc:  # pylint: disable=broad-except
+            server.set_exception(exc)
+
+    # A daemon thread, an exec stuck on a lost connection must not hold the command at exit
+    threading.Thread(target=serve, daemon=True).start()
+    client_command = (
+        f"for attempt in $(seq 25); do "
+        f"out=$(iperf3 -J -c {target.pod_ip} -p {IPERF_PORT} -t {duration}) && break; sleep 0.2; "
+        f"done; echo \"$out\""
+    )
+    try:
+        mbps = parse_iperf(run(api, source, ["sh", "-c", client_command]))
+    except (ValueError, client.ApiException) as exc:
+        if server.done() and server.exception() is not None:
+            raise ValueError(f"iperf3 server: {server.exception()}") from exc
+        try:
+            run(api, target, ["sh", "-c", f"kill $(cat {IPERF_PID_FILE}) 2>/dev/null; true"])
+        except (ValueError, client.ApiException):
+            # The server still ends after its timeout, the client error is the one to report
+            pass
+        raise
+    finally:
+        wait([server], timeout=STOP_TIMEOUT)
+    return mbps
+
+
+def network_pods(api: client.CoreV1Api, namespace: str, selector: str) -> Dict[str, Pod]:
+    """
+    Pick one ready network pod per node
+
+    Returns:
+        dict: The network pod of every node, by node name
+    """
+    pods: Dict[str, Pod] = {}
+    for pod in sorted(iter_pods(api, namespace, label_selector=selector)):
+        ready = pod.phase == "Running" and pod.container_statuses and all(cnt.ready for cnt in pod.container_statuses)
+        if ready and pod.node_name and pod.pod_ip:
+            pods.setdefault(pod.node_name, pod)
+    return dict(sorted(pods.items()))
+
+
+def probe_all(api: client.CoreV1Api, pods: Dict[str, Pod], count: int, throughput: bool, duration: int,
+              concurrency: int) -> Iterator[Probe]:
+    """
+    Probe every ordered pair of nodes concurrently
+
+    With throughput, every latency is measured first, so pings never run next to an
+    iperf3 saturating one of their nodes, then the throughput of the pairs that answered.
+
+    Args:
+        api (client.CoreV1Api): The API to use
+        pods (dict): The network pod of every node
+        count (int): Number of pings per pair
+        throughput (bool): Also measure the throughput
+        duration (int): Seconds of every throughput measurement
+        concurrency (int): Maximum number of concurrent probes
+
+    Yields:
+        Probe: The measurements of every pair, as soon as they complete
+    """
+    locks = {node: threading.Lock() for node in pods}
+
+    def ping(pair: Tuple[str, str]) -> Iterator[Probe]:
+        source, target = pair
+        try:
+            latency, loss = measure_latency(api, pods[source], pods[target], count)
+            yield Probe(source, target, latency, loss)
+        except (ValueError, KeyError, client.ApiException) as exc:
+            yield Probe(source, target, error=str(exc) or type(exc).__name__)
+
+    def iperf(probe: Probe) -> Iterator[Probe]:
+        try:
+            # A node takes part in a single throughput measurement at a time
+            first, second = sorted((probe.source, probe.target))
+            with locks[first], locks[second]:
+                mbps = measure_throughput(api, pods[probe.source], pods[probe.target], duration)
+            yield probe._replace(throughput_mbps=mbps)
+        except (ValueError, KeyError, client.ApiException) as exc:
+            # The latency was measured, only the throughput is missing
+            yield probe._replace(throughput_error=str(exc) or type(exc).__name__)
+
+    if not throughput:
+        yield from interleave(ping, permutations(pods, 2), workers=concurrency)
+        return
+
+    answered = []
+    for probe in interleave(ping, permutations(pods, 2), workers=concurrency):
+        if probe.error:
+            yield probe
+        else:
+            answered.append(probe)
+    yield from interleave(iperf, answered, workers=concurrency)
+
+
+def format_table(nodes: List[str], cells: Dict[Tuple[str, str], str]) -> List[str]:
+    """
+    Lay out a matrix with sources as rows and targets as numbered columns
+
+    Args:
+        nodes (list): The node names
+        cells (dict): The text of every (source, target) cell
+
+    Returns:
+        list: The lines of the table
+    """
+    labels = [f"#{index} {node}" for index, node in enumerate(nodes)]
+    rows = [["", *[f"#{index}" for index in range(len(nodes))]]]
+    rows += [[label, *[cells.get((source, target), "-") for target in nodes]] for label, source in zip(labels, nodes)]
+
+    widths = [max(len(row[column]) for row in rows) for column in range(len(rows[0]))]
+    return ["  ".join(value.rjust(width) if column else value.ljust(width)
+                      for column, (value, width) in enumerate(zip(row, widths))).rstrip() for row in rows]
+
+
+@click.command(name="netmatrix", help="Measure latency and throughput between the network pods of every node")
+@click.option("--namespace", "-n", type=click.STRING, default="default", shell_complete=complete_namespaces,
+              help="Namespace of the network pods")
+@click.option("--selector", "-l", type=click.STRING, default="network-pod=true", show_default=True,
+              help="Label selector of the network pods")
+@click.option("--count", "-c", type=click.IntRange(min=1), default=5, show_default=True, help="Pings per pair of nodes")
+@click.option("--throughput", "-t", is_flag=True, default=False, help="Also measure the TCP throughput with iperf3")
+@click.option("--duration", type=click.IntRange(min=1), default=5, show_default=True,
+              help="Seconds of every throughput measurement")
+@click.option("--concurrency", type=click.IntRange(min=1), default=4, show_default=True,
+              help="Maximum number of concurrent probes")
+@click.option("--format", "-f", "output_format", type=click.Choice(["table", "json", "jsonl"]), default="table",
+              show_default=True, help="Output format, jsonl streams every pair as soon as it is measured")
+def netmatrix(namespace: str = "default", selector: str = "network-pod=true", count: int = 5, throughput: bool = False,
+              duration: int = 5, concurrency: int = 4, output_format: str = "table"):
+    """
+    Measure latency and throughput between the network pods of every node
+
+    Args:
+        namespace (str, optional): Namespace of the network pods. Defaults to "default"
+        selector (str, optional): Label selector of the network pods. Defaults to "network-pod=true"
+        count (int, optional): Pings per pair of nodes. Defaults to 5
+        throughput (bool, optional): Also measure the TCP throughput. Defaults to False
+        duration (int, optional): Seconds of every throughput measurement. Defaults to 5
+        concurrency (int, optional): Maximum number of concurrent probes. Defaults to 4
+        output_format (str, optional): "table", "json" or "jsonl". Defaults to "table"
+    """
+    load_config()
+    api = throttled_api()
+
+    pods = network_pods(api, namespace, selector)
+    if len(pods) < 2:
+        raise click.ClickException(f"Found ready network pods on {len(pods)} node(s) in namespace {namespace}, "
+                                   "at least 2 are needed. Create them with `notoil k8s cnp --per node`")
+
+    nodes = list(pods)
+    total = len(nodes) * (len(nodes) - 1)
+    probes: Dict[Tuple[str, str], Probe] = {}
+    for done, probe in enumerate(probe_all(api, pods, count, throughput, duration, concurrency), 1):
+        probes[(probe.source, probe.target)] = probe
+        if output_format == "jsonl":
+            click.echo(json.dumps(probe._asdict()))
+        else:
+            click.echo(f"{done}/{total} {probe.source} -> {probe.target}: "
+                       f"{probe.error or f'{probe.latency_ms} ms'}"
+                       f"{f', throughput: {probe.throughput_error}' if probe.throughput_error else ''}", err=True)
+
+    if output_format == "json":
+        def matrix(field: str) -> List[List[Optional[float]]]:
+            return [[getattr(probes[(source, target)], field) if source != target else None for target in nodes]
+                    for source in nodes]
+
+        report = {"nodes": nodes, "latency_ms": matrix("latency_ms"), "loss_percent": matrix("loss_percent")}
+        if throughput:
+            report["throughput_mbps"] = matrix("throughput_mbps")
+            report["throughput_errors"] = {f"{probe.source} -> {probe.target}": probe.throughput_error
+                                           for probe in probes.values() if probe.throughput_error}
+        report["errors"] = {f"{probe.source} -> {probe.target}": probe.error for probe in probes.values() if probe.error}
+        click.echo(json.dumps(report, indent=2))
+
+    elif output_format == "table":
+        def cell(probe: Probe, field: str) -> str:
+            if probe.error or (field == "throughput_mbps" and probe.throughput_error):
+                return "ERR"
+            value = getattr(probe, field)
+            return "loss" if value is None else f"{value:.2f}" if field == "latency_ms" else f"{value:.0f}"
+
+        click.echo("Latency (ms)")
+        for line in format_table(nodes, {pair: cell(probe, "latency_ms") for pair, probe in probes.items()}):
+            click.echo(line)
+
+        if throughput:
+            click.echo("\nThroughput (Mbit/s)")
+            for line in format_table(nodes, {pair: cell(probe, "throughput_mbps") for pair, probe in probes.items()}):
+                click.echo(line)
+
+        for probe in probes.values():
+            if probe.error:
+                click.echo(f"{probe.source} -> {probe.target}: {probe.error}", err=True)
+            if probe.throughput_error:
+                click.echo(f"{probe.source} -> {probe.target}: throughput: {probe.throughput_error}", err=True)
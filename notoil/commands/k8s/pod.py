@@ -1,211 +1,777 @@
 ################################################### Python Import ##################################
 
-import subprocess
-from time import sleep
+from __future__ import annotations
+
+import io
+import json
+import shlex
+from contextlib import closing, nullcontext
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 from uuid import uuid4
 
 import click
 
-from kubernetes import client, config
-
 ################################################### Project Import #################################
 
+from notoil.utils.concurrency import interleave
 from notoil.utils.generate import generate_random_string
-
+from notoil.utils.imports import LazyModule
+
+from .api import (READY_TIMEOUT, ContainerStatus, Node, Pod, PodNotReady, decode, delete_pod, delete_pods, iter_nodes,
+                  iter_pods, iter_pods_all_namespaces, load_config, read_pod, wait_for_deletion, wait_for_pod,
+                  wait_for_pods, watch_pods)
+from .cache import (cache_options, cached_pods, cached_pods_all_namespaces, complete_containers, complete_namespaces,
+                    complete_pods, invalidate)
+from .contexts import DEFAULT_CONTEXT_WORKERS, across_contexts, context_options, resolve_contexts
+from .execute import exec_command, exec_interactive
+from .pool import DEFAULT_IDLE_TTL, acquire_node_shell, node_shell_in_use
 from .ssh import ssh_into_node
+from .throttle import throttled_api
 
 ################################################### Main Declaration ###############################
 
-def root_execute_in_container(cnt: client.V1ContainerStatus, node_name: str, shell: str = "bash"):
+client = LazyModule("kubernetes.client")
+
+ZONE_LABEL = "topology.kubernetes.io/zone"
+
+BATCH_LABEL = "notoil.io/batch"
+
+def wait_until_ready(api: client.CoreV1Api, pod_name: str, namespace: str, timeout: float = READY_TIMEOUT) -> Pod:
+    """
+    Wait for a pod to be ready, reporting its progress on stderr
+
+    Args:
+        api (client.CoreV1Api): The API to use
+        pod_name (str): The name of the pod
+        namespace (str): The namespace of the pod
+        timeout (float, optional): Seconds to wait before giving up. Defaults to 120
+
+    Returns:
+        Pod: The ready pod
+
+    Raises:
+        click.ClickException: If the pod does not become ready
+    """
+    try:
+        return wait_for_pod(api, pod_name, namespace, timeout,
+                            on_progress=lambda state: click.echo(f"Pod {pod_name}: {state}", err=True))
+    except PodNotReady as exc:
+        raise click.ClickException(str(exc)) from exc
+
+
+def runc_exec(cnt: ContainerStatus, command: str, tty: bool = True) -> str:
+    """
+    Build the runc command running a command as root in a container
+
+    Args:
+        cnt (ContainerStatus): The container status object
+        command (str): The command to run in the container
+        tty (bool, optional): Allocate a TTY. Defaults to True
+
+    Returns:
+        str: The command to run on the node
+    """
+    c_id = cnt.container_id.replace("containerd://", "")
+    return f"runc --root /run/containerd/runc/k8s.io/ exec {'-t ' if tty else ''}-u 0 {c_id} {command}"
+
+
+def root_execute_in_container(cnt: ContainerStatus, node_name: str, shell: str = "bash", ephemeral: bool = False,
+                              idle_ttl: int = DEFAULT_IDLE_TTL, timeout: float = READY_TIMEOUT):
     """Execute commands as root user in a specified pod container.
     
-    This function creates a temporary node-shell pod to SSH into the Kubernetes node
-    and execute commands as root user in the specified container. It automatically
-    cleans up the temporary pod after execution.
+    This function uses the pooled node-shell pod of the Kubernetes node, creating it if
+    needed, to execute commands as root user in the specified container. The node-shell
+    is kept for later invocations until `notoil k8s gc` collects it, unless an
+    ephemeral node-shell is requested, which is deleted after execution.
     Args:
-        cnt (client.V1ContainerStatus): The container status object
+        cnt (ContainerStatus): The container status object
         node_name (str): The name of the node where the container is running
         shell (str, optional): The shell to use for the command. Defaults to "bash"
+        ephemeral (bool, optional): Use a temporary node-shell deleted after execution. Defaults to False
+        idle_ttl (int, optional): Seconds a new pooled node-shell may stay unused before `gc` deletes it
+        timeout (float, optional): Seconds to wait for the node-shell to be ready. Defaults to 120
 
     Returns:
         None: Executes commands and outputs results to stdout
     """
-    c_id = cnt.container_id.replace("containerd://", "")
-
-    command = f"runc --root /run/containerd/runc/k8s.io/ exec -t -u 0 {c_id} {shell}"
+    command = runc_exec(cnt, shell)
     click.echo(f"{command}")
 
-    ssh_pod = ssh_into_node(node_name, pod_name=f"node-shell-{uuid4()}", namespace="kube-system")
+    api = throttled_api()
+
+    if ephemeral:
+        pod_name, created = ssh_into_node(node_name, pod_name=f"node-shell-{uuid4()}", namespace="kube-system").metadata.name, True
+    else:
+        pod_name, created = acquire_node_shell(api, node_name, idle_ttl=idle_ttl, timeout=timeout)
+
+    print(f"{'Created' if created else 'Reusing'} node-shell {pod_name}")
+    # A reused shell is usually ready already, this then costs a single read
+    wait_until_ready(api, pod_name, "kube-system", timeout)
+
+    with nullcontext() if ephemeral else node_shell_in_use(api, pod_name):
+        exec_interactive(api, pod_name, "kube-system", ["bash", "-c", command])
+
+    if ephemeral:
+        print("Root execute completed, killing the pod")
+        api.delete_namespaced_pod(name=pod_name, namespace="kube-system", propagation_policy="Foreground",)
 
-    pod_name = ssh_pod.metadata.name
 
-    print(f"POd started successfully with name -> {pod_name}, sleeping for some time so that ssh pod can stabalize")
-    sleep(2)
+class RootExecResult(NamedTuple):
+    """Outcome of a root command in the container of a pod"""
 
-    subprocess.call(["kubectl", "exec", "-it", pod_name, "-n", "kube-system", "--", "bash", "-c", command])
+    node: str
+    namespace: str
+    pod: str
+    container: str
+    exit_code: Optional[int] = None
+    stdout: str = ""
+    stderr: str = ""
+    error: Optional[str] = None
 
-    print("Root execute completed, killing the pod")
 
-    client.CoreV1Api().delete_namespaced_pod(name=pod_name, namespace="kube-system", propagation_policy="Foreground",)
+def root_execute_on_node(api: client.CoreV1Api, node_name: str, targets: List[Tuple[Pod, ContainerStatus]],
+                         command: str, shell: str = "bash", idle_ttl: int = DEFAULT_IDLE_TTL,
+                         timeout: float = READY_TIMEOUT) -> Iterator[RootExecResult]:
+    """
+    Run a root command in several containers of a node through its pooled node-shell
+
+    Args:
+        api (client.CoreV1Api): The API to use
+        node_name (str): The name of the node
+        targets (list): The pods and containers of the node
+        command (str): The command to run in every container
+        shell (str, optional): The shell running the command in the containers. Defaults to "bash"
+        idle_ttl (int, optional): Seconds a new pooled node-shell may stay unused before `gc` deletes it
+        timeout (float, optional): Seconds to wait for the node-shell to be ready. Defaults to 120
+
+    Yields:
+        RootExecResult: The outcome for every target, in order
+    """
+    # Imported here to keep the websocket package out of the import path of this module
+    from websocket import WebSocketException  # pylint: disable=import-outside-toplevel
+
+    # A dropped websocket, a network error or an unparsable exit status only fails the
+    # target it happened on, instead of every node of the fan-out
+    failures = (PodNotReady, client.ApiException, click.ClickException, WebSocketException, OSError, ValueError)
+
+    try:
+        shell_pod, _ = acquire_node_shell(api, node_name, idle_ttl=idle_ttl, timeout=timeout)
+        wait_for_pod(api, shell_pod, "kube-system", timeout)
+    except failures as exc:
+        for pod, cnt in targets:
+            yield RootExecResult(node_name, pod.namespace, pod.name, cnt.name, error=f"node-shell: {exc}")
+        return
 
+    with node_shell_in_use(api, shell_pod):
+        for pod, cnt in targets:
+            stdout, stderr = io.BytesIO(), io.BytesIO()
+            runc = runc_exec(cnt, f"{shell} -c {shlex.quote(command)}", tty=False)
+            try:
+                code = exec_command(api, shell_pod, "kube-system", ["bash", "-c", runc], stdout=stdout, stderr=stderr)
+            except failures as exc:
+                reason = exc.reason if isinstance(exc, client.ApiException) else exc
+                yield RootExecResult(node_name, pod.namespace, pod.name, cnt.name, error=str(reason))
+                continue
+            yield RootExecResult(node_name, pod.namespace, pod.name, cnt.name, code,
+                                 stdout.getvalue().decode(errors="replace"), stderr.getvalue().decode(errors="replace"))
+
+
+def root_execute_many(api: client.CoreV1Api, pods: Iterable[Pod], container: str, command: str, shell: str = "bash",
+                      idle_ttl: int = DEFAULT_IDLE_TTL, timeout: float = READY_TIMEOUT,
+                      workers: int = 8) -> Iterator[RootExecResult]:
+    """
+    Run a root command in a container of every pod, grouped by node
+
+    Every node runs the commands of its pods sequentially through a single pooled
+    node-shell, and the nodes run in parallel.
+
+    Args:
+        api (client.CoreV1Api): The API to use
+        pods (Iterable): The target pods
+        container (str): The container name, "first-container" for the first one of every pod
+        command (str): The command to run in every container
+        shell (str, optional): The shell running the command in the containers. Defaults to "bash"
+        idle_ttl (int, optional): Seconds a new pooled node-shell may stay unused before `gc` deletes it
+        timeout (float, optional): Seconds to wait for the node-shells to be ready. Defaults to 120
+        workers (int, optional): Number of nodes handled concurrently. Defaults to 8
+
+    Yields:
+        RootExecResult: The outcome for every target as soon as it completes
+    """
+    nodes: Dict[str, List[Tuple[Pod, ContainerStatus]]] = {}
+    for pod in pods:
+        statuses = pod.container_statuses[:1] if container == "first-container" else \
+            [cnt for cnt in pod.container_statuses if cnt.name == container]
+        for cnt in statuses:
+            if pod.node_name and cnt.container_id:
+                nodes.setdefault(pod.node_name, []).append((pod, cnt))
+            else:
+                yield RootExecResult(pod.node_name or "", pod.namespace, pod.name, cnt.name, error="container is not running")
+
+    yield from interleave(
+        lambda node_name: root_execute_on_node(api, node_name, nodes[node_name], command, shell, idle_ttl, timeout),
+        sorted(nodes),
+        workers=workers,
+    )
 
 
 @click.command(name="re", help="Create command to execute into pod as root user")
-@click.argument("pod", type=click.STRING)
-@click.option("--container", '-c', type=click.STRING, default="first-container", \
+@click.argument("pod", type=click.STRING, required=False, default=None, shell_complete=complete_pods)
+@click.option("--container", '-c', type=click.STRING, default="first-container", shell_complete=complete_containers, \
               help="Name of the container to execute the command in, if not provided, the command will be executed in the first container")
-@click.option("--namespace", '-n', type=click.STRING, default="default", help="Namespace of the pod")
+@click.option("--namespace", '-n', type=click.STRING, default="default", shell_complete=complete_namespaces, help="Namespace of the pod")
 @click.option("--shell", "-s", type=click.STRING, default="bash", help="Shell to use for the command")
-def root_execute(pod: str, container: str, namespace: str = "default", shell: str = "bash"):
+@click.option("--ephemeral", is_flag=True, default=False, help="Use a temporary node-shell that is deleted afterwards")
+@click.option("--idle-ttl", type=click.INT, default=DEFAULT_IDLE_TTL, show_default=True,
+              help="Seconds a new pooled node-shell may stay unused before `notoil k8s gc` deletes it")
+@click.option("--timeout", type=click.FLOAT, default=READY_TIMEOUT, show_default=True,
+              help="Seconds to wait for the node-shell to be ready")
+@click.option("--selector", "-l", type=click.STRING, default=None,
+              help="Run --command in every pod matching this label selector instead of a single POD")
+@click.option("--all-namespaces", "-A", is_flag=True, default=False, help="Match pods of every namespace with --selector")
+@click.option("--command", "-x", type=click.STRING, default=None,
+              help="Run this command non-interactively and collect its output instead of opening a shell")
+@click.option("--workers", type=click.IntRange(min=1), default=8, show_default=True,
+              help="Number of nodes handled concurrently with --command")
+@click.option("--format", "-f", "output_format", type=click.Choice(["text", "jsonl"]), default="text",
+              show_default=True, help="Output format of --command")
+def root_execute(pod: str, container: str, namespace: str = "default", shell: str = "bash", ephemeral: bool = False,
+                 idle_ttl: int = DEFAULT_IDLE_TTL, timeout: float = READY_TIMEOUT, selector: Optional[str] = None,
+                 all_namespaces: bool = False, command: Optional[str] = None, workers: int = 8,
+                 output_format: str = "text"):
     """Execute commands as root user in a specified pod container.
     
-    This function creates a temporary node-shell pod to SSH into the Kubernetes node
-    and execute commands as root user in the specified container. It automatically
-    cleans up the temporary pod after execution.
+    This function uses a node-shell pod to SSH into the Kubernetes node and execute
+    commands as root user in the specified container. Node-shells are pooled per node
+    and reused across invocations.
     
     The process involves:
     1. Finding the node where the target pod is running
-    2. Creating a temporary node-shell pod for SSH access
+    2. Reusing the node's pooled node-shell, or creating it
     3. Executing the root command in the target container
-    4. Cleaning up the temporary pod
+    4. Cleaning up the node-shell if it was ephemeral
+
+    With --command, the command runs non-interactively in the POD, or in every pod
+    matching --selector. Targets are grouped by node, every node runs its targets
+    through one node-shell and the nodes run in parallel.
     
     Args:
         pod (str): The name of the target pod
         container (str): The name of the container within the pod, if not provided, the command will be executed in the first container
         namespace (str, optional): The namespace of the target pod. Defaults to "default"
         shell (str, optional): The shell to use for the command. Defaults to "bash"
+        ephemeral (bool, optional): Use a temporary node-shell deleted after execution. Defaults to False
+        idle_ttl (int, optional): Seconds a new pooled node-shell may stay unused before `gc` deletes it
+        timeout (float, optional): Seconds to wait for the node-shell to be ready. Defaults to 120
+        selector (str, optional): Label selector of the target pods, requires `command`
+        all_namespaces (bool, optional): Match pods of every namespace with `selector`. Defaults to False
+        command (str, optional): Command to run non-interactively in every target
+        workers (int, optional): Number of nodes handled concurrently with `command`. Defaults to 8
+        output_format (str, optional): "text" or "jsonl" output of `command`. Defaults to "text"
     Returns:
         None: Executes commands and outputs results to stdout
     """
-    config.load_config()
-
-    pod: client.V1Pod = client.CoreV1Api().read_namespaced_pod(
-        name=pod,
-        namespace=namespace
-    )
+    if (pod is None) == (selector is None):
+        raise click.UsageError("Provide either a POD or --selector")
+    if selector is not None and command is None:
+        raise click.UsageError("--selector requires --command")
+    if command is not None and ephemeral:
+        raise click.UsageError("--command always uses the pooled node-shells, it can not be combined with --ephemeral")
+
+    load_config()
+    api = throttled_api()
+
+    if pod is not None:
+        try:
+            pod = read_pod(api, name=pod, namespace=namespace)
+        except client.ApiException as exc:
+            if exc.status != 404:
+                raise
+            click.echo("No pod found")
+            return
 
-    if not pod:
-        click.echo("No pod found")
+    if command is not None:
+        if selector is None:
+            targets = [pod]
+        elif all_namespaces:
+            targets = iter_pods_all_namespaces(api, label_selector=selector)
+        else:
+            targets = iter_pods(api, namespace, label_selector=selector)
+
+        failed = 0
+        for result in root_execute_many(api, targets, container, command, shell, idle_ttl, timeout, workers):
+            failed += result.error is not None or result.exit_code != 0
+            if output_format == "jsonl":
+                click.echo(json.dumps(result._asdict()))
+                continue
+
+            status = result.error or f"exit {result.exit_code}"
+            click.echo(f"==> {result.namespace}/{result.pod} [{result.container}] on {result.node}: {status}")
+            click.echo(result.stdout, nl=False)
+            click.echo(result.stderr, nl=False, err=True)
+
+        if failed:
+            raise click.ClickException(f"The command failed in {failed} container(s)")
         return
 
-    node_name = pod.spec.node_name
-
+    node_name = pod.node_name
     click.echo(f"Node name: {node_name}")
 
     if container == "first-container":
-        root_execute_in_container(pod.status.container_statuses[0], node_name, shell)
+        root_execute_in_container(pod.container_statuses[0], node_name, shell, ephemeral, idle_ttl, timeout)
         return
 
-    for cnt in pod.status.container_statuses:
+    for cnt in pod.container_statuses:
         if container == cnt.name:
-            root_execute_in_container(cnt, node_name, shell)
+            root_execute_in_container(cnt, node_name, shell, ephemeral, idle_ttl, timeout)
             return
 
     click.echo("No container found with the given name")
 
 
-@click.command(name="cnp", help="Create a network pod")
-@click.option("--namespace", "-n", type=click.STRING, default="default")
-def create_network_pod(namespace: str = "default"):
+def network_pod(namespace: str, labels: Dict[str, str], node_name: Optional[str] = None) -> client.V1Pod:
     """
-    Create a network pod
+    Build a network pod
 
     Args:
-        namespace (str, optional): The namespace where the pod will be created. Defaults to "default"
+        namespace (str): The namespace of the pod
+        labels (dict): The labels of the pod
+        node_name (str, optional): Pin the pod to this node, like a DaemonSet pod
 
     Returns:
-        None: Creates a network pod
+        client.V1Pod: The pod to create
     """
-    config.load_config()
-
-    pod = client.CoreV1Api().create_namespaced_pod(
-        namespace=namespace,
-        body=client.V1Pod(
+    affinity, tolerations = None, None
+    if node_name is not None:
+        affinity = client.V1Affinity(node_affinity=client.V1NodeAffinity(
+            required_during_scheduling_ignored_during_execution=client.V1NodeSelector(node_selector_terms=[
+                client.V1NodeSelectorTerm(match_fields=[
+                    client.V1NodeSelectorRequirement(key="metadata.name", operator="In", values=[node_name])
+                ])
+            ])
+        ))
+        tolerations = [client.V1Toleration(operator="Exists")]
+
+    return client.V1Pod(
         api_version="v1",
         kind="Pod",
         metadata=client.V1ObjectMeta(
             name=f"network-{generate_random_string(5)}",
             namespace=namespace,
-            labels={
-                "network-pod": "true"
-            }
+            labels=labels
         ),
         spec=client.V1PodSpec(
             containers=[client.V1Container(
                 name="network",
                 image="jonlabelle/network-tools",
                 command=["sleep", "infinity"]
-            )]
+            )],
+            affinity=affinity,
+            tolerations=tolerations
         ),
     )
-    )
+
+
+def create_network_pods(api: client.CoreV1Api, namespace: str, per: str, node_selector: Optional[str] = None,
+                        wait: bool = True, timeout: float = READY_TIMEOUT, workers: int = 16) -> List[List[str]]:
+    """
+    Create a network pod on every matching node, or on one node of every zone
+
+    The pods are created concurrently and their readiness is followed with a single
+    watch on a label unique to this batch.
+
+    Args:
+        api (client.CoreV1Api): The API to use
+        namespace (str): The namespace of the pods
+        per (str): "node" or "zone"
+        node_selector (str, optional): Label selector of the nodes to use
+        wait (bool, optional): Wait until the pods are ready. Defaults to True
+        timeout (float, optional): Seconds to wait for the pods to be ready. Defaults to 120
+        workers (int, optional): Number of concurrent creates. Defaults to 16
+
+    Returns:
+        list: The node, zone, pod name and status of every pod, sorted by node
+    """
+    nodes = sorted(node for node in iter_nodes(api, node_selector) if node.ready and not node.unschedulable)
+    if per == "zone":
+        zones: Dict[str, Node] = {}
+        for node in nodes:
+            zones.setdefault(node.labels.get(ZONE_LABEL, ""), node)
+        nodes = list(zones.values())
+
+    batch = generate_random_string(8)
+    labels = {"network-pod": "true", BATCH_LABEL: batch}
+
+    def create(node: Node) -> Iterator[Tuple[Node, str, str]]:
+        body = network_pod(namespace, labels, node.name)
+        try:
+            decode(api.create_namespaced_pod(namespace=namespace, body=body, _preload_content=False))
+        except client.ApiException as exc:
+            yield node, body.metadata.name, f"create failed: {exc.reason}"
+            return
+        yield node, body.metadata.name, "Created"
+
+    rows = {name: [node.name, node.labels.get(ZONE_LABEL, ""), name, status]
+            for node, name, status in interleave(create, nodes, workers=workers)}
+    invalidate(namespace)
+
+    if wait:
+        created = [name for name, row in rows.items() if row[3] == "Created"]
+        for done, (name, _, failure) in enumerate(wait_for_pods(api, created, namespace, f"{BATCH_LABEL}={batch}", timeout), 1):
+            rows[name][3] = failure or "Ready"
+            click.echo(f"{done}/{len(created)} pods settled", err=True)
+
+    return sorted(rows.values())
+
+
+@click.command(name="cnp", help="Create a network pod")
+@click.option("--namespace", "-n", type=click.STRING, default="default", shell_complete=complete_namespaces)
+@click.option("--wait/--no-wait", default=True, show_default=True, help="Wait until the network pod is ready")
+@click.option("--timeout", type=click.FLOAT, default=READY_TIMEOUT, show_default=True,
+              help="Seconds to wait for the network pod to be ready")
+@click.option("--per", type=click.Choice(["node", "zone"]), default=None,
+              help="Create a network pod on every matching node, or on one node of every zone")
+@click.option("--node-selector", type=click.STRING, default=None, help="Label selector of the nodes used with --per")
+@click.option("--workers", type=click.IntRange(min=1), default=16, show_default=True,
+              help="Number of concurrent creates with --per")
+def create_network_pod(namespace: str = "default", wait: bool = True, timeout: float = READY_TIMEOUT,
+                       per: Optional[str] = None, node_selector: Optional[str] = None, workers: int = 16):
+    """
+    Create a network pod
+
+    Args:
+        namespace (str, optional): The namespace where the pod will be created. Defaults to "default"
+        wait (bool, optional): Wait until the pod is ready. Defaults to True
+        timeout (float, optional): Seconds to wait for the pod to be ready. Defaults to 120
+        per (str, optional): Create a pod on every matching "node", or on one node of every "zone"
+        node_selector (str, optional): Label selector of the nodes used with `per`
+        workers (int, optional): Number of concurrent creates with `per`. Defaults to 16
+
+    Returns:
+        None: Creates a network pod
+    """
+    load_config()
+    api = throttled_api()
+
+    if per is not None:
+        rows = create_network_pods(api, namespace, per, node_selector, wait, timeout, workers)
+        if not rows:
+            raise click.ClickException("No ready and schedulable node matches")
+
+        rows.insert(0, ["NODE", "ZONE", "POD", "STATUS"])
+        widths = [max(len(row[column]) for row in rows) for column in range(3)]
+        for row in rows:
+            click.echo("  ".join([value.ljust(width) for value, width in zip(row, widths)] + [row[3]]))
+
+        failed = sum(1 for row in rows[1:] if row[3] not in ("Ready", "Created"))
+        if failed:
+            raise click.ClickException(f"{failed} of {len(rows) - 1} network pods are not ready")
+        return
+
+    pod = network_pod(namespace, {"network-pod": "true"})
+    api.create_namespaced_pod(namespace=namespace, body=pod)
+    invalidate(namespace)
+
+    if wait:
+        wait_until_ready(api, pod.metadata.name, namespace, timeout)
 
     click.echo(f"Network pod created successfully in namespace {namespace}. Use the below command to connect to the pod")
-    click.echo(f"kubectl exec -it {pod.metadata.name} -n {namespace} -- bash")
+    click.echo(f"notoil k8s mp {pod.metadata.name} -n {namespace} -i")
+
+
+def list_network_pod_lines(api: client.CoreV1Api, namespace: str, watch: bool = False, cache_ttl: int = 15,
+                           no_cache: bool = False, context: Optional[str] = None) -> Iterator[str]:
+    """
+    List the network pods of a namespace as output lines
+
+    Args:
+        api (client.CoreV1Api): The API to use
+        namespace (str): The namespace to list
+        watch (bool, optional): Follow the changes after listing. Defaults to False
+        cache_ttl (int, optional): Seconds a cached listing is used without revalidating it
+        no_cache (bool, optional): Always list from the API server. Defaults to False
+        context (str, optional): The kubeconfig context of the API. Defaults to the current one
+
+    Yields:
+        str: A line per network pod, and per change with `watch`
+    """
+    if watch:
+        for event, pod in watch_pods(api, namespace, label_selector="network-pod=true"):
+            prefix = "" if event == "LISTED" else f"{event} | "
+            yield f"{prefix}Pod name: {pod.name} | Pod namespace: {pod.namespace} | Pod status: {pod.phase}"
+        return
+
+    if no_cache:
+        pods = iter_pods(api, namespace, label_selector="network-pod=true")
+    else:
+        pods = cached_pods(api, namespace, label_selector="network-pod=true", ttl=cache_ttl, context=context)
+
+    for pod in pods:
+        yield f"Pod name: {pod.name} | Pod namespace: {pod.namespace} | Pod status: {pod.phase}"
 
 
 @click.command(name="lnp", help="List all network pods in a namespace")
-@click.option("--namespace", "-n", type=click.STRING, default="default")
-def list_network_pod(namespace: str = "default"):
+@click.option("--namespace", "-n", type=click.STRING, default="default", shell_complete=complete_namespaces)
+@click.option("--watch", "-w", is_flag=True, default=False, help="Keep running and print network pod changes")
+@cache_options
+@context_options
+def list_network_pod(namespace: str = "default", watch: bool = False, cache_ttl: int = 15, no_cache: bool = False,
+                     contexts: Optional[str] = None, all_contexts: bool = False):
     """
     List all network pods in a namespace
+
+    Args:
+        namespace (str, optional): The namespace to list. Defaults to "default"
+        watch (bool, optional): Follow the changes after listing. Defaults to False
+        cache_ttl (int, optional): Seconds a cached listing is used without revalidating it
+        no_cache (bool, optional): Always list from the API server. Defaults to False
+        contexts (str, optional): Comma separated kubeconfig contexts to list concurrently
+        all_contexts (bool, optional): List in every kubeconfig context. Defaults to False
+    """
+    names = resolve_contexts(contexts, all_contexts)
+    if names is None:
+        load_config()
+        for line in list_network_pod_lines(throttled_api(), namespace, watch, cache_ttl, no_cache):
+            click.echo(line)
+        return
+
+    # Watches never end, every context then needs a worker of its own
+    lines = across_contexts(
+        lambda context, api: list_network_pod_lines(api, namespace, watch, cache_ttl, no_cache, context),
+        names,
+        workers=len(names) if watch else DEFAULT_CONTEXT_WORKERS,
+    )
+    for context, line in lines:
+        click.echo(f"Cluster: {context} | {line}")
+
+
+def delete_network_pods(api: client.CoreV1Api, name: str, namespaces: Iterable[str], all_namespaces: bool = False,
+                        wait: bool = False, timeout: float = READY_TIMEOUT, workers: int = 8,
+                        context: Optional[str] = None, on_progress: Optional[Callable[[int], None]] = None
+                        ) -> Iterator[Pod]:
     """
-    config.load_config()
-    pods = client.CoreV1Api().list_namespaced_pod(namespace=namespace, label_selector="network-pod=true")
+    Delete network pods
+
+    Deleting every network pod of a namespace is a single delete collection request.
+    A named pod is looked up and deleted in every namespace concurrently.
+
+    Args:
+        api (client.CoreV1Api): The API to use
+        name (str): The name of the pod to delete, "*" for every network pod
+        namespaces (Iterable[str]): The namespaces of the pods
+        all_namespaces (bool, optional): Delete in every namespace with network pods. Defaults to False
+        wait (bool, optional): Wait until the pods are gone once they are all deleted. Defaults to False
+        timeout (float, optional): Seconds to wait for the pods to be gone. Defaults to 120
+        workers (int, optional): Number of concurrent requests. Defaults to 8
+        context (str, optional): The kubeconfig context of the API. Defaults to the current one
+        on_progress (Callable, optional): Called with the number of pods left while waiting
+
+    Yields:
+        Pod: Every deleted pod, as soon as its deletion is accepted
+
+    Raises:
+        TimeoutError: If the pods are still there after `timeout` seconds
+    """
+    selector = "network-pod=true"
+    field_selector = None if name == "*" else f"metadata.name={name}"
+    namespaces = list(namespaces)
+
+    if all_namespaces:
+        namespaces = sorted({pod.namespace for pod in iter_pods_all_namespaces(api, selector, field_selector)})
+
+    if name == "*":
+        deleted = interleave(lambda namespace: delete_pods(api, namespace, selector), namespaces, workers=workers)
+    else:
+        found = interleave(lambda namespace: iter_pods(api, namespace, selector, field_selector), namespaces,
+                           workers=workers)
+        deleted = interleave(lambda pod: filter(None, [delete_pod(api, pod.name, pod.namespace)]), found,
+                             workers=workers)
+
+    pods = []
+    for pod in deleted:
+        pods.append(pod)
+        yield pod
+
+    for namespace in namespaces:
+        invalidate(namespace, context)
 
-    for pod in pods.items:
-        click.echo(f"Pod name: {pod.metadata.name} | Pod namespace: {pod.metadata.namespace} | Pod status: {pod.status.phase}")
+    if wait and pods:
+        wait_for_deletion(api, pods, namespaces[0] if len(namespaces) == 1 else None, selector, timeout, on_progress)
 
 
 @click.command(name="dnp", help="Delete a network pod")
 @click.option("--name", "-i", type=click.STRING, default="*")
-@click.option("--namespace", "-n", type=click.STRING, default="default")
-def delete_network_pod(name: str, namespace: str = "default"):
+@click.option("--namespace", "-n", "namespaces", type=click.STRING, multiple=True, default=["default"],
+              shell_complete=complete_namespaces, help="Namespace of the pods, can be repeated")
+@click.option("--all-namespaces", "-A", is_flag=True, default=False, help="Delete the network pods of every namespace")
+@click.option("--wait", is_flag=True, default=False, help="Wait until the pods are gone")
+@click.option("--timeout", type=click.FLOAT, default=READY_TIMEOUT, show_default=True,
+              help="Seconds to wait for the pods to be gone")
+@click.option("--workers", type=click.IntRange(min=1), default=8, show_default=True, help="Number of concurrent requests")
+@context_options
+def delete_network_pod(name: str, namespaces: Tuple[str, ...] = ("default",), all_namespaces: bool = False,
+                       wait: bool = False, timeout: float = READY_TIMEOUT, workers: int = 8,
+                       contexts: Optional[str] = None, all_contexts: bool = False):
     """
-    Delete a network pod
+    Delete network pods
 
     Args:
-        name (str): The name of the pod to delete
-        namespace (str, optional): The namespace of the pod. Defaults to "default"
+        name (str): The name of the pod to delete, "*" for every network pod
+        namespaces (tuple, optional): The namespaces of the pods. Defaults to ("default",)
+        all_namespaces (bool, optional): Delete in every namespace with network pods. Defaults to False
+        wait (bool, optional): Wait until the pods are gone. Defaults to False
+        timeout (float, optional): Seconds to wait for the pods to be gone. Defaults to 120
+        workers (int, optional): Number of concurrent requests. Defaults to 8
+        contexts (str, optional): Comma separated kubeconfig contexts to delete in concurrently
+        all_contexts (bool, optional): Delete in every kubeconfig context. Defaults to False
 
     Returns:
-        None: Deletes a network pod
+        None: Deletes network pods
     """
-    config.load_config()
-    pods = client.CoreV1Api().list_namespaced_pod(namespace=namespace, label_selector="network-pod=true")
+    names = resolve_contexts(contexts, all_contexts)
+    if names is None:
+        def report(left: int):
+            click.echo(f"Waiting for {left} pods to terminate" if left else "All pods are gone", err=True)
+
+        load_config()
+        try:
+            for pod in delete_network_pods(throttled_api(), name, namespaces, all_namespaces, wait, timeout, workers,
+                                           on_progress=report):
+                click.echo(f"Deleting pod {pod.name} in namespace {pod.namespace}")
+        except TimeoutError as exc:
+            raise click.ClickException(str(exc)) from exc
+        return
+
+    def delete(context: str, api: client.CoreV1Api) -> Iterator[Pod]:
+        def report(left: int):
+            click.echo(f"{context}: " + (f"Waiting for {left} pods to terminate" if left else "All pods are gone"), err=True)
+
+        return delete_network_pods(api, name, namespaces, all_namespaces, wait, timeout, workers, context, report)
 
-    for pod in pods.items:
-        if name in ("*", pod.metadata.name):
-            click.echo(f"Deleting pod {pod.metadata.name} in namespace {namespace}")
-            client.CoreV1Api().delete_namespaced_pod(name=pod.metadata.name, namespace=namespace, propagation_policy="Foreground",)
+    for context, pod in across_contexts(delete, names):
+        click.echo(f"Cluster: {context} | Deleting pod {pod.name} in namespace {pod.namespace}")
+
+
+def match_pod_events(api: client.CoreV1Api, name: str, namespace: str = "default", all_namespaces: bool = False,
+                     selector: Optional[str] = None, field_selector: Optional[str] = None, watch: bool = False,
+                     cache_ttl: int = 15, no_cache: bool = False, context: Optional[str] = None
+                     ) -> Iterator[Tuple[str, Pod]]:
+    """
+    Find the pods whose name contains a substring
+
+    Args:
+        api (client.CoreV1Api): The API to use
+        name (str): The substring of the pod names
+        namespace (str, optional): The namespace of the pods. Defaults to "default"
+        all_namespaces (bool, optional): Search every namespace concurrently. Defaults to False
+        selector (str, optional): Label selector evaluated by the API server
+        field_selector (str, optional): Field selector evaluated by the API server
+        watch (bool, optional): Follow the changes of the matching pods after listing. Defaults to False
+        cache_ttl (int, optional): Seconds a cached listing is used without revalidating it
+        no_cache (bool, optional): Always list from the API server. Defaults to False
+        context (str, optional): The kubeconfig context of the API. Defaults to the current one
+
+    Yields:
+        tuple: "LISTED" and every matching pod, then the watch events of the matching pods with `watch`
+    """
+    if watch:
+        events = watch_pods(api, None if all_namespaces else namespace, label_selector=selector, field_selector=field_selector)
+    elif no_cache and all_namespaces:
+        events = (("LISTED", pod) for pod in iter_pods_all_namespaces(api, label_selector=selector,
+                                                                      field_selector=field_selector))
+    elif no_cache:
+        events = (("LISTED", pod) for pod in iter_pods(api, namespace, label_selector=selector,
+                                                       field_selector=field_selector))
+    elif all_namespaces:
+        events = (("LISTED", pod) for pod in cached_pods_all_namespaces(
+            api, label_selector=selector, field_selector=field_selector, ttl=cache_ttl, context=context))
+    else:
+        events = (("LISTED", pod) for pod in cached_pods(
+            api, namespace, label_selector=selector, field_selector=field_selector, ttl=cache_ttl, context=context))
+
+    with closing(events):
+        for event, pod in events:
+            if name in pod.name:
+                yield event, pod
+
+
+def format_match(event: str, pod: Pod, watch: bool = False) -> str:
+    """
+    Describe a matching pod, and how it changed when watching
+    """
+    if not watch:
+        return f"Pod found: {pod.name} in namespace {pod.namespace} startedAt: {pod.start_time}"
+    prefix = "Pod found" if event == "LISTED" else f"{event.capitalize()} pod"
+    return f"{prefix}: {pod.name} in namespace {pod.namespace} phase: {pod.phase} startedAt: {pod.start_time}"
 
 
 @click.command(name="mp", help="Match a pod by name (substring) in a namespace")
-@click.argument("name", type=click.STRING)
+@click.argument("name", type=click.STRING, shell_complete=complete_pods)
 @click.option("--interactive", "-i", is_flag=True, default=False, help="Whether to interactively connect to the pod")
-@click.option("--namespace", "-n", type=click.STRING, default="default", help="Namespace of the pod")
+@click.option("--namespace", "-n", type=click.STRING, default="default", shell_complete=complete_namespaces, help="Namespace of the pod")
+@click.option("--all-namespaces", "-A", is_flag=True, default=False, help="Search the pods of every namespace")
+@click.option("--selector", "-l", type=click.STRING, default=None, help="Label selector evaluated by the API server")
+@click.option("--field-selector", type=click.STRING, default=None, help="Field selector evaluated by the API server")
 @click.option("--shell", "-s", type=click.STRING, default="bash", help="Shell to use for the command")
-def match_pod(name: str, namespace: str = "default", interactive: bool = False, shell: str = "bash"):
+@click.option("--watch", "-w", is_flag=True, default=False, help="Keep running and print changes of the matching pods")
+@cache_options
+@context_options
+def match_pod(name: str, namespace: str = "default", interactive: bool = False, shell: str = "bash",
+              all_namespaces: bool = False, selector: str = None, field_selector: str = None,
+              watch: bool = False, cache_ttl: int = 15, no_cache: bool = False,
+              contexts: Optional[str] = None, all_contexts: bool = False):
     """
     Match a pod by name (substring) in a namespace
 
+    Pods are listed page by page and printed as they arrive. Selectors are evaluated by
+    the API server, only the name substring is matched locally. Listings are cached on
+    disk and revalidated from their resourceVersion once older than the cache TTL.
+
     Args:
         name (str): The name of the pod to match
         namespace (str, optional): The namespace of the pod. Defaults to "default"
         interactive (bool, optional): Whether to interactively connect to the pod. Defaults to False
         shell (str, optional): The shell to use for the command. Defaults to "bash"
+        all_namespaces (bool, optional): Search every namespace concurrently. Defaults to False
+        selector (str, optional): Label selector evaluated by the API server
+        field_selector (str, optional): Field selector evaluated by the API server
+        watch (bool, optional): Follow the changes of the matching pods after listing. Defaults to False
+        cache_ttl (int, optional): Seconds a cached listing is used without revalidating it
+        no_cache (bool, optional): Always list from the API server. Defaults to False
+        contexts (str, optional): Comma separated kubeconfig contexts to search concurrently
+        all_contexts (bool, optional): Search every kubeconfig context. Defaults to False
 
     Returns:
         None: Matches a pod by name (substring) in a namespace
     """
-    config.load_config()
-    pods = client.CoreV1Api().list_namespaced_pod(namespace=namespace)
+    if watch and interactive:
+        raise click.UsageError("--watch can not be combined with --interactive")
+
+    names = resolve_contexts(contexts, all_contexts)
+    if names is not None:
+        if interactive:
+            raise click.UsageError("--interactive can not be combined with --contexts or --all-contexts")
+
+        matches = across_contexts(
+            lambda context, api: match_pod_events(api, name, namespace, all_namespaces, selector, field_selector,
+                                                  watch, cache_ttl, no_cache, context),
+            names,
+            workers=len(names) if watch else DEFAULT_CONTEXT_WORKERS,
+        )
+        for context, (event, pod) in matches:
+            click.echo(f"Cluster: {context} | {format_match(event, pod, watch)}")
+        return
+
+    load_config()
+    api = throttled_api()
 
-    for pod in pods.items:
-        if name in pod.metadata.name:
+    matches = match_pod_events(api, name, namespace, all_namespaces, selector, field_selector, watch, cache_ttl, no_cache)
+    with closing(matches):
+        for event, pod in matches:
             if interactive:
-                action = click.prompt(f"Do you want to connect to {pod.metadata.name} in namespace {namespace} startedAt: {pod.status.start_time} ? (y/n)")
+                action = click.prompt(f"Do you want to connect to {pod.name} in namespace {pod.namespace} startedAt: {pod.start_time} ? (y/n)")
                 if action == "y":
-                    subprocess.call(["kubectl", "exec", "-it", pod.metadata.name, "-n", namespace, "--", shell])
+                    container = pod.container_statuses[0].name if pod.container_statuses else None
+                    exec_interactive(api, pod.name, pod.namespace, [shell], container)
                     break
-            click.echo(f"Pod found: {pod.metadata.name} in namespace {namespace} startedAt: {pod.status.start_time}")
+            click.echo(format_match(event, pod, watch))
@@ -0,0 +1,238 @@
+"""
+This module contains the pool of reusable node-shell pods
+
+Instead of creating and deleting a privileged pod on every `notoil k8s re`, one labeled
+node-shell per node is kept in kube-system and reused across invocations. Every use
+refreshes its last-used annotation, also periodically while a session runs in it, and
+`notoil k8s gc` deletes the shells that have been idle for longer than their TTL. The
+shell container's sleep additionally bounds the lifetime of shells nobody collects, so
+a shell close to the end of its sleep is replaced instead of being handed out.
+"""
+################################################### Python Import ##################################
+
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Tuple
+
+import click
+
+################################################### Project Import #################################
+
+from notoil.utils.imports import LazyModule
+
+from .api import READY_TIMEOUT, Pod, decode, iter_pages, load_config, wait_for_deletion
+from .ssh import SHELL_LIFETIME, ssh_into_node
+from .throttle import throttled_api
+
+################################################### Main Declaration ###############################
+
+client = LazyModule("kubernetes.client")
+
+NAMESPACE = "kube-system"
+
+SHELL_LABEL = "notoil.io/node-shell"
+
+LAST_USED_ANNOTATION = "notoil.io/last-used"
+
+IDLE_TTL_ANNOTATION = "notoil.io/idle-ttl"
+
+EXPIRES_ANNOTATION = "notoil.io/expires-at"
+
+DEFAULT_IDLE_TTL = 900
+
+# A shell whose sleep ends sooner is replaced, so sessions started in it can run this long
+MIN_REMAINING = 3600
+
+# Seconds between refreshes of the last-used annotation while a session runs
+TOUCH_INTERVAL = 60
+
+# Creations of a node-shell losing a race with another invocation before giving up
+CREATE_ATTEMPTS = 3
+
+
+def node_shell_name(node_name: str) -> str:
+    """
+    Return the name of the pooled node-shell of a node
+
+    Node names can be longer than a pod name allows, so the name is derived from a hash.
+
+    Args:
+        node_name (str): The name of the node
+
+    Returns:
+        str: The pod name
+    """
+    return f"node-shell-{hashlib.sha1(node_name.encode()).hexdigest()[:12]}"
+
+
+def touch_node_shell(api: client.CoreV1Api, pod_name: str, namespace: str = NAMESPACE):
+    """
+    Refresh the last-used annotation of a node-shell
+
+    Args:
+        api (client.CoreV1Api): The API to use
+        pod_name (str): The name of the node-shell pod
+        namespace (str, optional): The namespace of the pod. Defaults to "kube-system"
+    """
+    body = {"metadata": {"annotations": {LAST_USED_ANNOTATION: str(int(time.time()))}}}
+    decode(api.patch_namespaced_pod(name=pod_name, namespace=namespace, body=body, _preload_content=False))
+
+
+@contextmanager
+def node_shell_in_use(api: client.CoreV1Api, pod_name: str, namespace: str = NAMESPACE,
+                      interval: float = TOUCH_INTERVAL) -> Iterator[None]:
+    """
+    Keep refreshing the last-used annotation of a node-shell while a session runs in it
+
+    Otherwise `gc` takes a shell used for longer than its idle TTL for an idle one and
+    deletes it under the session.
+
+    Args:
+        api (client.CoreV1Api): The API to use
+        pod_name (str): The name of the node-shell pod
+        namespace (str, optional): The namespace of the pod. Defaults to "kube-system"
+        interval (float, optional): Seconds between refreshes. Defaults to 60
+    """
+    stop = threading.Event()
+
+    def refresh():
+        while not stop.wait(interval):
+            try:
+                touch_node_shell(api, pod_name, namespace)
+            except Exception:  # pylint: disable=broad-except
+                # The next refresh tries again, the session must not fail because of it
+                pass
+
+    thread = threading.Thread(target=refresh, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def acquire_node_shell(api: client.CoreV1Api, node_name: str, namespace: str = NAMESPACE,
+                       idle_ttl: int = DEFAULT_IDLE_TTL, timeout: float = READY_TIMEOUT) -> Tuple[str, bool]:
+    """
+    Return the node-shell of a node, creating it if there is no usable one
+
+    A finished or terminating shell, or one whose sleep ends within `MIN_REMAINING`
+    seconds, is deleted and waited for before its name is reused. A shell created
+    concurrently by another invocation is reused once read back.
+
+    Args:
+        api (client.CoreV1Api): The API to use
+        node_name (str): The name of the node
+        namespace (str, optional): The namespace of the pool. Defaults to "kube-system"
+        idle_ttl (int, optional): Seconds a new shell may stay unused before `gc` deletes it
+        timeout (float, optional): Seconds to wait for a replaced shell to be gone. Defaults to 120
+
+    Returns:
+        tuple: The pod name and whether it was just created
+
+    Raises:
+        click.ClickException: If a replaced shell is still there after the timeout
+    """
+    pod_name = node_shell_name(node_name)
+
+    for attempt in range(CREATE_ATTEMPTS):
+        try:
+            pod = decode(api.read_namespaced_pod(name=pod_name, namespace=namespace, _preload_content=False))
+        except client.ApiException as exc:
+            if exc.status != 404:
+                raise
+            pod = None
+
+        if pod is not None:
+            phase = (pod.get("status") or {}).get("phase")
+            # Shells created before the annotation existed have an unknown end, they are replaced
+            expires = int((pod["metadata"].get("annotations") or {}).get(EXPIRES_ANNOTATION, 0))
+            if phase not in ("Succeeded", "Failed") and not pod["metadata"].get("deletionTimestamp") \
+                    and expires - time.time() > MIN_REMAINING:
+                touch_node_shell(api, pod_name, namespace)
+                return pod_name, False
+
+            # The shell outlived or is close to the end of its sleep, or is being deleted,
+            # its name is only free once it is gone
+            try:
+                decode(api.delete_namespaced_pod(name=pod_name, namespace=namespace, grace_period_seconds=0,
+                                                 _preload_content=False))
+            except client.ApiException as exc:
+                if exc.status != 404:
+                    raise
+            try:
+                wait_for_deletion(api, [Pod.from_json(pod)], namespace, f"{SHELL_LABEL}=true", timeout)
+            except TimeoutError as exc:
+                raise click.ClickException(f"Node-shell {pod_name} is still terminating after {timeout:g}s") from exc
+
+        try:
+            ssh_into_node(
+                node_name,
+                pod_name=pod_name,
+                namespace=namespace,
+                labels={SHELL_LABEL: "true"},
+                annotations={LAST_USED_ANNOTATION: str(int(time.time())), IDLE_TTL_ANNOTATION: str(idle_ttl),
+                             EXPIRES_ANNOTATION: str(int(time.time()) + SHELL_LIFETIME)},
+            )
+        except client.ApiException as exc:
+            # Another invocation created it concurrently, read it back to reuse it
+            if exc.status != 409 or attempt == CREATE_ATTEMPTS - 1:
+                raise
+            continue
+        return pod_name, True
+
+    raise click.ClickException(f"Node-shell {pod_name} could not be acquired")
+
+
+def iter_expired_node_shells(api: client.CoreV1Api, namespace: str = NAMESPACE,
+                             include_all: bool = False) -> Iterator[Tuple[str, str, int]]:
+    """
+    Find the node-shells that have been idle for longer than their TTL
+
+    Args:
+        api (client.CoreV1Api): The API to use
+        namespace (str, optional): The namespace of the pool. Defaults to "kube-system"
+        include_all (bool, optional): Report every node-shell regardless of its age
+
+    Yields:
+        tuple: The pod name, the node name and the idle time in seconds
+    """
+    now = int(time.time())
+    for page in iter_pages(api.list_namespaced_pod, namespace=namespace, label_selector=f"{SHELL_LABEL}=true"):
+        for pod in page["items"]:
+            annotations = pod["metadata"].get("annotations") or {}
+            idle = now - int(annotations.get(LAST_USED_ANNOTATION, 0))
+            ttl = int(annotations.get(IDLE_TTL_ANNOTATION, DEFAULT_IDLE_TTL))
+            finished = pod.get("status", {}).get("phase") in ("Succeeded", "Failed")
+
+            if include_all or finished or idle > ttl:
+                yield pod["metadata"]["name"], pod.get("spec", {}).get("nodeName", ""), idle
+
+
+@click.command(name="gc", help="Delete pooled node-shell pods that have been idle for longer than their TTL")
+@click.option("--all", "-a", "include_all", is_flag=True, default=False, help="Delete every pooled node-shell")
+@click.option("--dry-run", is_flag=True, default=False, help="Only print the node-shells that would be deleted")
+def gc_node_shells(include_all: bool = False, dry_run: bool = False):
+    """
+    Delete expired pooled node-shell pods
+
+    Args:
+        include_all (bool, optional): Delete every pooled node-shell. Defaults to False
+        dry_run (bool, optional): Only print the node-shells that would be deleted. Defaults to False
+    """
+    load_config()
+    api = throttled_api()
+
+    expired: List[Tuple[str, str, int]] = list(iter_expired_node_shells(api, include_all=include_all))
+    for pod_name, node_name, idle in expired:
+        click.echo(f"{'Would delete' if dry_run else 'Deleting'} node-shell {pod_name} on node {node_name} (idle {idle}s)")
+        if not dry_run:
+            decode(api.delete_namespaced_pod(name=pod_name, namespace=NAMESPACE, grace_period_seconds=0, _preload_content=False))
+
+    if not expired:
+        click.echo("No expired node-shells found")
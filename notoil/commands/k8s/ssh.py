@@ -1,12 +1,21 @@
 
 ################################################### Python Import ##################################
 
-from kubernetes import client
+from __future__ import annotations
 
 ################################################### Project Import #################################
 
+from notoil.utils.imports import LazyModule
+
+from .throttle import throttled_api
+
 ################################################### Main Declaration ###############################
 
+client = LazyModule("kubernetes.client")
+
+# Seconds the shell container sleeps before the pod completes
+SHELL_LIFETIME = 14000
+
 
 def ssh_volume() -> client.V1Volume:
     """
@@ -86,7 +95,7 @@ def ssh_container() -> client.V1Container:
             '-i',            # IPC namespace
             '-n',            # Network namespace
             "sleep",         # Command to execute
-            '14000'          # Sleep for ~4 hours to keep container running
+            str(SHELL_LIFETIME)  # Sleep for ~4 hours to keep container running
         ],
         # Mount the API access volume for authentication
         volume_mounts=[client.V1VolumeMount(
@@ -101,7 +110,8 @@ def ssh_container() -> client.V1Container:
     )
 
 
-def ssh_into_node(node_name: str, pod_name: str, namespace: str = "kube-system") -> client.V1Pod:
+def ssh_into_node(node_name: str, pod_name: str, namespace: str = "kube-system", labels: dict = None,
+                  annotations: dict = None) -> client.V1Pod:
     """
     Create a pod that provides SSH access to a specific Kubernetes node.
     
@@ -114,6 +124,8 @@ def ssh_into_node(node_name: str, pod_name: str, namespace: str = "kube-system")
         pod_name (str): The name to assign to the created pod
         namespace (str, optional): The namespace where the pod will be created. 
                                  Defaults to "kube-system".
+        labels (dict, optional): Labels of the pod, e.g. to find pooled node shells
+        annotations (dict, optional): Annotations of the pod
     
     Returns:
         client.V1Pod: The created pod object that provides node access
@@ -122,14 +134,16 @@ def ssh_into_node(node_name: str, pod_name: str, namespace: str = "kube-system")
         The pod runs with privileged security context and has access to host
         namespaces (network, PID, IPC) to enable full node access.
     """
-    return client.CoreV1Api().create_namespaced_pod(
+    return throttled_api().create_namespaced_pod(
         namespace=namespace,
         body=client.V1Pod(
             api_version="v1",
             kind="Pod",
             metadata=client.V1ObjectMeta(
                 name=pod_name,
-                namespace=namespace
+                namespace=namespace,
+                labels=labels,
+                annotations=annotations
             ),
             spec=client.V1PodSpec(
                 # Mount the API access volume for authentication
@@ -142,6 +156,9 @@ def ssh_into_node(node_name: str, pod_name: str, namespace: str = "kube-system")
                 ],
                 # Immediate termination when pod is deleted
                 termination_grace_period_seconds=0,
+                # Let the pod complete once the sleep ends instead of restarting it,
+                # this bounds the lifetime of shells that are never cleaned up
+                restart_policy="Never",
                 # Schedule pod on specific node
                 node_name=node_name,
                 # Access host network, PID, and IPC namespaces
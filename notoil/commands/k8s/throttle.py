@@ -0,0 +1,316 @@
+"""
+This module contains the client-side throttling of the requests to the API servers
+
+Every API built with `throttled_api` sends its requests through a token bucket of its
+API server and a concurrency cap shared by the whole command. Requests rejected by API
+Priority & Fairness (429) are retried after the Retry-After the server asked for, or
+else after a jittered exponential backoff, so bulk operations slow down to what the
+cluster accepts instead of failing.
+"""
+################################################### Python Import ##################################
+
+from __future__ import annotations
+
+import functools
+import json
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
+
+################################################### Project Import #################################
+
+from notoil.utils.imports import LazyModule
+from notoil.utils.timings import enabled, record
+
+################################################### Main Declaration ###############################
+
+client = LazyModule("kubernetes.client")
+
+# Statuses worth retrying, the latter only for requests without side effects
+THROTTLED_STATUS = 429
+
+UNAVAILABLE_STATUSES = (503, 504)
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# Subresources streaming over a websocket or an upgraded connection
+CONNECT_SUBRESOURCES = ("exec", "attach", "portforward")
+
+# Waits shorter than this are not reported as throttling
+MIN_REPORTED_WAIT = 0.001
+
+BASE_DELAY = 0.5
+
+
+class Limits(NamedTuple):
+    """Throttling settings of a command"""
+
+    qps: float = 50
+    burst: int = 100
+    max_inflight: int = 64
+    max_retries: int = 6
+    max_delay: float = 30
+
+
+class TokenBucket:
+    """
+    Token bucket handing out `qps` requests per second after an initial `burst`
+
+    Tokens are reserved ahead, so concurrent callers are served in arrival order
+    without polling.
+    """
+
+    def __init__(self, qps: float, burst: int):
+        self.qps = qps
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Take a token
+
+        Returns:
+            float: Seconds to wait before the token may be used
+        """
+        if self.qps <= 0:
+            return 0.0
+
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.qps) - 1
+            self.updated = now
+            return max(0.0, -self.tokens / self.qps)
+
+    def acquire(self):
+        """
+        Wait until a token is available
+        """
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+
+
+_limits = Limits()
+
+_inflight = threading.BoundedSemaphore(_limits.max_inflight)
+
+_buckets: Dict[str, TokenBucket] = {}
+
+_buckets_lock = threading.Lock()
+
+
+def configure(qps: float = 50, burst: int = 100, max_inflight: int = 64, max_retries: int = 6):
+    """
+    Set the throttling of the current command, before any API is used
+
+    Args:
+        qps (float, optional): Requests per second per API server, 0 disables the limit. Defaults to 50
+        burst (int, optional): Requests sent at once before `qps` applies. Defaults to 100
+        max_inflight (int, optional): Maximum number of concurrent requests. Defaults to 64
+        max_retries (int, optional): Retries of a throttled request. Defaults to 6
+    """
+    global _limits, _inflight  # pylint: disable=global-statement
+
+    _limits = Limits(qps, burst, max_inflight, max_retries)
+    _inflight = threading.BoundedSemaphore(max_inflight)
+    with _buckets_lock:
+        _buckets.clear()
+
+
+def bucket_for(host: str) -> TokenBucket:
+    """
+    Return the token bucket of an API server, shared by every API talking to it
+
+    Args:
+        host (str): The URL of the API server
+
+    Returns:
+        TokenBucket: The bucket
+    """
+    with _buckets_lock:
+        if host not in _buckets:
+            _buckets[host] = TokenBucket(_limits.qps, _limits.burst)
+        return _buckets[host]
+
+
+def retry_after(headers: Optional[Any]) -> Optional[float]:
+    """
+    Parse the Retry-After header of a response
+
+    Args:
+        headers (Mapping, optional): The response headers
+
+    Returns:
+        float: The seconds to wait, None if the server did not say
+    """
+    value = (headers or {}).get("Retry-After") or (headers or {}).get("retry-after")
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff(attempt: int, max_delay: float) -> float:
+    """
+    Return a jittered exponential backoff, so throttled clients do not retry in lockstep
+
+    Args:
+        attempt (int): The number of failed attempts so far, from 0
+        max_delay (float): The upper bound of the delay
+
+    Returns:
+        float: Seconds to wait
+    """
+    return random.uniform(0, min(max_delay, BASE_DELAY * 2 ** attempt))
+
+
+def _retry_delay(exc: client.ApiException, method: str, attempt: int) -> Optional[float]:
+    """
+    Return how long to wait before retrying a failed request, None if it must not be retried
+    """
+    if attempt >= _limits.max_retries:
+        return None
+    if exc.status != THROTTLED_STATUS and not (exc.status in UNAVAILABLE_STATUSES and method in SAFE_METHODS):
+        return None
+
+    delay = retry_after(exc.headers)
+    return min(_limits.max_delay, delay) if delay is not None else backoff(attempt, _limits.max_delay)
+
+
+def request_name(method: str, url: str, query_params: Optional[Any] = None) -> Tuple[str, str]:
+    """
+    Describe a request the way the API server audits it, e.g. "list pods" or "connect pods/exec"
+
+    Args:
+        method (str): The HTTP method
+        url (str): The URL of the request
+        query_params (list, optional): The query parameters as (name, value) pairs
+
+    Returns:
+        tuple: The verb and resource, and the path of the request
+    """
+    path = urlsplit(url).path
+    parts = path.strip("/").split("/")
+    if parts[:1] == ["api"]:
+        parts = parts[2:]
+    elif parts[:1] == ["apis"]:
+        parts = parts[3:]
+    if len(parts) > 2 and parts[0] == "namespaces":
+        parts = parts[2:]
+    if not parts or not parts[0]:
+        return f"{method.lower()} {path}", path
+
+    resource, named = parts[0], len(parts) > 1
+    if len(parts) > 2:
+        resource = f"{resource}/{parts[2]}"
+
+    if len(parts) > 2 and parts[2] in CONNECT_SUBRESOURCES:
+        verb = "connect"
+    elif method == "GET":
+        watch = any(key == "watch" and str(value).lower() in ("true", "1") for key, value in query_params or ())
+        verb = "watch" if watch else "get" if named else "list"
+    elif method == "DELETE":
+        verb = "delete" if named else "deletecollection"
+    else:
+        verb = {"POST": "create", "PUT": "update", "PATCH": "patch"}.get(method, method.lower())
+    return f"{verb} {resource}", path
+
+
+def payload_size(body: Any) -> int:
+    """
+    Return the size of a request body once serialized
+    """
+    if body is None:
+        return 0
+    if isinstance(body, (bytes, str)):
+        return len(body)
+    return len(json.dumps(body, default=str))
+
+
+def response_size(response: Any) -> Optional[int]:
+    """
+    Return the size of a response body without reading a streamed one
+
+    Preloaded responses know their body, streamed ones only their Content-Length,
+    their body is accounted for when it is decoded.
+    """
+    if hasattr(response, "urllib3_response"):
+        return len(response.data)
+    length = (getattr(response, "headers", None) or {}).get("Content-Length")
+    return int(length) if length else None
+
+
+def throttle(request: Callable, host: str) -> Callable:
+    """
+    Wrap a function with the signature of `ApiClient.request` into the throttling
+
+    Args:
+        request (Callable): Sends a request, called with the HTTP method and the URL first
+        host (str): The URL of the API server
+
+    Returns:
+        Callable: The throttled function
+    """
+    bucket = bucket_for(host)
+
+    @functools.wraps(request)
+    def throttled(method: str, *args, **kwargs):
+        name = detail = sent = None
+        if enabled():
+            url = args[0] if args else kwargs.get("url", "")
+            (name, detail), sent = request_name(method, url, kwargs.get("query_params")), payload_size(kwargs.get("body"))
+
+        attempt = 0
+        while True:
+            queued = time.perf_counter()
+            bucket.acquire()
+            # Streaming responses return once their headers arrived, so watches do not hold a slot
+            with _inflight:
+                start = time.perf_counter()
+                if start - queued >= MIN_REPORTED_WAIT:
+                    record("throttle", "client rate limit", queued, detail)
+                try:
+                    response = request(method, *args, **kwargs)
+                except client.ApiException as exc:
+                    record("api", name, start, detail, sent, status=exc.status)
+                    delay, status = _retry_delay(exc, method, attempt), exc.status
+                    if delay is None:
+                        raise
+                else:
+                    if name is not None:
+                        record("api", name, start, detail, sent, response_size(response), getattr(response, "status", None))
+                    return response
+
+            start = time.perf_counter()
+            time.sleep(delay)
+            record("throttle", f"retry after {status}", start, detail)
+            attempt += 1
+
+    return throttled
+
+
+def throttled_api(configuration: Optional[client.Configuration] = None) -> client.CoreV1Api:
+    """
+    Build an API whose requests are throttled
+
+    Args:
+        configuration (client.Configuration, optional): The configuration. Defaults to the loaded one
+
+    Returns:
+        client.CoreV1Api: The API, with a connection pool of its own
+    """
+    api_client = client.ApiClient(configuration)
+    api_client.request = throttle(api_client.request, api_client.configuration.host)
+    return client.CoreV1Api(api_client)
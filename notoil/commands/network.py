@@ -4,18 +4,71 @@ This module contains various command declarations for working with networks
 """
 ################################################### Python Import ##################################
 
+import csv
 import ipaddress
+import json
+from typing import IO
 
 import click
 
 ################################################### Project Import #################################
+
+from notoil.utils.cidr import CidrIndex, audit_networks, enumerate_networks, read_networks
+from notoil.utils.cidr_file import open_index, write_index
+from notoil.utils.groups import DefaultGroup
+
 ################################################### Main Declaration ###############################
 
 
-@click.command(help="Check if an IP address is present inside a subnet or not")
+def write_matches(index: CidrIndex, ips: IO[str], output: IO[str], output_format: str = "jsonl", all_matches: bool = False):
+    """
+    Stream IP addresses through an index and write the matching networks
+
+    Every input IP produces output, IPs without a match get an empty match list (jsonl)
+    or an empty network column (csv). Invalid lines are reported on stderr and skipped.
+
+    Args:
+        index (CidrIndex): The index to match against
+        ips (IO[str]): Stream of IP addresses, one per line
+        output (IO[str]): Stream to write the results to
+        output_format (str, optional): Either "jsonl" or "csv". Defaults to "jsonl"
+        all_matches (bool, optional): Emit every containing network instead of only
+            the most specific one. Defaults to False
+    """
+    writer = csv.writer(output, lineterminator="\n") if output_format == "csv" else None
+
+    for line in iter(ips.readline, ""):
+        ip = line.strip()
+        if not ip:
+            continue
+
+        try:
+            matches = index.match(ip, all_matches)
+        except ValueError:
+            click.echo(f"Skipping invalid IP address: {ip}", err=True)
+            continue
+
+        if writer is None:
+            output.write(json.dumps({"ip": ip, "matches": [{"network": net, "tags": tags} for net, tags in matches]}))
+            output.write("\n")
+        elif not matches:
+            writer.writerow([ip, "", ""])
+        else:
+            writer.writerows([ip, net, ";".join(tags)] for net, tags in matches)
+
+
+@click.group(cls=DefaultGroup, default_command="check",
+             help="Check if an IP address is present inside a subnet or not, or match IPs in bulk")
+def ip_network():
+    """
+    Network command group, `notoil ip-network <ip> <net>` falls back to the check command
+    """
+
+
+@ip_network.command(name="check", help="Check if an IP address is present inside a subnet or not")
 @click.argument("ip", type=click.STRING)
 @click.argument("net", type=click.STRING)
-def ip_network(ip, net):
+def ip_network_check(ip, net):
     """Can be used for checking if a IP string is present in a network or not
 
     Args:
@@ -29,3 +82,93 @@ def ip_network(ip, net):
         click.echo(f"{_ip} address is present in {_network} network")
     else:
         click.echo(f"{_ip} address is not present in {_network} network")
+
+
+@ip_network.command(name="match", help="Match a stream of IP addresses against a list of networks or a compiled index")
+@click.argument("networks", type=click.Path(exists=True, dir_okay=False))
+@click.argument("ips", type=click.File("r"), default="-")
+@click.option("--format", "-f", "output_format", type=click.Choice(["jsonl", "csv"]), default="jsonl",
+              help="Output format")
+@click.option("--all", "-a", "all_matches", is_flag=True, default=False,
+              help="Emit every containing network instead of only the most specific one")
+def ip_network_match(networks: str, ips: IO[str], output_format: str = "jsonl", all_matches: bool = False):
+    """
+    Match a stream of IP addresses against a list of networks
+
+    Args:
+        networks (str): File with one `<cidr> [tag ...]` entry per line, or an index
+            compiled with `notoil ip-network index build`
+        ips (IO[str]): File with one IP address per line, defaults to stdin
+        output_format (str, optional): Either "jsonl" or "csv". Defaults to "jsonl"
+        all_matches (bool, optional): Emit every containing network. Defaults to False
+    """
+    try:
+        index = open_index(networks)
+    except ValueError as exc:
+        raise click.BadParameter(str(exc), param_hint="NETWORKS") from exc
+
+    write_matches(index, ips, click.get_text_stream("stdout"), output_format, all_matches)
+
+
+@ip_network.group(name="index", help="Manage compiled CIDR index files")
+def ip_network_index():
+    """
+    Index command group, compiled indexes are memory mapped by `notoil ip-network match`
+    """
+
+
+@ip_network_index.command(name="build", help="Compile a list of networks into a memory mappable index file")
+@click.argument("networks", type=click.File("r"))
+@click.argument("output", type=click.Path(dir_okay=False, writable=True))
+def ip_network_index_build(networks: IO[str], output: str):
+    """
+    Compile a list of networks into an index file
+
+    Args:
+        networks (IO[str]): File with one `<cidr> [tag ...]` entry per line
+        output (str): Path of the index file to write
+    """
+    try:
+        index = CidrIndex(read_networks(networks))
+    except ValueError as exc:
+        raise click.BadParameter(str(exc), param_hint="NETWORKS") from exc
+
+    size = write_index(index, output)
+    click.echo(f"Indexed {len(index)} networks into {output} ({size} bytes)")
+
+
+@ip_network.command(name="audit", help="Report duplicate and shadowed entries of a list of networks and its collapsed form")
+@click.argument("networks", type=click.File("r"), default="-")
+@click.option("--format", "-f", "output_format", type=click.Choice(["text", "json"]), default="text",
+              help="Output format")
+def ip_network_audit(networks: IO[str], output_format: str = "text"):
+    """
+    Audit a list of networks, e.g. exported security group or NetworkPolicy rules
+
+    Args:
+        networks (IO[str]): File with one `<cidr> [tag ...]` entry per line, defaults to stdin
+        output_format (str, optional): Either "text" or "json". Defaults to "text"
+    """
+    try:
+        entries = list(enumerate_networks(iter(networks.readline, "")))
+    except ValueError as exc:
+        raise click.BadParameter(str(exc), param_hint="NETWORKS") from exc
+
+    report = audit_networks(entries)
+
+    if output_format == "json":
+        click.echo(json.dumps({"entries": len(entries), **report}, indent=2))
+        return
+
+    click.echo(f"Duplicates ({len(report['duplicates'])}):")
+    for finding in report["duplicates"]:
+        click.echo(f"  line {finding['line']}: {finding['network']} duplicates line {finding['duplicate_of']}")
+
+    click.echo(f"Shadowed ({len(report['shadowed'])}):")
+    for finding in report["shadowed"]:
+        container = finding["contained_in"]
+        click.echo(f"  line {finding['line']}: {finding['network']} is contained in {container['network']} (line {container['line']})")
+
+    click.echo(f"Collapsed ({len(entries)} -> {len(report['collapsed'])}):")
+    for network in report["collapsed"]:
+        click.echo(f"  {network}")
@@ -4,21 +4,120 @@ This module contains various command declarations for working with TOTP
 """
 ################################################### Python Import ##################################
 
+import binascii
+import time
+from typing import IO, List, Tuple
+
 import pyotp
 import click
 
 ################################################### Project Import #################################
 ################################################### Main Declaration ###############################
 
+INTERVAL = 30
+
+
+class DecodedTOTP(pyotp.TOTP):
+    """TOTP generator that decodes its base32 secret once instead of on every code.
+
+    Args:
+        secret (str): The base32 secret key
+
+    Raises:
+        ValueError: If the secret is not valid base32
+    """
+
+    def __init__(self, secret: str, **kwargs):
+        super().__init__("".join(secret.split()), **kwargs)
+        try:
+            self._byte_secret = super().byte_secret()
+        except binascii.Error as exc:
+            raise ValueError(f"invalid base32 secret: {exc}") from exc
+
+    def byte_secret(self) -> bytes:
+        return self._byte_secret
+
+
+def read_secrets(stream: IO[str]) -> List[Tuple[str, DecodedTOTP]]:
+    """
+    Read named secrets from a text stream
+
+    Lines have the form ``<name> <secret>``, spaces inside the secret are ignored. Blank
+    lines and lines starting with ``#`` are skipped.
+
+    Args:
+        stream (IO[str]): The stream to read
+
+    Returns:
+        list: ``(name, totp)`` pairs in file order
+
+    Raises:
+        ValueError: If a line has no secret or an invalid one
+    """
+    secrets = []
+    for number, line in enumerate(iter(stream.readline, ""), start=1):
+        fields = line.split()
+        if not fields or fields[0].startswith("#"):
+            continue
+
+        if len(fields) < 2:
+            raise ValueError(f"line {number}: expected '<name> <secret>'")
+
+        try:
+            secrets.append((fields[0], DecodedTOTP("".join(fields[1:]), interval=INTERVAL)))
+        except ValueError as exc:
+            raise ValueError(f"line {number}: {exc}") from exc
+
+    return secrets
+
+
+def generate_codes(secrets: List[Tuple[str, DecodedTOTP]], for_time: float) -> List[Tuple[str, str]]:
+    """
+    Generate the codes of every secret for the same time step
+
+    Args:
+        secrets (list): ``(name, totp)`` pairs, as returned by `read_secrets`
+        for_time (float): Unix timestamp to generate the codes for
+
+    Returns:
+        list: ``(name, code)`` pairs
+    """
+    counter = int(for_time // INTERVAL)
+    return [(name, totp.generate_otp(counter)) for name, totp in secrets]
+
 
 @click.command(help="Generate a TOTP token")
-@click.argument("secret", type=click.STRING)
-def get_totp(secret):
+@click.argument("secret", type=click.STRING, required=False)
+@click.option("--file", "-f", "secrets_file", type=click.File("r"),
+              help="File with one '<name> <secret>' entry per line")
+@click.option("--watch", "-w", is_flag=True, default=False,
+              help="Keep running and print fresh codes at every 30 second step")
+def get_totp(secret, secrets_file=None, watch=False):
     """
     Generate a TOTP token
 
     Args:
         secret (string): The secret key to use for the TOTP token
+        secrets_file (IO[str], optional): File with named secrets, generates a code for each
+        watch (bool, optional): Regenerate the codes at every step boundary. Defaults to False
     """
-    totp = pyotp.TOTP(secret)
-    click.echo(totp.now())
+    if (secret is None) == (secrets_file is None):
+        raise click.UsageError("Provide either a SECRET or --file")
+
+    try:
+        secrets = read_secrets(secrets_file) if secrets_file else [("", DecodedTOTP(secret, interval=INTERVAL))]
+    except ValueError as exc:
+        raise click.BadParameter(str(exc)) from exc
+
+    while True:
+        now = time.time()
+        for name, code in generate_codes(secrets, now):
+            click.echo(f"{name}: {code}" if name else code)
+
+        if not watch:
+            return
+
+        # Sleep until the next step boundary instead of polling
+        time.sleep(INTERVAL - now % INTERVAL)
+        if len(secrets) > 1:
+            click.echo("")
@@ -0,0 +1,287 @@
+"""
+This module contains helpers for indexing and matching large sets of CIDR blocks
+
+"""
+################################################### Python Import ##################################
+
+import abc
+import ipaddress
+from bisect import bisect_right
+from typing import Dict, IO, Iterable, Iterator, List, Sequence, Tuple, Union
+
+################################################### Project Import #################################
+################################################### Main Declaration ###############################
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+Match = Tuple[str, List[str]]
+
+
+def parse_network_line(line: str) -> Union[Tuple[Network, List[str]], None]:
+    """
+    Parse a single line of a CIDR list
+
+    Lines have the form ``<cidr> [tag ...]`` where tags are separated by whitespace or
+    commas. Blank lines and lines starting with ``#`` are ignored.
+
+    Args:
+        line (str): The line to parse
+
+    Returns:
+        tuple: The parsed network and its tags, or None for blank/comment lines
+    """
+    fields = line.replace(",", " ").split()
+    if not fields or fields[0].startswith("#"):
+        return None
+
+    return ipaddress.ip_network(fields[0], strict=False), fields[1:]
+
+
+def enumerate_networks(stream: IO[str]) -> Iterator[Tuple[int, Network, List[str]]]:
+    """
+    Read a CIDR list from a text stream, keeping track of line numbers
+
+    Args:
+        stream (IO[str]): The stream to read, one ``<cidr> [tag ...]`` entry per line
+
+    Yields:
+        tuple: The line number, network and tags for every entry
+
+    Raises:
+        ValueError: If a line does not contain a valid CIDR block
+    """
+    for number, line in enumerate(stream, start=1):
+        try:
+            entry = parse_network_line(line)
+        except ValueError as exc:
+            raise ValueError(f"line {number}: {exc}") from exc
+
+        if entry is not None:
+            yield number, entry[0], entry[1]
+
+
+def read_networks(stream: IO[str]) -> Iterator[Tuple[Network, List[str]]]:
+    """
+    Read a CIDR list from a text stream
+
+    Args:
+        stream (IO[str]): The stream to read, one ``<cidr> [tag ...]`` entry per line
+
+    Yields:
+        tuple: The network and its tags for every entry
+
+    Raises:
+        ValueError: If a line does not contain a valid CIDR block
+    """
+    for _, network, tags in enumerate_networks(stream):
+        yield network, tags
+
+
+class SegmentTable(abc.ABC):
+    """Base class for the per IP version lookup tables.
+
+    Subclasses provide the ``starts``, ``ends``, ``owners`` and ``parents`` sequences
+    and the `entry` method, the binary search is shared.
+    """
+
+    starts: Sequence[int]
+    ends: Sequence[int]
+    owners: Sequence[int]
+    parents: Sequence[int]
+
+    def lookup(self, address: int) -> int:
+        """
+        Find the most specific network containing an address
+
+        Args:
+            address (int): The address as an integer
+
+        Returns:
+            int: Index of the matching network, -1 if no network contains the address
+        """
+        position = bisect_right(self.starts, address) - 1
+        if position < 0 or address > self.ends[position]:
+            return -1
+        return self.owners[position]
+
+    @abc.abstractmethod
+    def entry(self, index: int) -> Match:
+        """
+        Return the network and tags stored at an index
+
+        Args:
+            index (int): Index of the network
+
+        Returns:
+            tuple: The network as a string and its tags
+        """
+
+
+class FamilyTable(SegmentTable):
+    """Flattened interval table for the CIDR blocks of a single IP version.
+
+    CIDR blocks are either nested or disjoint, so a sorted sweep splits the address
+    space into non overlapping segments, each owned by the most specific block that
+    covers it. A lookup is then a single binary search over the segment starts, and the
+    less specific matches are found by following the ``parents`` links.
+
+    Attributes:
+        networks (list): The distinct networks, sorted by start address and size
+        tags (list): The merged tags of every network
+        parents (list): Index of the closest enclosing network, -1 for top level ones
+        starts (list): First address of every segment
+        ends (list): Last address of every segment
+        owners (list): Index of the network owning every segment
+    """
+
+    def __init__(self, entries: Iterable[Tuple[Network, List[str]]]):
+        merged: Dict[Network, List[str]] = {}
+        for network, tags in entries:
+            known = merged.setdefault(network, [])
+            known.extend(tag for tag in tags if tag not in known)
+
+        self.networks = sorted(merged, key=lambda net: (int(net.network_address), net.prefixlen))
+        self.tags = [merged[network] for network in self.networks]
+        self.parents = [-1] * len(self.networks)
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        self.owners: List[int] = []
+
+        self._sweep()
+
+    def _sweep(self):
+        """
+        Split the address space into segments owned by the most specific network
+        """
+        last = [int(network.broadcast_address) for network in self.networks]
+        stack: List[int] = []
+        cursor = 0
+
+        for index, network in enumerate(self.networks):
+            first = int(network.network_address)
+
+            while stack and last[stack[-1]] < first:
+                closed = stack.pop()
+                self._emit(cursor, last[closed], closed)
+                cursor = last[closed] + 1
+
+            if stack:
+                self._emit(cursor, first - 1, stack[-1])
+                self.parents[index] = stack[-1]
+
+            stack.append(index)
+            cursor = first
+
+        while stack:
+            closed = stack.pop()
+            self._emit(cursor, last[closed], closed)
+            cursor = last[closed] + 1
+
+    def _emit(self, first: int, last: int, owner: int):
+        if first <= last:
+            self.starts.append(first)
+            self.ends.append(last)
+            self.owners.append(owner)
+
+    def entry(self, index: int) -> Match:
+        return str(self.networks[index]), self.tags[index]
+
+
+class CidrIndex:
+    """Longest-prefix-match index over IPv4 and IPv6 CIDR blocks.
+
+    Args:
+        entries (Iterable): Pairs of network and tags, as returned by `read_networks`
+    """
+
+    def __init__(self, entries: Iterable[Tuple[Network, List[str]]]):
+        entries = list(entries)
+        self.tables: Dict[int, SegmentTable] = {
+            version: FamilyTable(entry for entry in entries if entry[0].version == version)
+            for version in (4, 6)
+        }
+
+    def __len__(self) -> int:
+        return sum(len(table.parents) for table in self.tables.values())
+
+    def match(self, ip: str, all_matches: bool = False) -> List[Match]:
+        """
+        Match an IP address against the indexed networks
+
+        Args:
+            ip (str): The IP address to match
+            all_matches (bool, optional): Return every containing network instead of
+                only the most specific one. Defaults to False
+
+        Returns:
+            list: ``(network, tags)`` pairs, most specific first
+
+        Raises:
+            ValueError: If the IP address is not valid
+        """
+        address = ipaddress.ip_address(ip)
+        table = self.tables[address.version]
+
+        matches = []
+        index = table.lookup(int(address))
+        while index != -1:
+            matches.append(table.entry(index))
+            if not all_matches:
+                break
+            index = table.parents[index]
+
+        return matches
+
+
+def audit_networks(entries: Iterable[Tuple[int, Network, List[str]]]) -> Dict[str, list]:
+    """
+    Find duplicate and shadowed entries in a CIDR list and compute its collapsed form
+
+    CIDR blocks either nest or are disjoint, so every overlap is a containment. Entries
+    are sorted by version, start address and size, then a single sweep with a stack of
+    the currently open blocks finds the closest container of every entry, which keeps
+    the audit at O(n log n) instead of comparing every pair.
+
+    Args:
+        entries (Iterable): Line number, network and tags triples, as returned by
+            `enumerate_networks`
+
+    Returns:
+        dict: With the keys
+            - duplicates: entries repeating an earlier entry, with the line they repeat
+            - shadowed: entries fully contained in a broader entry, with that entry
+            - collapsed: the minimal list of networks covering the same addresses
+    """
+    entries = sorted(entries, key=lambda entry: (entry[1].version, int(entry[1].network_address), entry[1].prefixlen, entry[0]))
+
+    duplicates, shadowed = [], []
+    # Open blocks as (version, last address, line, network)
+    stack: List[Tuple[int, int, int, Network]] = []
+
+    for line, network, tags in entries:
+        first = int(network.network_address)
+        while stack and (stack[-1][0] != network.version or stack[-1][1] < first):
+            stack.pop()
+
+        finding = {"line": line, "network": str(network), "tags": tags}
+        if stack and stack[-1][3] == network:
+            # Point at the first occurrence, the stack keeps only that one
+            duplicates.append({**finding, "duplicate_of": stack[-1][2]})
+            continue
+
+        if stack:
+            shadowed.append({**finding, "contained_in": {"line": stack[-1][2], "network": str(stack[-1][3])}})
+
+        stack.append((network.version, int(network.broadcast_address), line, network))
+
+    collapsed = []
+    for version in (4, 6):
+        collapsed.extend(str(network) for network in ipaddress.collapse_addresses(
+            network for _, network, _ in entries if network.version == version
+        ))
+
+    return {
+        "duplicates": sorted(duplicates, key=lambda finding: finding["line"]),
+        "shadowed": sorted(shadowed, key=lambda finding: finding["line"]),
+        "collapsed": collapsed,
+    }
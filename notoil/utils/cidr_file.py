@@ -0,0 +1,239 @@
+"""
+This module contains the on-disk format of compiled CIDR indexes
+
+The file is a header followed by one block per IP version (4, then 6). Every block holds
+the flattened segment table of a `FamilyTable` as fixed width big-endian columns, so a
+lookup memory maps the file and binary searches it without parsing anything:
+
+    header   magic (8s) | format version (I) | v4 segments, v4 networks, v6 segments, v6 networks (4I)
+    block    starts (W * segments) | ends (W * segments) | owners (4 * segments)
+             parents (4 * networks) | label offsets (4 * (networks + 1)) | labels (utf-8)
+
+W is 4 bytes for IPv4 and 16 bytes for IPv6. Labels are ``<cidr>\\t<tag>\\t<tag>...``.
+"""
+################################################### Python Import ##################################
+
+import mmap
+import os
+import struct
+import tempfile
+from typing import List, Union
+
+################################################### Project Import #################################
+
+from notoil.utils.cidr import CidrIndex, FamilyTable, Match, SegmentTable, read_networks
+
+################################################### Main Declaration ###############################
+
+MAGIC = b"NOTOILCI"
+
+FORMAT_VERSION = 1
+
+HEADER = struct.Struct(">8sI4I")
+
+ADDRESS_WIDTH = {4: 4, 6: 16}
+
+INDEX_WIDTH = 4
+
+NO_PARENT = 0xFFFFFFFF
+
+
+class Column:
+    """Read-only sequence of fixed width unsigned big-endian integers inside a buffer.
+
+    Supports ``len`` and indexing, which is all `bisect` needs to search it in place.
+
+    Args:
+        buffer (memoryview): The buffer holding the column
+        width (int): Width of every item in bytes
+        length (int): Number of items
+        sentinel (int, optional): Stored value that is read back as -1
+    """
+
+    def __init__(self, buffer: memoryview, width: int, length: int, sentinel: Union[int, None] = None):
+        self.buffer = buffer
+        self.width = width
+        self.length = length
+        self.sentinel = sentinel
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, position: int) -> int:
+        if not 0 <= position < self.length:
+            raise IndexError(position)
+        offset = position * self.width
+        value = int.from_bytes(self.buffer[offset:offset + self.width], "big")
+        return -1 if value == self.sentinel else value
+
+
+class MappedFamilyTable(SegmentTable):
+    """Segment table of one IP version read directly from a mapped index file.
+
+    Args:
+        buffer (memoryview): The mapped file
+        offset (int): Offset of the block inside the file
+        version (int): The IP version of the block
+        segments (int): Number of segments in the block
+        networks (int): Number of networks in the block
+    """
+
+    def __init__(self, buffer: memoryview, offset: int, version: int, segments: int, networks: int):
+        width = ADDRESS_WIDTH[version]
+
+        self.starts = Column(buffer[offset:], width, segments)
+        offset += width * segments
+        self.ends = Column(buffer[offset:], width, segments)
+        offset += width * segments
+        self.owners = Column(buffer[offset:], INDEX_WIDTH, segments)
+        offset += INDEX_WIDTH * segments
+        self.parents = Column(buffer[offset:], INDEX_WIDTH, networks, sentinel=NO_PARENT)
+        offset += INDEX_WIDTH * networks
+        self.label_offsets = Column(buffer[offset:], INDEX_WIDTH, networks + 1)
+        offset += INDEX_WIDTH * (networks + 1)
+
+        self.labels = buffer[offset:offset + self.label_offsets[networks]]
+        # Where the block ends according to its counts, past the buffer if it was truncated
+        self.size = offset + self.label_offsets[networks]
+
+    def entry(self, index: int) -> Match:
+        label = bytes(self.labels[self.label_offsets[index]:self.label_offsets[index + 1]]).decode()
+        network, *tags = label.split("\t")
+        return network, tags
+
+
+class MappedCidrIndex(CidrIndex):
+    """Longest-prefix-match index backed by a memory mapped index file.
+
+    Only the pages touched by the binary searches are read from disk, so opening the
+    index costs the same regardless of how many networks it contains.
+
+    Args:
+        path (str): Path of the index file
+
+    Raises:
+        ValueError: If the file is not a notoil CIDR index, or is truncated
+    """
+
+    def __init__(self, path: str):  # pylint: disable=super-init-not-called
+        with open(path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        buffer = memoryview(self._mmap)
+        if len(buffer) < HEADER.size:
+            raise ValueError(f"{path} is not a notoil CIDR index")
+
+        magic, version, *counts = HEADER.unpack_from(buffer)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a notoil CIDR index (version {FORMAT_VERSION})")
+
+        self.tables = {}
+        offset = HEADER.size
+        for family, segments, networks in ((4, counts[0], counts[1]), (6, counts[2], counts[3])):
+            table = MappedFamilyTable(buffer, offset, family, segments, networks)
+            self.tables[family] = table
+            offset = table.size
+
+        if offset != len(buffer):
+            raise ValueError(f"{path} is truncated or corrupt")
+
+
+def serialize_table(table: FamilyTable, version: int) -> bytes:
+    """
+    Serialize the segment table of one IP version
+
+    Args:
+        table (FamilyTable): The table to serialize
+        version (int): The IP version of the table
+
+    Returns:
+        bytes: The serialized block
+    """
+    width = ADDRESS_WIDTH[version]
+    labels: List[bytes] = [
+        "\t".join([str(network), *tags]).encode() for network, tags in zip(table.networks, table.tags)
+    ]
+
+    label_offsets = [0]
+    for label in labels:
+        label_offsets.append(label_offsets[-1] + len(label))
+
+    parts = [
+        b"".join(value.to_bytes(width, "big") for value in table.starts),
+        b"".join(value.to_bytes(width, "big") for value in table.ends),
+        b"".join(value.to_bytes(INDEX_WIDTH, "big") for value in table.owners),
+        b"".join((NO_PARENT if value == -1 else value).to_bytes(INDEX_WIDTH, "big") for value in table.parents),
+        b"".join(value.to_bytes(INDEX_WIDTH, "big") for value in label_offsets),
+        *labels,
+    ]
+    return b"".join(parts)
+
+
+def write_index(index: CidrIndex, path: str) -> int:
+    """
+    Write an index file atomically
+
+    The file is written next to the target and renamed into place, so readers that have
+    the previous version mapped keep working while the index is rebuilt.
+
+    Args:
+        index (CidrIndex): The in-memory index to serialize
+        path (str): Path of the index file
+
+    Returns:
+        int: Size of the written file in bytes
+    """
+    v4, v6 = index.tables[4], index.tables[6]
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, len(v4.starts), len(v4.parents), len(v6.starts), len(v6.parents))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile("wb", dir=directory, delete=False) as file:
+        try:
+            file.write(header)
+            file.write(serialize_table(v4, 4))
+            file.write(serialize_table(v6, 6))
+        except BaseException:
+            os.unlink(file.name)
+            raise
+
+    # NamedTemporaryFile creates the file readable by its owner only, give it the mode
+    # a plain open() would have
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(file.name, 0o666 & ~umask)
+    os.replace(file.name, path)
+    return os.path.getsize(path)
+
+
+def is_index_file(path: str) -> bool:
+    """
+    Check if a file is a compiled CIDR index
+
+    Args:
+        path (str): Path of the file
+
+    Returns:
+        bool: True if the file starts with the index magic
+    """
+    with open(path, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def open_index(path: str) -> CidrIndex:
+    """
+    Open a compiled index file, or build an in-memory index from a CIDR list
+
+    Args:
+        path (str): Path of an index file or of a `<cidr> [tag ...]` list
+
+    Returns:
+        CidrIndex: The index
+
+    Raises:
+        ValueError: If the file is neither a valid index nor a valid CIDR list
+    """
+    if is_index_file(path):
+        return MappedCidrIndex(path)
+
+    with open(path, "r", encoding="utf-8") as file:
+        return CidrIndex(read_networks(file))
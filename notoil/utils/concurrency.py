@@ -0,0 +1,100 @@
+"""
+This module contains helpers for running blocking work concurrently
+
+"""
+################################################### Python Import ##################################
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty, Full, Queue
+from typing import Callable, Iterable, Iterator, TypeVar
+
+################################################### Project Import #################################
+################################################### Main Declaration ###############################
+
+T = TypeVar("T")
+
+I = TypeVar("I")
+
+DEFAULT_WORKERS = 8
+
+DEFAULT_BUFFER = 256
+
+_VALUE, _ERROR, _DONE = range(3)
+
+
+def _put(queue: Queue, stop: threading.Event, message: tuple) -> bool:
+    """
+    Put a message on a bounded queue, giving up once the consumer has stopped
+
+    Returns:
+        bool: False if the consumer stopped before the message could be queued
+    """
+    while not stop.is_set():
+        try:
+            queue.put(message, timeout=0.1)
+            return True
+        except Full:
+            continue
+    return False
+
+
+def interleave(func: Callable[[I], Iterable[T]], items: Iterable[I],
+               workers: int = DEFAULT_WORKERS, buffer: int = DEFAULT_BUFFER) -> Iterator[T]:
+    """
+    Run a generator function for every item in a thread pool and merge the results
+
+    Values are yielded in arrival order as soon as any worker produces them. The
+    workers hand values over through a bounded queue, so a slow consumer applies
+    back-pressure and memory stays bounded by ``buffer`` regardless of how much the
+    workers produce. The first error raised by a worker is re-raised to the consumer,
+    and closing the returned generator stops all workers.
+
+    Args:
+        func (Callable): Function returning an iterable of values for an item
+        items (Iterable): The items to run the function for
+        workers (int, optional): Maximum number of concurrent workers. Defaults to 8
+        buffer (int, optional): Maximum number of values waiting to be consumed. Defaults to 256
+
+    Yields:
+        The values produced by every worker
+    """
+    queue: Queue = Queue(maxsize=buffer)
+    stop = threading.Event()
+
+    def run(item):
+        try:
+            if stop.is_set():
+                return
+            for value in func(item):
+                if not _put(queue, stop, (_VALUE, value)):
+                    return
+        except Exception as exc:  # pylint: disable=broad-except
+            _put(queue, stop, (_ERROR, exc))
+        finally:
+            _put(queue, stop, (_DONE, None))
+
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        remaining = 0
+        for item in items:
+            pool.submit(run, item)
+            remaining += 1
+
+        while remaining:
+            kind, value = queue.get()
+            if kind == _DONE:
+                remaining -= 1
+            elif kind == _ERROR:
+                raise value
+            else:
+                yield value
+    finally:
+        stop.set()
+        # Unblock workers waiting on a full queue before joining them
+        while True:
+            try:
+                queue.get_nowait()
+            except Empty:
+                break
+        pool.shutdown(wait=True)
@@ -0,0 +1,81 @@
+"""
+This module contains custom Click group classes used by the notoil CLI
+
+"""
+################################################### Python Import ##################################
+
+import importlib
+from typing import Dict, List, Optional
+
+import click
+
+################################################### Project Import #################################
+
+from notoil.utils.timings import span
+
+################################################### Main Declaration ###############################
+
+
+class LazyGroup(click.Group):
+    """Click group that imports its subcommands only when they are needed.
+
+    Subcommands are registered as ``"name": "module.path:attribute"`` strings and the
+    module is imported the first time the command is invoked or its help is rendered.
+    This keeps heavy dependencies (e.g. the kubernetes client) out of the import path
+    of commands that never use them.
+
+    Args:
+        lazy_subcommands (dict, optional): Mapping of command name to import path
+    """
+
+    def __init__(self, *args, lazy_subcommands: Optional[Dict[str, str]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_subcommands = lazy_subcommands or {}
+
+    def list_commands(self, ctx: click.Context) -> List[str]:
+        return sorted([*super().list_commands(ctx), *self.lazy_subcommands])
+
+    def get_command(self, ctx: click.Context, cmd_name: str) -> Optional[click.Command]:
+        if cmd_name in self.lazy_subcommands:
+            return self._load_command(cmd_name)
+        return super().get_command(ctx, cmd_name)
+
+    def _load_command(self, cmd_name: str) -> click.Command:
+        """
+        Import and return the command registered under the given name
+
+        Args:
+            cmd_name (str): Name of the lazily registered command
+
+        Returns:
+            click.Command: The imported command object
+        """
+        module_name, attribute = self.lazy_subcommands[cmd_name].split(":")
+        with span("import", module_name):
+            command = getattr(importlib.import_module(module_name), attribute)
+
+        if not isinstance(command, click.Command):
+            raise ValueError(f"Lazy loading of {module_name}:{attribute} did not return a click command")
+
+        return command
+
+
+class DefaultGroup(click.Group):
+    """Click group that falls back to a default subcommand.
+
+    Arguments that do not name a subcommand are forwarded to the default command, which
+    lets a plain command grow subcommands without breaking its existing invocation, e.g.
+    ``notoil ip-network <ip> <net>`` keeps working next to ``notoil ip-network match``.
+
+    Args:
+        default_command (str, optional): Name of the subcommand to fall back to
+    """
+
+    def __init__(self, *args, default_command: Optional[str] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.default_command = default_command
+
+    def resolve_command(self, ctx: click.Context, args: List[str]):
+        if self.default_command and args and self.get_command(ctx, args[0]) is None:
+            args = [self.default_command, *args]
+        return super().resolve_command(ctx, args)
@@ -0,0 +1,43 @@
+"""
+This module contains helpers for deferring expensive imports
+
+"""
+################################################### Python Import ##################################
+
+import importlib
+import sys
+from types import ModuleType
+
+################################################### Project Import #################################
+
+from notoil.utils.timings import enabled, span
+
+################################################### Main Declaration ###############################
+
+
+class LazyModule:
+    """Proxy that imports a module on first attribute access.
+
+    Lets command modules refer to e.g. ``client.CoreV1Api`` at module level while only
+    paying for the import when a command actually runs, so resolving the command for
+    help or shell completion stays fast. Modules using it for annotations need
+    ``from __future__ import annotations``.
+
+    Args:
+        name (str): Fully qualified name of the module
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def _load(self) -> ModuleType:
+        if enabled() and self._name not in sys.modules:
+            with span("import", self._name):
+                return importlib.import_module(self._name)
+        return importlib.import_module(self._name)
+
+    def __getattr__(self, attribute: str):
+        return getattr(self._load(), attribute)
+
+    def __repr__(self) -> str:
+        return f"<lazy module {self._name!r}>"
@@ -0,0 +1,260 @@
+"""
+This module contains the per-phase timing instrumentation of the commands
+
+Spans are only recorded once `enable` was called by `--trace-timings` or `--profile`,
+otherwise `span` and `record` return at once. Every span has a phase (config, import,
+api, decode, pod, exec, ...), a name grouping similar spans in the summary, e.g.
+"list pods", and an optional detail, e.g. the pod or URL, kept in the JSON report.
+"""
+################################################### Python Import ##################################
+
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+
+################################################### Project Import #################################
+################################################### Main Declaration ###############################
+
+# Order of the phases in the report, others follow alphabetically
+PHASES = ("import", "config", "throttle", "api", "decode", "pod", "exec")
+
+
+class Span(NamedTuple):
+    """A timed step of a command"""
+
+    phase: str
+    name: str
+    start: float
+    seconds: float
+    detail: Optional[str] = None
+    sent: Optional[int] = None
+    received: Optional[int] = None
+    status: Optional[int] = None
+    thread: Optional[str] = None
+
+
+_spans: Optional[List[Span]] = None
+
+_started = time.perf_counter()
+
+_lock = threading.Lock()
+
+_profilers: List[Any] = []
+
+
+def enable():
+    """
+    Start recording spans, the report covers the time from this call
+    """
+    global _spans, _started  # pylint: disable=global-statement
+    _spans, _started = [], time.perf_counter()
+
+
+def enabled() -> bool:
+    """
+    Whether spans are recorded
+    """
+    return _spans is not None
+
+
+def record(phase: str, name: str, start: float, detail: Optional[str] = None, sent: Optional[int] = None,
+           received: Optional[int] = None, status: Optional[int] = None):
+    """
+    Record a span ending now
+
+    Args:
+        phase (str): The phase of the span
+        name (str): The name grouping similar spans
+        start (float): The `time.perf_counter()` at the beginning of the span
+        detail (str, optional): What the span is about, e.g. the URL or the pod
+        sent (int, optional): Bytes sent
+        received (int, optional): Bytes received
+        status (int, optional): The HTTP status
+    """
+    if _spans is None:
+        return
+    entry = Span(phase, name, start - _started, time.perf_counter() - start, detail, sent, received, status,
+                 threading.current_thread().name)
+    with _lock:
+        _spans.append(entry)
+
+
+@contextmanager
+def span(phase: str, name: str, detail: Optional[str] = None) -> Iterator[None]:
+    """
+    Record the duration of a block as a span, also when it raises
+
+    Args:
+        phase (str): The phase of the span
+        name (str): The name grouping similar spans
+        detail (str, optional): What the span is about
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(phase, name, start, detail)
+
+
+def spans() -> List[Span]:
+    """
+    Return the spans recorded so far
+    """
+    with _lock:
+        return list(_spans or ())
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """
+    Return the nearest-rank percentile of sorted values
+    """
+    return values[min(len(values) - 1, max(0, round(fraction * len(values)) - 1))]
+
+
+def summarize(recorded: List[Span]) -> List[Dict[str, Any]]:
+    """
+    Aggregate the spans by phase and name
+
+    Args:
+        recorded (list): The spans
+
+    Returns:
+        list: Count, total, p50, p95 and max durations and bytes of every group, phases in
+            the order they usually happen and the slowest groups first
+    """
+    groups: Dict[tuple, List[Span]] = {}
+    for entry in recorded:
+        groups.setdefault((entry.phase, entry.name), []).append(entry)
+
+    summary = []
+    for (phase, name), entries in groups.items():
+        durations = sorted(entry.seconds for entry in entries)
+        summary.append({
+            "phase": phase,
+            "name": name,
+            "count": len(entries),
+            "total": sum(durations),
+            "p50": percentile(durations, 0.5),
+            "p95": percentile(durations, 0.95),
+            "max": durations[-1],
+            "sent": sum(entry.sent or 0 for entry in entries),
+            "received": sum(entry.received or 0 for entry in entries),
+            "errors": sum(1 for entry in entries if entry.status and entry.status >= 400),
+        })
+
+    def order(group: Dict[str, Any]) -> tuple:
+        phase = group["phase"]
+        return (PHASES.index(phase) if phase in PHASES else len(PHASES), phase, -group["total"])
+
+    return sorted(summary, key=order)
+
+
+def format_size(value: int) -> str:
+    """
+    Format a number of bytes with a binary unit
+    """
+    if not value:
+        return "-"
+    for unit in ("B", "KiB", "MiB"):
+        if value < 1024:
+            return f"{value:.0f}{unit}" if unit == "B" else f"{value:.1f}{unit}"
+        value /= 1024
+    return f"{value:.1f}GiB"
+
+
+def format_table(recorded: List[Span], wall: float) -> List[str]:
+    """
+    Lay out the summary of the spans as a table
+
+    Span durations overlap when the command works concurrently, so totals of a phase
+    can exceed the wall time.
+
+    Args:
+        recorded (list): The spans
+        wall (float): Seconds since recording started
+
+    Returns:
+        list: The lines of the table
+    """
+    lines = [f"{'phase':<9} {'name':<32} {'count':>6} {'total':>9} {'p50':>9} {'p95':>9} {'max':>9} "
+             f"{'sent':>9} {'received':>9} {'errors':>6}"]
+    for group in summarize(recorded):
+        lines.append(
+            f"{group['phase']:<9} {group['name'][:32]:<32} {group['count']:>6} {group['total']:>8.3f}s "
+            f"{group['p50'] * 1000:>7.1f}ms {group['p95'] * 1000:>7.1f}ms {group['max'] * 1000:>7.1f}ms "
+            f"{format_size(group['sent']):>9} {format_size(group['received']):>9} {group['errors'] or '-':>6}"
+        )
+    lines.append(f"wall time {wall:.3f}s, {len(recorded)} spans")
+    return lines
+
+
+def report(output_format: str = "table") -> str:
+    """
+    Render the spans recorded so far
+
+    Args:
+        output_format (str, optional): "table" or "json", the latter also lists every span. Defaults to "table"
+
+    Returns:
+        str: The report
+    """
+    wall = time.perf_counter() - _started
+    recorded = spans()
+    if output_format == "json":
+        return json.dumps({
+            "wall_seconds": wall,
+            "summary": summarize(recorded),
+            "spans": [entry._asdict() for entry in sorted(recorded, key=lambda entry: entry.start)],
+        }, indent=2)
+    return "\n".join(format_table(recorded, wall))
+
+
+def start_profile():
+    """
+    Profile the command with cProfile, in the current thread and every thread started later
+
+    From Python 3.12 cProfile is backed by `sys.monitoring`, a single profiler then sees
+    every thread and no other one may be enabled. Before, a profiler only sees the
+    thread that enabled it, so every new thread gets its own.
+    """
+    # Imported here as only `--profile` needs it
+    import cProfile  # pylint: disable=import-outside-toplevel
+
+    def profile_thread(*_):
+        # Called on the first event of a new thread, the profiler then takes over
+        profiler = cProfile.Profile()
+        with _lock:
+            _profilers.append(profiler)
+        profiler.enable()
+
+    if sys.version_info < (3, 12):
+        threading.setprofile(profile_thread)
+    profiler = cProfile.Profile()
+    _profilers.append(profiler)
+    profiler.enable()
+
+
+def dump_profile(path: str):
+    """
+    Stop profiling and write the statistics of every thread, merged, in the pstats format
+
+    Args:
+        path (str): The file to write, e.g. for `python -m pstats` or snakeviz
+    """
+    # Imported here as only `--profile` needs it
+    import pstats  # pylint: disable=import-outside-toplevel
+
+    if sys.version_info < (3, 12):
+        threading.setprofile(None)
+    with _lock:
+        profilers = list(_profilers)
+        _profilers.clear()
+    profilers[0].disable()
+
+    stats = pstats.Stats(profilers[0])
+    for profiler in profilers[1:]:
+        stats.add(profiler)
+    stats.dump_stats(path)
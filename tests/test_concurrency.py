@@ -0,0 +1,38 @@
+################################################### Python Import ##################################
+
+import pytest
+
+################################################### Project Import #################################
+
+from notoil.utils.concurrency import interleave
+
+################################################### Main Declaration ###############################
+
+def test_interleave_merges_all_values():
+    values = interleave(lambda item: [(item, index) for index in range(3)], range(5), workers=2, buffer=1)
+    assert sorted(values) == [(item, index) for item in range(5) for index in range(3)]
+
+
+def test_interleave_reraises_worker_errors():
+    def produce(item):
+        yield item
+        if item == 3:
+            raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        list(interleave(produce, range(5)))
+
+
+def test_interleave_stops_workers_when_closed():
+    produced = []
+
+    def produce(item):
+        for index in range(1000):
+            produced.append(index)
+            yield item
+
+    values = interleave(produce, range(4), workers=2, buffer=1)
+    next(values)
+    values.close()
+
+    assert len(produced) < 100
@@ -0,0 +1,941 @@
+################################################### Python Import ##################################
+
+import io
+import json
+import os
+import struct
+import subprocess
+import threading
+import time
+from queue import Queue
+from itertools import islice
+from types import SimpleNamespace
+
+import click
+import pytest
+
+################################################### Project Import #################################
+
+from notoil.commands.k8s import cache
+from notoil.commands.k8s import capture, contexts, execute, logs, netmatrix, pod as pod_commands, pool, throttle
+from notoil.commands.k8s.api import (Node, Pod, PodNotReady, iter_pods, iter_pods_all_namespaces, pod_readiness,
+                                     wait_for_deletion, wait_for_pod, wait_for_pods, watch_pods)
+from notoil.utils import timings
+
+from tests.setup import runner
+
+################################################### Main Declaration ###############################
+
+class FakeResponse:
+    """
+    Stand-in for the urllib3 response returned with `_preload_content=False`
+    """
+
+    def __init__(self, body=None, events=()):
+        self.data = json.dumps(body).encode()
+        self.events = events
+
+    def stream(self, amt=None, decode_content=None):
+        for event in self.events:
+            yield json.dumps(event).encode() + b"\n"
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+def fake_pod(name: str, namespace: str) -> dict:
+    return {
+        "metadata": {"name": name, "namespace": namespace, "uid": f"uid-{name}", "resourceVersion": "42", "labels": {"app": "web"}},
+        "spec": {"nodeName": "node-1", "containers": [{"name": "app", "image": "nginx"}]},
+        "status": {
+            "phase": "Running",
+            "startTime": "2025-01-01T00:00:00Z",
+            "containerStatuses": [{"name": "app", "containerID": "containerd://abc", "ready": True, "restartCount": 1}],
+        },
+    }
+
+
+class FakeCoreV1Api:
+    """
+    Minimal stand-in for client.CoreV1Api serving paginated raw pod lists
+    """
+
+    def __init__(self, namespaces: int = 3, pods: int = 7):
+        self.namespaces = namespaces
+        self.pods = pods
+        self.calls = []
+        self.watches = []
+        self.resource_version = "100"
+
+    def list_namespace(self, limit=None, _continue=None, _preload_content=True):
+        items = [{"metadata": {"name": f"ns-{index}"}} for index in range(self.namespaces)]
+        return FakeResponse({"items": items, "metadata": {}})
+
+    def list_namespaced_pod(self, namespace, label_selector=None, field_selector=None, limit=None, _continue=None,
+                            _preload_content=True, watch=False, resource_version=None, **kwargs):
+        if watch:
+            self.calls.append(("watch", namespace, resource_version))
+            return FakeResponse(events=self.watches.pop(0) if self.watches else ())
+
+        self.calls.append((namespace, label_selector, limit, _continue))
+        start = int(_continue or 0)
+        end = min(start + limit, self.pods)
+        items = [fake_pod(f"{namespace}-pod-{index}", namespace) for index in range(start, end)]
+        metadata = {"resourceVersion": self.resource_version, **({"continue": str(end)} if end < self.pods else {})}
+        return FakeResponse({"items": items, "metadata": metadata})
+
+
+def test_iter_pods_follows_continue_tokens():
+    api = FakeCoreV1Api()
+
+    names = [pod.name for pod in iter_pods(api, "ns-0", label_selector="app=web", page_size=3)]
+
+    assert names == [f"ns-0-pod-{index}" for index in range(7)]
+    assert api.calls == [("ns-0", "app=web", 3, None), ("ns-0", "app=web", 3, "3"), ("ns-0", "app=web", 3, "6")]
+
+
+def test_iter_pods_all_namespaces():
+    api = FakeCoreV1Api()
+
+    names = {pod.name for pod in iter_pods_all_namespaces(api, workers=2)}
+
+    assert len(names) == 21
+
+
+def test_pod_from_json_decodes_used_fields():
+    pod = Pod.from_json(fake_pod("web-1", "default"))
+
+    assert (pod.name, pod.namespace, pod.node_name, pod.phase) == ("web-1", "default", "node-1", "Running")
+    assert pod.container_statuses[0].container_id == "containerd://abc"
+    assert pod.container_statuses[0].ready
+
+
+@pytest.fixture(name="cache_home")
+def fixture_cache_home(tmp_path, monkeypatch):
+    kubeconfig = tmp_path / "kubeconfig"
+    kubeconfig.write_text("apiVersion: v1\ncurrent-context: 'arn:aws:eks:eu-west-1:1:cluster/prod'\n")
+    monkeypatch.setenv("KUBECONFIG", str(kubeconfig))
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    return tmp_path
+
+
+def test_current_context(cache_home):
+    assert cache.current_context() == "arn:aws:eks:eu-west-1:1:cluster/prod"
+
+
+def test_cached_pods_serves_fresh_entries_without_api_calls(cache_home):
+    api = FakeCoreV1Api(pods=3)
+
+    first = list(cache.cached_pods(api, "default"))
+    calls = len(api.calls)
+    second = list(cache.cached_pods(api, "default"))
+
+    assert first == second
+    assert len(api.calls) == calls
+
+
+def test_cached_pods_revalidates_with_watch(cache_home):
+    api = FakeCoreV1Api(pods=3)
+    list(cache.cached_pods(api, "default"))
+
+    api.watches = [[
+        {"type": "DELETED", "object": fake_pod("default-pod-0", "default")},
+        {"type": "ADDED", "object": fake_pod("default-pod-9", "default")},
+        {"type": "BOOKMARK", "object": {"metadata": {"resourceVersion": "102"}}},
+    ]]
+    api.resource_version = "102"
+    names = [pod.name for pod in cache.cached_pods(api, "default", ttl=0)]
+
+    assert api.calls[-1] == ("watch", "default", "100")
+    assert names == ["default-pod-1", "default-pod-2", "default-pod-9"]
+
+
+def test_cached_pods_relists_when_watch_does_not_catch_up(cache_home):
+    api = FakeCoreV1Api(pods=3)
+    list(cache.cached_pods(api, "default"))
+
+    api.watches = [[{"type": "DELETED", "object": fake_pod("default-pod-0", "default")}]]
+    api.resource_version = "102"
+    names = [pod.name for pod in cache.cached_pods(api, "default", ttl=0)]
+
+    assert api.calls[-2:] == [("watch", "default", "100"), ("default", None, 500, None)]
+    assert names == ["default-pod-0", "default-pod-1", "default-pod-2"]
+    assert cache.load_entry(cache.entry_path(cache.current_context(), "pods", "default"))["resource_version"] == "102"
+
+
+def test_cached_pods_relists_when_resource_version_expired(cache_home):
+    api = FakeCoreV1Api(pods=3)
+    list(cache.cached_pods(api, "default"))
+
+    api.watches = [[{"type": "ERROR", "object": {"code": 410, "message": "too old resource version"}}]]
+    api.resource_version = "102"
+    names = [pod.name for pod in cache.cached_pods(api, "default", ttl=0)]
+
+    assert api.calls[-1] == ("default", None, 500, None)
+    assert names == ["default-pod-0", "default-pod-1", "default-pod-2"]
+
+
+def test_cached_pods_skips_watch_when_unchanged(cache_home):
+    api = FakeCoreV1Api(pods=3)
+    list(cache.cached_pods(api, "default"))
+
+    names = [pod.name for pod in cache.cached_pods(api, "default", ttl=0)]
+
+    assert not [call for call in api.calls if call[0] == "watch"]
+    assert api.calls[-1] == ("default", None, 1, None)
+    assert names == ["default-pod-0", "default-pod-1", "default-pod-2"]
+
+
+def test_cached_pods_stops_watch_once_caught_up(cache_home):
+    api = FakeCoreV1Api(pods=3)
+    list(cache.cached_pods(api, "default"))
+
+    added = fake_pod("default-pod-9", "default")
+    added["metadata"]["resourceVersion"] = "102"
+    later = fake_pod("default-pod-10", "default")
+    later["metadata"]["resourceVersion"] = "103"
+    api.watches = [[{"type": "ADDED", "object": added}, {"type": "ADDED", "object": later}]]
+    api.resource_version = "102"
+    names = [pod.name for pod in cache.cached_pods(api, "default", ttl=0)]
+
+    assert names == ["default-pod-0", "default-pod-1", "default-pod-2", "default-pod-9"]
+
+
+def test_cached_pods_discards_partial_cold_listing(cache_home):
+    api = FakeCoreV1Api(pods=3)
+    pods = cache.cached_pods(api, "default")
+    next(pods)
+    pods.close()
+
+    directory = cache.cache_dir(cache.current_context())
+    assert os.listdir(directory) == []
+
+
+def test_complete_pods_reads_cache(cache_home):
+    list(cache.cached_pods(FakeCoreV1Api(pods=3), "default"))
+
+    context = SimpleNamespace(params={"namespace": "default"})
+    assert [item.value for item in cache.complete_pods(context, None, "default-pod-")] == [
+        "default-pod-0", "default-pod-1", "default-pod-2",
+    ]
+
+
+def test_watch_pods_resumes_and_resyncs_after_expiry():
+    api = FakeCoreV1Api(pods=3)
+    deleted = fake_pod("default-pod-0", "default")
+    deleted["metadata"]["resourceVersion"] = "101"
+    api.watches = [
+        [{"type": "DELETED", "object": deleted}],
+        [{"type": "BOOKMARK", "object": {"metadata": {"resourceVersion": "105"}}}],
+        [{"type": "ERROR", "object": {"code": 410, "message": "too old resource version"}}],
+    ]
+
+    events = [(event, pod.name) for event, pod in islice(watch_pods(api, "default"), 5)]
+
+    assert events == [
+        ("LISTED", "default-pod-0"), ("LISTED", "default-pod-1"), ("LISTED", "default-pod-2"),
+        ("DELETED", "default-pod-0"),
+        ("ADDED", "default-pod-0"),
+    ]
+    watches = [call for call in api.calls if call[0] == "watch"]
+    assert watches == [("watch", "default", "100"), ("watch", "default", "101"), ("watch", "default", "105")]
+
+
+def test_node_shell_name_is_stable_and_short():
+    name = pool.node_shell_name("ip-10-0-0-1." + "x" * 300)
+
+    assert name == pool.node_shell_name("ip-10-0-0-1." + "x" * 300)
+    assert name != pool.node_shell_name("ip-10-0-0-2")
+    assert len(name) == len("node-shell-") + 12
+
+
+def test_iter_expired_node_shells(monkeypatch):
+    monkeypatch.setattr(pool.time, "time", lambda: 10_000)
+
+    def shell(name, last_used, ttl="900", phase="Running"):
+        pod = fake_pod(name, pool.NAMESPACE)
+        pod["metadata"]["annotations"] = {pool.LAST_USED_ANNOTATION: str(last_used), pool.IDLE_TTL_ANNOTATION: ttl}
+        pod["status"]["phase"] = phase
+        return pod
+
+    shells = [shell("fresh", 9_500), shell("idle", 9_000), shell("short-ttl", 9_500, ttl="60"),
+              shell("finished", 9_990, phase="Succeeded")]
+    api = SimpleNamespace(list_namespaced_pod=lambda namespace, **kwargs: FakeResponse({"items": shells, "metadata": {}}))
+
+    assert [name for name, _, _ in pool.iter_expired_node_shells(api)] == ["idle", "short-ttl", "finished"]
+    assert len(list(pool.iter_expired_node_shells(api, include_all=True))) == 4
+
+
+def node_shell(expires_in: int) -> dict:
+    pod = fake_pod(pool.node_shell_name("node-1"), pool.NAMESPACE)
+    pod["metadata"]["annotations"] = {pool.EXPIRES_ANNOTATION: str(int(pool.time.time()) + expires_in)}
+    return pod
+
+
+class ShellApi:
+    """
+    Fake API serving a sequence of reads of a node-shell, None meaning 404
+    """
+
+    def __init__(self, reads):
+        self.reads = reads
+        self.calls = []
+
+    def read_namespaced_pod(self, name, namespace, _preload_content):
+        from kubernetes.client import ApiException
+
+        self.calls.append("read")
+        pod = self.reads.pop(0)
+        if pod is None:
+            raise ApiException(status=404)
+        return FakeResponse(pod)
+
+    def delete_namespaced_pod(self, **kwargs):
+        self.calls.append("delete")
+        return FakeResponse({})
+
+    def patch_namespaced_pod(self, **kwargs):
+        self.calls.append("touch")
+        return FakeResponse({})
+
+
+def test_acquire_node_shell_waits_for_a_finished_shell_to_be_gone(monkeypatch):
+    finished = fake_pod(pool.node_shell_name("node-1"), pool.NAMESPACE)
+    finished["status"]["phase"] = "Succeeded"
+    api = ShellApi([finished])
+    monkeypatch.setattr(pool, "wait_for_deletion", lambda *args: api.calls.append("wait"))
+    monkeypatch.setattr(pool, "ssh_into_node", lambda *args, **kwargs: api.calls.append("create"))
+
+    assert pool.acquire_node_shell(api, "node-1") == (pool.node_shell_name("node-1"), True)
+    assert api.calls == ["read", "delete", "wait", "create"]
+
+
+def test_acquire_node_shell_reuses_a_shell_created_concurrently(monkeypatch):
+    from kubernetes.client import ApiException
+
+    def create(*args, **kwargs):
+        api.calls.append("create")
+        raise ApiException(status=409)
+
+    api = ShellApi([None, node_shell(pool.SHELL_LIFETIME)])
+    monkeypatch.setattr(pool, "ssh_into_node", create)
+
+    assert pool.acquire_node_shell(api, "node-1") == (pool.node_shell_name("node-1"), False)
+    assert api.calls == ["read", "create", "read", "touch"]
+
+
+def test_acquire_node_shell_replaces_a_shell_close_to_the_end_of_its_sleep(monkeypatch):
+    api = ShellApi([node_shell(pool.MIN_REMAINING - 60)])
+    monkeypatch.setattr(pool, "wait_for_deletion", lambda *args: api.calls.append("wait"))
+    monkeypatch.setattr(pool, "ssh_into_node", lambda *args, **kwargs: api.calls.append("create"))
+
+    assert pool.acquire_node_shell(api, "node-1") == (pool.node_shell_name("node-1"), True)
+    assert api.calls == ["read", "delete", "wait", "create"]
+
+
+def test_node_shell_in_use_refreshes_last_used():
+    api = ShellApi([])
+    refreshed = threading.Event()
+    api.patch_namespaced_pod = lambda **kwargs: refreshed.set() or FakeResponse({})
+
+    with pool.node_shell_in_use(api, pool.node_shell_name("node-1"), interval=0.01):
+        assert refreshed.wait(5)
+
+
+def pending_pod(name: str, waiting: str = "ContainerCreating", resource_version: str = "10") -> dict:
+    pod = fake_pod(name, "default")
+    pod["metadata"]["resourceVersion"] = resource_version
+    pod["status"]["phase"] = "Pending"
+    pod["status"]["containerStatuses"][0].update(ready=False, state={"waiting": {"reason": waiting, "message": "pulling"}})
+    return pod
+
+
+def test_pod_readiness():
+    unschedulable = pending_pod("a")
+    unschedulable["status"]["conditions"] = [{"type": "PodScheduled", "status": "False", "reason": "Unschedulable",
+                                              "message": "0/3 nodes are available"}]
+
+    assert pod_readiness(fake_pod("a", "default")) == (True, None, "Ready")
+    assert pod_readiness(pending_pod("a")) == (False, None, "Pending, 0/1 containers ready (ContainerCreating)")
+    assert pod_readiness(pending_pod("a", "ImagePullBackOff"))[1] == "container app ImagePullBackOff: pulling"
+    assert pod_readiness(unschedulable)[1] == "Unschedulable: 0/3 nodes are available"
+
+
+def test_wait_for_pod_follows_one_watch_until_ready():
+    api = FakeCoreV1Api()
+    api.read_namespaced_pod = lambda name, namespace, _preload_content: FakeResponse(pending_pod(name))
+    ready = fake_pod("web", "default")
+    api.watches.append([
+        {"type": "BOOKMARK", "object": {"metadata": {"resourceVersion": "11"}}},
+        {"type": "MODIFIED", "object": pending_pod("web", "PodInitializing", "12")},
+        {"type": "MODIFIED", "object": ready},
+    ])
+    progress = []
+
+    pod = wait_for_pod(api, "web", "default", timeout=5, on_progress=progress.append)
+
+    assert pod.name == "web" and pod.phase == "Running"
+    assert progress == ["Pending, 0/1 containers ready (ContainerCreating)",
+                        "Pending, 0/1 containers ready (PodInitializing)", "Ready"]
+    assert api.calls == [("watch", "default", "10")]
+
+
+def test_wait_for_pod_fails_fast_on_image_pull_backoff():
+    api = FakeCoreV1Api()
+    api.read_namespaced_pod = lambda name, namespace, _preload_content: FakeResponse(pending_pod(name))
+    api.watches.append([{"type": "MODIFIED", "object": pending_pod("web", "ImagePullBackOff", "11")}])
+
+    with pytest.raises(PodNotReady, match="ImagePullBackOff"):
+        wait_for_pod(api, "web", "default", timeout=5)
+
+
+def test_wait_for_pods_settles_every_pod_with_one_watch():
+    api = FakeCoreV1Api(namespaces=1, pods=1)
+    late = pending_pod("late", resource_version="101")
+    api.watches = [[
+        {"type": "ADDED", "object": late},
+        {"type": "DELETED", "object": pending_pod("gone", resource_version="102")},
+        {"type": "MODIFIED", "object": pending_pod("late", "ImagePullBackOff", "103")},
+    ]]
+
+    results = [(name, failure) for name, _, failure in wait_for_pods(api, ["ns-0-pod-0", "late", "gone"], "ns-0", "app=web")]
+
+    assert results == [("ns-0-pod-0", None), ("gone", "deleted while waiting"), ("late", "container app ImagePullBackOff: pulling")]
+    assert [call for call in api.calls if call[0] == "watch"] == [("watch", "ns-0", "100")]
+
+
+def test_node_from_json():
+    node = Node.from_json({
+        "metadata": {"name": "node-1", "labels": {"topology.kubernetes.io/zone": "a"}},
+        "spec": {"unschedulable": True},
+        "status": {"conditions": [{"type": "MemoryPressure", "status": "False"}, {"type": "Ready", "status": "True"}]},
+    })
+
+    assert node == Node("node-1", {"topology.kubernetes.io/zone": "a"}, True, True)
+
+
+def test_wait_for_deletion_follows_deleted_events():
+    api = FakeCoreV1Api(pods=5)
+    pods = list(iter_pods(api, "ns-0", page_size=10))[:3]
+    recreated = dict(fake_pod("ns-0-pod-1", "ns-0"), metadata={**fake_pod("ns-0-pod-1", "ns-0")["metadata"], "uid": "new"})
+    api.watches = [
+        [{"type": "DELETED", "object": fake_pod("ns-0-pod-0", "ns-0")}, {"type": "DELETED", "object": recreated}],
+        [{"type": "DELETED", "object": fake_pod("ns-0-pod-1", "ns-0")}, {"type": "DELETED", "object": fake_pod("ns-0-pod-2", "ns-0")}],
+    ]
+    progress = []
+
+    wait_for_deletion(api, pods, "ns-0", "app=web", timeout=5, on_progress=progress.append)
+
+    assert progress == [3, 2, 1, 0]
+    assert [call for call in api.calls if call[0] == "watch"] == [("watch", "ns-0", "100"), ("watch", "ns-0", "42")]
+
+
+class FakeSession:
+    """
+    Stand-in for the WSClient of an exec session replaying received frames
+    """
+
+    def __init__(self, frames):
+        self.frames = list(frames)
+        self.channels = {}
+        self.closed = False
+        self.sock = SimpleNamespace(sock=None)
+
+    def is_open(self):
+        return bool(self.frames)
+
+    def update(self, timeout=None):
+        if self.frames:
+            channel, data = self.frames.pop(0)
+            self.channels[channel] = self.channels.get(channel, b"") + data
+
+    def read_channel(self, channel, timeout=0):
+        return self.channels.pop(channel, "")
+
+    def close(self):
+        self.closed = True
+
+
+def exit_status(code: int) -> bytes:
+    if code == 0:
+        return json.dumps({"status": "Success"}).encode()
+    return json.dumps({"status": "Failure", "details": {"causes": [{"reason": "ExitCode", "message": str(code)}]}}).encode()
+
+
+def test_exec_command_streams_output_and_returns_exit_code(monkeypatch):
+    session = FakeSession([(1, b"hello "), (2, b"oops"), (1, b"world"), (3, exit_status(3))])
+    monkeypatch.setattr(execute, "open_exec", lambda *args, **kwargs: session)
+    stdout, stderr = io.BytesIO(), io.BytesIO()
+
+    code = execute.exec_command(None, "web", "default", ["sh"], stdout=stdout, stderr=stderr)
+
+    assert (code, stdout.getvalue(), stderr.getvalue()) == (3, b"hello world", b"oops")
+    assert session.closed
+
+
+class BufferedWebSocket:
+    """
+    A websocket whose frames were all read from the socket by the SSL layer, which polls as idle
+    """
+
+    connected = True
+
+    def __init__(self, frames):
+        self.frames = list(frames)
+        self.sock = self
+        self.closed = False
+        self.pipe = os.pipe()
+
+    def fileno(self):
+        return self.pipe[0]
+
+    def pending(self):
+        return len(self.frames)
+
+    def recv_data_frame(self, control_frame):
+        return self.frames.pop(0)
+
+    def close(self):
+        self.closed = True
+        for fd in self.pipe:
+            os.close(fd)
+
+
+def test_exec_command_reads_frames_buffered_by_ssl(monkeypatch):
+    from kubernetes.stream.ws_client import WSClient
+    from websocket import ABNF
+
+    session = WSClient.__new__(WSClient)
+    session._connected, session._channels = True, {}
+    session.sock = BufferedWebSocket([
+        (ABNF.OPCODE_BINARY, SimpleNamespace(data=b"\x01hello ")),
+        (ABNF.OPCODE_BINARY, SimpleNamespace(data=b"\x01world")),
+        (ABNF.OPCODE_BINARY, SimpleNamespace(data=b"\x03" + exit_status(0))),
+        (ABNF.OPCODE_CLOSE, None),
+    ])
+    monkeypatch.setattr(execute, "open_exec", lambda *args, **kwargs: session)
+    stdout, stderr = io.BytesIO(), io.BytesIO()
+
+    code = execute.exec_command(None, "web", "default", ["sh"], stdout=stdout, stderr=stderr)
+
+    assert (code, stdout.getvalue()) == (0, b"hello world")
+    assert session.sock.closed
+
+
+def test_exit_code():
+    session = FakeSession([])
+    session.channels[3] = exit_status(0)
+    assert execute.exit_code(session) == 0
+
+    session.channels[3] = json.dumps({"status": "Failure", "message": "container not found"}).encode()
+    with pytest.raises(execute.client.ApiException, match="container not found"):
+        execute.exit_code(session)
+
+
+def test_parse_ping():
+    iputils = "5 packets transmitted, 5 received, 0% packet loss, time 809ms\nrtt min/avg/max/mdev = 0.041/0.058/0.075/0.012 ms\n"
+    busybox = "3 packets transmitted, 2 packets received, 33% packet loss\nround-trip min/avg/max = 1.1/1.5/2.0 ms\n"
+    unreachable = "2 packets transmitted, 0 received, 100% packet loss, time 1001ms\n"
+
+    assert netmatrix.parse_ping(iputils) == (0.058, 0.0)
+    assert netmatrix.parse_ping(busybox) == (1.5, 33.0)
+    assert netmatrix.parse_ping(unreachable) == (None, 100.0)
+    with pytest.raises(ValueError, match="unknown host"):
+        netmatrix.parse_ping("ping: unknown host\n")
+
+
+def test_parse_iperf():
+    assert netmatrix.parse_iperf(json.dumps({"end": {"sum_received": {"bits_per_second": 9.4e9}}})) == 9400
+    with pytest.raises(ValueError, match="unable to connect"):
+        netmatrix.parse_iperf(json.dumps({"error": "unable to connect to server"}))
+
+
+def test_probe_all_measures_latency_before_throughput(monkeypatch):
+    calls = []
+    monkeypatch.setattr(netmatrix, "measure_latency", lambda api, source, target, count: calls.append("ping") or (0.5, 0.0))
+    monkeypatch.setattr(netmatrix, "measure_throughput", lambda api, source, target, duration: calls.append("iperf") or 900)
+    pods = {node: Pod.from_json(fake_pod(node, "default")) for node in ("a", "b", "c")}
+
+    probes = list(netmatrix.probe_all(None, pods, count=3, throughput=True, duration=1, concurrency=4))
+
+    assert calls == ["ping"] * 6 + ["iperf"] * 6
+    assert {(probe.latency_ms, probe.throughput_mbps) for probe in probes} == {(0.5, 900)}
+
+
+def test_probe_all_keeps_latency_when_throughput_fails(monkeypatch):
+    def measure_throughput(api, source, target, duration):
+        raise ValueError("iperf3: not found")
+
+    monkeypatch.setattr(netmatrix, "measure_latency", lambda api, source, target, count: (0.5, 0.0))
+    monkeypatch.setattr(netmatrix, "measure_throughput", measure_throughput)
+    pods = {node: Pod.from_json(fake_pod(node, "default")) for node in ("a", "b")}
+
+    probes = list(netmatrix.probe_all(None, pods, count=3, throughput=True, duration=1, concurrency=2))
+
+    assert {(probe.latency_ms, probe.error, probe.throughput_error) for probe in probes} == {(0.5, None, "iperf3: not found")}
+
+
+def test_measure_throughput_reports_server_failure(monkeypatch):
+    failed = threading.Event()
+
+    def run(api, pod, command):
+        if pod.name == "b":
+            failed.set()
+            raise ValueError("iperf3: not found")
+        failed.wait(5)
+        return ""
+
+    monkeypatch.setattr(netmatrix, "run", run)
+    pods = [Pod.from_json(fake_pod(node, "default")) for node in ("a", "b")]
+
+    with pytest.raises(ValueError, match="iperf3 server: iperf3: not found"):
+        netmatrix.measure_throughput(None, pods[0], pods[1], duration=1)
+
+
+def test_measure_throughput_stops_server_after_client_failure(monkeypatch):
+    stopped, commands = threading.Event(), []
+
+    def run(api, pod, command):
+        commands.append((pod.name, command[0]))
+        if command[0] == "timeout":
+            stopped.wait(30)
+        elif pod.name == "b":
+            stopped.set()
+        return json.dumps({"error": "unable to connect to server"})
+
+    monkeypatch.setattr(netmatrix, "run", run)
+    pods = [Pod.from_json(fake_pod(node, "default")) for node in ("a", "b")]
+
+    start = time.monotonic()
+    with pytest.raises(ValueError, match="unable to connect"):
+        netmatrix.measure_throughput(None, pods[0], pods[1], duration=1)
+    assert time.monotonic() - start < netmatrix.STOP_TIMEOUT
+    assert ("b", "sh") in commands
+
+
+def test_format_table():
+    lines = netmatrix.format_table(["a", "bb"], {("a", "bb"): "0.25", ("bb", "a"): "ERR"})
+
+    assert lines == ["        #0    #1", "#0 a     -  0.25", "#1 bb  ERR     -"]
+
+
+def test_root_execute_many_groups_targets_by_node(monkeypatch):
+    calls = {}
+
+    def on_node(api, node_name, targets, command, shell, idle_ttl, timeout):
+        calls[node_name] = [(pod.name, cnt.name) for pod, cnt in targets]
+        for pod, cnt in targets:
+            yield pod_commands.RootExecResult(node_name, pod.namespace, pod.name, cnt.name, 0, "ok\n")
+
+    monkeypatch.setattr(pod_commands, "root_execute_on_node", on_node)
+    pods = [Pod.from_json(fake_pod(f"web-{index}", "default")) for index in range(4)]
+    pods[1] = pods[1]._replace(node_name="node-2")
+    pods[3] = pods[3]._replace(container_statuses=(pods[3].container_statuses[0]._replace(container_id=None),))
+
+    results = list(pod_commands.root_execute_many(None, pods, "first-container", "uptime", workers=2))
+
+    assert calls == {"node-1": [("web-0", "app"), ("web-2", "app")], "node-2": [("web-1", "app")]}
+    assert sorted((result.pod, result.error) for result in results) == [
+        ("web-0", None), ("web-1", None), ("web-2", None), ("web-3", "container is not running"),
+    ]
+
+
+def test_root_execute_on_node_reports_failures_per_target(monkeypatch):
+    from websocket import WebSocketConnectionClosedException
+
+    outcomes = [WebSocketConnectionClosedException("socket is already closed."), OSError("Connection reset by peer"),
+                ValueError("invalid literal for int() with base 10: 'x'"), 0]
+
+    def exec_command(api, name, namespace, command, stdout, stderr):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(pod_commands, "acquire_node_shell", lambda api, node_name, idle_ttl, timeout: ("shell", False))
+    monkeypatch.setattr(pod_commands, "wait_for_pod", lambda api, name, namespace, timeout: None)
+    monkeypatch.setattr(pod_commands, "exec_command", exec_command)
+    pod = Pod.from_json(fake_pod("web", "default"))
+
+    results = list(pod_commands.root_execute_on_node(None, "node-1", [(pod, pod.container_statuses[0])] * 4, "uptime"))
+
+    assert [(result.exit_code, result.error) for result in results] == [
+        (None, "socket is already closed."), (None, "Connection reset by peer"),
+        (None, "invalid literal for int() with base 10: 'x'"), (0, None),
+    ]
+
+
+def test_timestamp_key_orders_fractions_of_any_length():
+    assert logs.timestamp_key("2025-01-01T00:00:00.5Z") > logs.timestamp_key("2025-01-01T00:00:00.123456789Z")
+    assert logs.timestamp_key("2025-01-01T00:00:01Z") > logs.timestamp_key("2025-01-01T00:00:00.999Z")
+
+
+def test_follow_container_resumes_without_repeating_lines(monkeypatch):
+    class LogResponse(FakeResponse):
+        def __init__(self, lines):
+            super().__init__()
+            self.lines = lines
+
+        def stream(self, amt=None, decode_content=None):
+            yield "".join(f"{line}\n" for line in self.lines).encode()
+
+    streams = [
+        ["2025-01-01T00:00:00.1Z one", "2025-01-01T00:00:00.2Z two"],
+        ["2025-01-01T00:00:00.2Z two", "2025-01-01T00:00:00.30Z three"],
+    ]
+    requests = []
+
+    def read_namespaced_pod_log(**kwargs):
+        requests.append(kwargs)
+        return LogResponse(streams.pop(0))
+
+    running = iter([True, False])
+    monkeypatch.setattr(logs, "container_running", lambda *_: next(running))
+    monkeypatch.setattr(logs, "RECONNECT_DELAY", 0)
+    api = SimpleNamespace(read_namespaced_pod_log=read_namespaced_pod_log)
+    pod = Pod.from_json(fake_pod("web-1", "default"))
+    lines = Queue()
+
+    logs.follow_container(api, pod, pod.container_statuses[0], "[web-1/app]", lines, threading.Event(), tail_lines=10)
+
+    assert [lines.get_nowait()[1] for _ in range(lines.qsize())] == ["one", "two", "three"]
+    assert requests[0]["tail_lines"] == 10 and requests[0]["timestamps"]
+    assert "tail_lines" not in requests[1] and requests[1]["since_seconds"] > 0
+
+
+class LogApi(FakeCoreV1Api):
+    """
+    Fake API also serving the logs of its pods, one list of lines per request
+    """
+
+    def __init__(self, streams, **kwargs):
+        super().__init__(**kwargs)
+        self.streams = streams
+        self.log_requests = []
+
+    def read_namespaced_pod_log(self, **kwargs):
+        self.log_requests.append(kwargs)
+        lines = self.streams.pop(0) if self.streams else []
+
+        class LogResponse(FakeResponse):
+            def stream(self, amt=None, decode_content=None):
+                yield "".join(f"{line}\n" for line in lines).encode()
+
+        return LogResponse()
+
+
+def test_follow_container_keeps_lines_sharing_a_timestamp(monkeypatch):
+    api = LogApi([
+        ["2025-01-01T00:00:00Z one", "2025-01-01T00:00:01Z two", "2025-01-01T00:00:01Z two again"],
+        ["2025-01-01T00:00:01Z two", "2025-01-01T00:00:01Z two again", "2025-01-01T00:00:01Z three"],
+    ])
+    running = iter([True, False])
+    monkeypatch.setattr(logs, "container_running", lambda *_: next(running))
+    monkeypatch.setattr(logs, "RECONNECT_DELAY", 0)
+    pod = Pod.from_json(fake_pod("web-1", "default"))
+    lines = Queue()
+
+    logs.follow_container(api, pod, pod.container_statuses[0], "[web-1/app]", lines, threading.Event())
+
+    assert [lines.get_nowait()[1] for _ in range(lines.qsize())] == ["one", "two", "two again", "three"]
+
+
+def test_logs_command_keeps_timestamps(monkeypatch):
+    api = LogApi([["2025-01-01T00:00:00Z hello"]] * 2, namespaces=1, pods=2)
+    monkeypatch.setattr(logs, "load_config", lambda: None)
+    monkeypatch.setattr(logs, "throttled_api", lambda configuration: api)
+
+    result = runner.invoke(logs.logs, ["pod", "-n", "default", "--no-follow", "--timestamps", "--max-streams", "1"])
+
+    assert result.exit_code == 0, result.output
+    assert result.stdout.count("2025-01-01T00:00:00Z hello") == 2
+    assert all(request["timestamps"] for request in api.log_requests)
+
+
+def test_logs_command_reports_containers_beyond_max_streams(monkeypatch):
+    api = LogApi([], namespaces=1, pods=2)
+    pods = [Pod.from_json(fake_pod(f"web-{index}", "default")) for index in range(2)]
+    monkeypatch.setattr(logs, "load_config", lambda: None)
+    monkeypatch.setattr(logs, "throttled_api", lambda configuration: api)
+    monkeypatch.setattr(logs, "container_running", lambda *_: True)
+    monkeypatch.setattr(logs, "watch_pods", lambda *_, **__: iter([("LISTED", pod) for pod in pods]))
+
+    result = runner.invoke(logs.logs, ["web", "-n", "default", "--max-streams", "1"])
+
+    assert result.exit_code == 0, result.output
+    assert "Not following default/web-1/app: --max-streams 1 reached" in result.stderr
+
+
+def test_resolve_contexts(monkeypatch):
+    listed = ([{"name": "east"}, {"name": "west"}, {"name": "lab"}], {"name": "east"})
+    monkeypatch.setattr(contexts, "config", SimpleNamespace(list_kube_config_contexts=lambda: listed))
+
+    assert contexts.resolve_contexts(None, False) is None
+    assert contexts.resolve_contexts("west, east,west", False) == ["west", "east"]
+    assert contexts.resolve_contexts(None, True) == ["east", "west", "lab"]
+    with pytest.raises(click.UsageError, match="north"):
+        contexts.resolve_contexts("east,north", False)
+
+
+def test_across_contexts_isolates_failing_contexts(monkeypatch, capsys):
+    monkeypatch.setattr(contexts, "api_for_context", lambda context: f"api-{context}")
+
+    def query(context, api):
+        if context == "lab":
+            raise OSError("connection refused")
+        yield api
+
+    results = contexts.across_contexts(query, ["east", "lab", "west"], workers=3)
+    collected = []
+    with pytest.raises(click.ClickException, match="1 of 3 contexts: lab"):
+        for result in results:
+            collected.append(result)
+
+    assert sorted(collected) == [("east", "api-east"), ("west", "api-west")]
+    assert "lab: connection refused" in capsys.readouterr().err
+
+
+def test_token_bucket_spaces_requests_after_the_burst():
+    bucket = throttle.TokenBucket(qps=10, burst=2)
+
+    delays = [bucket.reserve() for _ in range(4)]
+
+    assert delays[:2] == [0.0, 0.0]
+    assert delays[2] == pytest.approx(0.1, abs=0.01)
+    assert delays[3] == pytest.approx(0.2, abs=0.01)
+
+
+def test_retry_after():
+    assert throttle.retry_after({"Retry-After": "3"}) == 3
+    assert throttle.retry_after({"Retry-After": "Thu, 01 Jan 1970 00:00:00 GMT"}) == 0
+    assert throttle.retry_after({}) is None
+    assert throttle.retry_after(None) is None
+
+
+def test_throttle_retries_throttled_requests(monkeypatch):
+    from kubernetes.client import ApiException
+
+    sleeps = []
+    monkeypatch.setattr(throttle.time, "sleep", sleeps.append)
+    throttle.configure(qps=0, max_retries=2)
+    attempts = []
+
+    def request(method, url, status):
+        attempts.append(method)
+        if len(attempts) < 3:
+            error = ApiException(status=status)
+            error.headers = {"Retry-After": "2"}
+            raise error
+        return "ok"
+
+    try:
+        assert throttle.throttle(request, "https://a")("GET", "/api/v1/pods", 429) == "ok"
+        assert sleeps == [2, 2]
+
+        attempts.clear()
+        with pytest.raises(ApiException):
+            throttle.throttle(request, "https://a")("POST", "/api/v1/pods", 503)
+        assert attempts == ["POST"]
+    finally:
+        throttle.configure()
+
+
+def test_request_name():
+    assert throttle.request_name("GET", "https://a/api/v1/namespaces/default/pods") == \
+        ("list pods", "/api/v1/namespaces/default/pods")
+    assert throttle.request_name("GET", "https://a/api/v1/pods", [("watch", True)])[0] == "watch pods"
+    assert throttle.request_name("GET", "https://a/api/v1/namespaces/ns/pods/app-1")[0] == "get pods"
+    assert throttle.request_name("GET", "https://a/api/v1/namespaces/ns/pods/app-1/log")[0] == "get pods/log"
+    assert throttle.request_name("GET", "https://a/api/v1/namespaces/ns/pods/app-1/exec")[0] == "connect pods/exec"
+    assert throttle.request_name("DELETE", "https://a/api/v1/namespaces/ns/pods")[0] == "deletecollection pods"
+    assert throttle.request_name("PATCH", "https://a/api/v1/namespaces/ns/pods/app-1")[0] == "patch pods"
+    assert throttle.request_name("GET", "https://a/api/v1/namespaces")[0] == "list namespaces"
+    assert throttle.request_name("POST", "https://a/apis/apps/v1/namespaces/ns/deployments")[0] == "create deployments"
+
+
+def test_throttle_records_api_spans(monkeypatch):
+    from kubernetes.client import ApiException
+
+    monkeypatch.setattr(timings, "_spans", None)
+    timings.enable()
+
+    def request(method, url, body=None):
+        if method == "DELETE":
+            raise ApiException(status=404)
+        return SimpleNamespace(urllib3_response=None, data=b"{}", status=201)
+
+    throttled = throttle.throttle(request, "https://a")
+    throttled("POST", "https://a/api/v1/namespaces/ns/pods", body={"metadata": {"name": "app-1"}})
+    with pytest.raises(ApiException):
+        throttled("DELETE", "https://a/api/v1/namespaces/ns/pods/app-1")
+
+    spans = [span for span in timings.spans() if span.phase == "api"]
+    assert [(span.name, span.sent, span.received, span.status) for span in spans] == [
+        ("create pods", 31, 2, 201), ("delete pods", 0, None, 404)]
+
+
+def pcap_stream(packets: int, size: int = 100) -> bytes:
+    header = struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1)
+    return header + b"".join(struct.pack("<IIII", index, 0, size, size) + bytes([index]) * size for index in range(packets))
+
+
+def test_pcap_writer_rotates_on_record_boundaries(tmp_path):
+    stream = pcap_stream(10)
+    writer = capture.PcapWriter(str(tmp_path / "dump.pcap"), rotate_size=24 + 3 * 116, files=2)
+
+    # Chunks cut through headers and packets
+    for start in range(0, len(stream), 50):
+        writer.write(stream[start:start + 50])
+    writer.close()
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["dump-00002.pcap", "dump-00003.pcap"]
+    assert (tmp_path / "dump-00002.pcap").read_bytes() == stream[:24] + stream[24 + 6 * 116:24 + 9 * 116]
+    assert (tmp_path / "dump-00003.pcap").read_bytes() == stream[:24] + stream[24 + 9 * 116:]
+    assert (writer.packets, writer.index) == (10, 3)
+
+
+def test_pcap_writer_rejects_text(tmp_path):
+    with pytest.raises(ValueError, match="Not a pcap stream"):
+        capture.PcapWriter(str(tmp_path / "dump.pcap")).write(b"tcpdump: eth9: No such device exists\n")
+
+
+def test_tcpdump_command_quotes_arguments():
+    command = capture.tcpdump_command(None, "host 10.0.0.1 and port 53", count=5, duration=30)
+
+    assert command == ("exec 3<&0; timeout 30 tcpdump -U -w - -s 262144 -c 5 -i \"$IFACE\" 'host 10.0.0.1 and port 53' "
+                       "& PID=$!; { cat <&3; kill $PID; } >/dev/null 2>&1 & wait $PID")
+
+
+def test_tcpdump_command_stops_once_input_is_closed():
+    # A tcpdump that never ends on its own, like one behind a quiet filter
+    script = "tcpdump() { while true; do sleep 0.1; done; }; " + capture.tcpdump_command("lo", None)
+    process = subprocess.Popen(["bash", "-c", script], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+    try:
+        with pytest.raises(subprocess.TimeoutExpired):
+            process.wait(0.5)
+        process.stdin.close()
+        assert process.wait(5) == 143
+    finally:
+        process.kill()
+
+
+def test_pcap_writer_rotates_on_time_without_packets(tmp_path):
+    writer = capture.PcapWriter(str(tmp_path / "dump.pcap"), rotate_seconds=0.05, files=2)
+    writer.write(pcap_stream(1))
+    stop = threading.Event()
+    thread = threading.Thread(target=writer.rotate_idle, args=(stop, 0.01))
+    thread.start()
+    try:
+        deadline = time.monotonic() + 5
+        while writer.index < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        stop.set()
+        thread.join()
+        writer.close()
+
+    assert writer.index >= 3
+    assert len(list(tmp_path.iterdir())) == 2
@@ -1,5 +1,9 @@
 ################################################### Python Import ##################################
 
+import json
+import os
+import stat
+
 ################################################### Project Import #################################
 
 from notoil.commands.network import ip_network
@@ -8,6 +12,14 @@ from tests.setup import runner
 
 ################################################### Main Declaration ###############################
 
+NETWORKS = """\
+# network tags
+10.0.0.0/8 corp
+10.1.0.0/16 k8s
+10.1.2.0/24 pods,eu
+2001:db8::/32 v6
+"""
+
 def test_ip_network_pass():
     result = runner.invoke(ip_network, ["19.205.73.132", "19.128.0.0/9"])
     assert "is present" in result.output
@@ -15,3 +27,73 @@ def test_ip_network_pass():
 def test_ip_network_fail():
     result = runner.invoke(ip_network, ["19.205.73.132", "19.128.0.0/10"])
     assert "is not present" in result.output
+
+def test_ip_network_match_longest_prefix(tmp_path):
+    networks = tmp_path / "networks.txt"
+    networks.write_text(NETWORKS)
+
+    result = runner.invoke(ip_network, ["match", str(networks)], input="10.1.2.3\n10.9.0.1\n2001:db8::1\n192.168.0.1\n")
+    lines = [json.loads(line) for line in result.output.splitlines()]
+
+    assert [line["matches"] for line in lines] == [
+        [{"network": "10.1.2.0/24", "tags": ["pods", "eu"]}],
+        [{"network": "10.0.0.0/8", "tags": ["corp"]}],
+        [{"network": "2001:db8::/32", "tags": ["v6"]}],
+        [],
+    ]
+
+def test_ip_network_match_all_csv(tmp_path):
+    networks = tmp_path / "networks.txt"
+    networks.write_text(NETWORKS)
+
+    result = runner.invoke(ip_network, ["match", str(networks), "--all", "--format", "csv"], input="10.1.2.3\nnot-an-ip\n")
+    assert "10.1.2.3,10.1.2.0/24,pods;eu\n10.1.2.3,10.1.0.0/16,k8s\n10.1.2.3,10.0.0.0/8,corp\n" in result.output
+    assert "Skipping invalid IP address: not-an-ip" in result.output
+
+def test_ip_network_index_build_and_match(tmp_path):
+    networks = tmp_path / "networks.txt"
+    networks.write_text(NETWORKS)
+    index = tmp_path / "networks.idx"
+
+    result = runner.invoke(ip_network, ["index", "build", str(networks), str(index)])
+    assert "Indexed 4 networks" in result.output
+
+    from_text = runner.invoke(ip_network, ["match", str(networks), "--all"], input="10.1.2.3\n10.9.0.1\n2001:db8::1\n1.1.1.1\n")
+    from_index = runner.invoke(ip_network, ["match", str(index), "--all"], input="10.1.2.3\n10.9.0.1\n2001:db8::1\n1.1.1.1\n")
+    assert from_index.exit_code == 0
+    assert from_index.output == from_text.output
+
+def test_ip_network_index_build_respects_umask(tmp_path):
+    networks = tmp_path / "networks.txt"
+    networks.write_text(NETWORKS)
+    index = tmp_path / "networks.idx"
+
+    previous = os.umask(0o022)
+    try:
+        result = runner.invoke(ip_network, ["index", "build", str(networks), str(index)])
+    finally:
+        os.umask(previous)
+    assert result.exit_code == 0
+    assert stat.S_IMODE(index.stat().st_mode) == 0o644
+
+def test_ip_network_match_rejects_truncated_index(tmp_path):
+    networks = tmp_path / "networks.txt"
+    networks.write_text("".join(f"10.{number}.0.0/16 net-{number}\n" for number in range(200)))
+    index = tmp_path / "networks.idx"
+    runner.invoke(ip_network, ["index", "build", str(networks), str(index)])
+    index.write_bytes(index.read_bytes()[:index.stat().st_size // 2])
+
+    result = runner.invoke(ip_network, ["match", str(index)], input="10.150.1.1\n")
+    assert result.exit_code != 0
+    assert "truncated or corrupt" in result.output
+
+def test_ip_network_audit():
+    rules = "10.0.0.0/8 sg-1\n10.1.0.0/16 sg-2\n10.0.0.0/8 sg-3\n192.168.0.0/25\n192.168.0.128/25\n"
+
+    result = runner.invoke(ip_network, ["audit", "--format", "json"], input=rules)
+    report = json.loads(result.output)
+
+    assert report["entries"] == 5
+    assert [(finding["line"], finding["duplicate_of"]) for finding in report["duplicates"]] == [(3, 1)]
+    assert [(finding["line"], finding["contained_in"]["line"]) for finding in report["shadowed"]] == [(2, 1)]
+    assert report["collapsed"] == ["10.0.0.0/8", "192.168.0.0/24"]
@@ -0,0 +1,81 @@
+################################################### Python Import ##################################
+
+import json
+import subprocess
+import sys
+
+import pytest
+
+################################################### Project Import #################################
+################################################### Main Declaration ###############################
+
+# Upper bound (in milliseconds) for importing the CLI and resolving a command in a fresh
+# interpreter. The budgets are deliberately generous so that slow CI machines pass, a
+# regression such as an eager kubernetes import in a lightweight command will still blow them.
+IMPORT_BUDGET_MS = {
+    ("get-totp",): 150,
+    ("ip-network",): 150,
+    ("k8s",): 150,
+    ("k8s", "mp"): 150,
+    ("k8s", "re"): 150,
+    ("k8s", "netmatrix"): 150,
+    ("k8s", "logs"): 150,
+}
+
+# Modules that must never be imported when resolving the given command
+FORBIDDEN_MODULES = {
+    ("get-totp",): ["kubernetes"],
+    ("ip-network",): ["kubernetes"],
+    ("k8s",): ["kubernetes"],
+    ("k8s", "mp"): ["kubernetes"],
+    ("k8s", "re"): ["kubernetes"],
+    ("k8s", "netmatrix"): ["kubernetes"],
+    ("k8s", "logs"): ["kubernetes"],
+}
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import click
+from notoil.__main__ import cli
+command = cli
+for name in sys.argv[1:]:
+    command = command.get_command(click.Context(command), name)
+elapsed = (time.perf_counter() - start) * 1000
+print(json.dumps({"elapsed_ms": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+
+def measure_import(path: tuple) -> dict:
+    """
+    Import the CLI and resolve a command path in a fresh interpreter
+
+    Args:
+        path (tuple): The command path, e.g. ("k8s", "mp")
+
+    Returns:
+        dict: The elapsed time in milliseconds and the loaded modules
+    """
+    output = subprocess.check_output([sys.executable, "-c", PROBE, *path])
+    return json.loads(output)
+
+
+@pytest.mark.parametrize("path", list(IMPORT_BUDGET_MS))
+def test_command_import_time(path):
+    """
+    Test that resolving each command stays within its import time budget
+    """
+    # Best of three runs, to filter out noise from a cold filesystem cache
+    elapsed = min(measure_import(path)["elapsed_ms"] for _ in range(3))
+    print(f"{' '.join(path)}: {elapsed:.1f}ms (budget {IMPORT_BUDGET_MS[path]}ms)")
+    assert elapsed < IMPORT_BUDGET_MS[path]
+
+
+@pytest.mark.parametrize("path", list(FORBIDDEN_MODULES))
+def test_command_does_not_import_heavy_modules(path):
+    """
+    Test that lightweight commands do not pull in heavy dependencies
+    """
+    modules = measure_import(path)["modules"]
+    for forbidden in FORBIDDEN_MODULES[path]:
+        assert forbidden not in modules
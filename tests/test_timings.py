@@ -0,0 +1,88 @@
+################################################### Python Import ##################################
+
+import json
+import pstats
+import threading
+
+################################################### Project Import #################################
+
+from notoil.__main__ import cli
+from notoil.utils import timings
+
+from tests.setup import runner
+
+################################################### Main Declaration ###############################
+
+def test_summarize_groups_spans_by_phase_and_name():
+    """
+    Test that phases are reported in order, the slowest groups first
+    """
+    spans = [
+        timings.Span("api", "list pods", 0, 0.5, received=100),
+        timings.Span("api", "get pods", 0, 0.1, status=404),
+        timings.Span("api", "list pods", 0, 0.1, received=50),
+        timings.Span("import", "kubernetes.client", 0, 0.3),
+        timings.Span("custom", "step", 0, 1),
+    ]
+
+    summary = timings.summarize(spans)
+    assert [(group["phase"], group["name"]) for group in summary] == [
+        ("import", "kubernetes.client"), ("api", "list pods"), ("api", "get pods"), ("custom", "step")]
+    assert summary[1]["count"] == 2
+    assert summary[1]["total"] == 0.6
+    assert summary[1]["p50"] == 0.1 and summary[1]["max"] == 0.5
+    assert summary[1]["received"] == 150
+    assert summary[2]["errors"] == 1
+
+
+def test_record_is_a_noop_until_enabled(monkeypatch):
+    """
+    Test that nothing is recorded without --trace-timings
+    """
+    monkeypatch.setattr(timings, "_spans", None)
+    with timings.span("api", "list pods"):
+        pass
+    assert not timings.enabled() and timings.spans() == []
+
+    timings.enable()
+    with timings.span("api", "list pods", "/api/v1/pods"):
+        pass
+    assert [(span.phase, span.name, span.detail) for span in timings.spans()] == [("api", "list pods", "/api/v1/pods")]
+
+
+def test_cli_reports_timings_and_profile(monkeypatch, tmp_path):
+    """
+    Test that the root options report the spans on stderr and write a cProfile dump
+    """
+    monkeypatch.setattr(timings, "_spans", None)
+    profile = tmp_path / "notoil.prof"
+
+    result = runner.invoke(cli, ["--trace-timings", "--timings-format", "json", "--profile", str(profile),
+                                 "get-totp", "JQ3GCDISNYQBSKTW"])
+    assert result.exit_code == 0
+
+    report = json.loads(result.stderr[result.stderr.index("{"):])
+    assert ("import", "notoil.commands.totp") in {(span["phase"], span["name"]) for span in report["spans"]}
+    assert report["wall_seconds"] > 0
+    assert pstats.Stats(str(profile)).total_calls > 0
+
+
+def test_profile_covers_threads(monkeypatch, tmp_path):
+    """
+    Test that threads started while profiling run and are part of the dump
+    """
+    monkeypatch.setattr(timings, "_profilers", [])
+    profile = tmp_path / "notoil.prof"
+    ran = []
+
+    def work():
+        ran.append(sum(range(1000)))
+
+    timings.start_profile()
+    thread = threading.Thread(target=work)
+    thread.start()
+    thread.join()
+    timings.dump_profile(str(profile))
+
+    assert ran
+    assert any(function == "work" for _, _, function in pstats.Stats(str(profile)).stats)
@@ -4,6 +4,7 @@ from pyotp import TOTP
 
 ################################################### Project Import #################################
 
+from notoil.commands import totp
 from notoil.commands.totp import get_totp
 
 from tests.setup import runner
@@ -15,4 +16,48 @@ def test_get_totp():
     Test the get_totp command
     """
     result = runner.invoke(get_totp, ["JQ3GCDISNYQBSKTW"])
-    assert TOTP("JQ3GCDISNYQBSKTW").now() in result.output
\ No newline at end of file
+    assert TOTP("JQ3GCDISNYQBSKTW").now() in result.output
+
+
+def test_get_totp_file(tmp_path):
+    """
+    Test generating the codes of every secret in a file
+    """
+    secrets = tmp_path / "secrets.txt"
+    secrets.write_text("# name secret\ngithub JQ3G CDIS NYQB SKTW\naws JBSWY3DPEHPK3PXP\n")
+
+    result = runner.invoke(get_totp, ["--file", str(secrets)])
+    assert f"github: {TOTP('JQ3GCDISNYQBSKTW').now()}" in result.output
+    assert f"aws: {TOTP('JBSWY3DPEHPK3PXP').now()}" in result.output
+
+
+def test_get_totp_watch_sleeps_until_step_boundary(monkeypatch):
+    """
+    Test that the watch mode wakes up only at step boundaries
+    """
+    clock = [1_000_000_007.5]
+    sleeps = []
+
+    def fake_sleep(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) == 2:
+            raise KeyboardInterrupt
+        clock[0] += seconds
+
+    monkeypatch.setattr(totp.time, "time", lambda: clock[0])
+    monkeypatch.setattr(totp.time, "sleep", fake_sleep)
+
+    result = runner.invoke(get_totp, ["JQ3GCDISNYQBSKTW", "--watch"])
+    assert sleeps == [12.5, 30]
+    assert result.output.splitlines()[:2] == [
+        TOTP("JQ3GCDISNYQBSKTW").at(1_000_000_007.5),
+        TOTP("JQ3GCDISNYQBSKTW").at(1_000_000_020),
+    ]
+
+
+def test_get_totp_requires_secret():
+    """
+    Test that either a secret or a file is required
+    """
+    result = runner.invoke(get_totp, [])
+    assert result.exit_code != 0